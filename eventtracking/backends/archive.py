@@ -0,0 +1,236 @@
+"""
+Compressed, block indexed archive of events.
+
+An archive is made of two files:
+
+* The data file, a sequence of independently zlib compressed blocks. Once decompressed, each block holds JSON encoded
+  events, one per line, like the files written by `LoggerBackend`.
+* The index file, named after the data file with an `.idx` suffix. It holds one JSON object per line describing a
+  block: its `offset` and `length` in the data file, the number of events it holds (`count`), the range of their
+  times as POSIX timestamps (`start` and `end`, null if any event of the block has no time) and the sorted list of
+  their `names`.
+
+`ArchiveBackend` writes archives and `ArchiveReader` reads them, only decompressing the blocks that can hold events
+matching the requested time range and names.
+"""
+
+from datetime import datetime, timezone
+import json
+import mmap
+import os
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from eventtracking.backends.file import BufferedFileBackend, write_all
+
+INDEX_SUFFIX = '.idx'
+BLOCK_SIZE = 256 * 1024  # 256 KB
+TIME_FIELD = 'timestamp'
+
+
+def event_time(value):
+    """
+    Return the POSIX timestamp of an event time, a datetime or an ISO formatted string, or None.
+
+    Naive times are UTC, like in `DateTimeJSONEncoder`.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+
+class ArchiveBackend(BufferedFileBackend):
+    """
+    Event tracker backend that writes events to a compressed, block indexed archive.
+
+    Events are buffered like in `BufferedFileBackend`, every batch of buffered events is written as one compressed
+    block, so `buffer_size` is the approximate uncompressed size of the blocks (256 KB by default). Blocks that are
+    written when `flush_interval` expires may be smaller. The archive is rotated like the file of a
+    `BufferedFileBackend`, along with its index.
+
+    Blocks are written under an exclusive `flock` of the data file, and their offset is the size of the file at that
+    time, so that the index stays correct if several processes append to the same archive. They should still use
+    distinct paths, with a `{pid}` placeholder, since they would rotate the archive independently.
+
+    `time_field` is the key holding the time of the events, "timestamp" by default.
+    `compression_level` is the zlib compression level, from 0 to 9.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('buffer_size', BLOCK_SIZE)
+        super().__init__(**kwargs)
+        self.time_field = kwargs.get('time_field', TIME_FIELD)
+        self.compression_level = kwargs.get('compression_level', zlib.Z_DEFAULT_COMPRESSION)
+        self.index_file = None
+
+    def buffer_item(self, event, line):
+        """Buffer the name and time of the event along with its line"""
+        return line, event.get('name'), event_time(event.get(self.time_field))
+
+    def write(self, items):
+        """Write the items as a compressed block, then describe it in the index"""
+        lines, names, times = zip(*items)
+        block = zlib.compress(b''.join(lines), self.compression_level)
+        timed = None not in times
+        entry = {
+            'offset': None,
+            'length': len(block),
+            'count': len(lines),
+            'start': min(times) if timed else None,
+            'end': max(times) if timed else None,
+            'names': sorted({name for name in names if isinstance(name, str)}),
+        }
+        fd = self.file.fileno()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # The file is opened for appending, the block lands at its end whatever the position of this process
+            entry['offset'] = os.fstat(fd).st_size
+            write_all(self.file, block)
+            write_all(self.index_file, (json.dumps(entry) + '\n').encode('utf-8'))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _open(self):
+        super()._open()
+        # pylint: disable=consider-using-with
+        self.index_file = open(self.path + INDEX_SUFFIX, 'ab', buffering=0)
+
+    def _close(self):
+        if self.fsync_interval is not None:
+            os.fsync(self.index_file.fileno())
+        self.index_file.close()
+        self.index_file = None
+        super()._close()
+
+    def _after_fork(self):
+        super()._after_fork()
+        self.index_file = None
+
+    def rename(self, rotated):
+        super().rename(rotated)
+        os.rename(self.path + INDEX_SUFFIX, rotated + INDEX_SUFFIX)
+
+    def rotated_files(self):
+        return [name for name in super().rotated_files() if not name.endswith(INDEX_SUFFIX)]
+
+    def remove(self, rotated):
+        super().remove(rotated)
+        try:
+            os.remove(rotated + INDEX_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+
+class ArchiveReader:
+    """
+    Read the events of an archive written by `ArchiveBackend`.
+
+    The data file is memory mapped and only the blocks that can hold the requested events are decompressed. Blocks
+    that are not described in the index, for example because the writer stopped between writing a block and its
+    index entry, are ignored.
+
+    `path` is the path of the data file.
+
+    Example::
+
+        with ArchiveReader('/var/log/tracking/tracking.arc') as reader:
+            for event in reader.events(start=datetime(2024, 5, 1, tzinfo=UTC), names={'problem_check'}):
+                backend.send(event)
+    """
+
+    def __init__(self, path, time_field=TIME_FIELD):
+        self.path = path
+        self.time_field = time_field
+        self.index = self._read_index()
+        with open(path, 'rb') as data_file:
+            size = os.fstat(data_file.fileno()).st_size
+            self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def _read_index(self):
+        """Return the entries of the index"""
+        entries = []
+        with open(self.path + INDEX_SUFFIX, encoding='utf-8') as index_file:
+            for line in index_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # An entry that was not completely written
+                    break
+        return entries
+
+    def close(self):
+        """Unmap the data file"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def blocks(self, start=None, end=None, names=None):
+        """
+        Return the index entries of the blocks that can hold events matching the filters.
+
+        `start` and `end` are datetimes bounding the time of the events, inclusively, naive ones are UTC. `names` is a
+        collection of event names.
+        """
+        start = event_time(start)
+        end = event_time(end)
+        names = set(names) if names is not None else None
+
+        matching = []
+        for entry in self.index:
+            if entry['start'] is not None:
+                if start is not None and entry['end'] < start:
+                    continue
+                if end is not None and entry['start'] > end:
+                    continue
+            if names is not None and names.isdisjoint(entry['names']):
+                continue
+            matching.append(entry)
+        return matching
+
+    def lines(self, start=None, end=None, names=None):
+        """Yield the encoded events of the blocks that can hold events matching the filters, see `blocks`"""
+        for entry in self.blocks(start, end, names):
+            block = zlib.decompress(self.data[entry['offset']:entry['offset'] + entry['length']])
+            for line in block.split(b'\n'):
+                if line:
+                    yield line.decode('utf-8')
+
+    def events(self, start=None, end=None, names=None):
+        """
+        Yield the decoded events matching the filters, see `blocks`.
+
+        Events without a time are only yielded when neither `start` nor `end` is provided.
+        """
+        start_time = event_time(start)
+        end_time = event_time(end)
+        for line in self.lines(start, end, names):
+            event = json.loads(line)
+            if names is not None and event.get('name') not in names:
+                continue
+            if start_time is not None or end_time is not None:
+                timestamp = event_time(event.get(self.time_field))
+                if timestamp is None:
+                    continue
+                if start_time is not None and timestamp < start_time:
+                    continue
+                if end_time is not None and timestamp > end_time:
+                    continue
+            yield event
@@ -0,0 +1,235 @@
+"""
+MongoDB event tracker backend driven by asyncio.
+
+`AsyncMongoBackend` never blocks the caller of `send`, which makes it suitable for ASGI services where the
+synchronous `MongoBackend` would block the event loop while inserting. It requires the native asyncio client of
+pymongo, `AsyncMongoClient`, available from pymongo 4.10.
+"""
+
+import asyncio
+from collections import deque
+import logging
+import threading
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.errors import BSONError
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import PyMongoError
+
+from eventtracking.backends.mongodb import INDEXES, INDEXES_IN_BACKGROUND, MAX_BUFFER_SIZE
+from eventtracking.instances import LiveInstances
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    AsyncMongoClient = None
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+CONCURRENCY = 8
+MAX_QUEUE_SIZE = 10000
+
+# The backends that are not closed yet
+BACKENDS = LiveInstances(after_fork='_reset', at_exit='close')
+
+
+class AsyncMongoBackend:  # pylint: disable=too-many-instance-attributes
+    """
+    Event tracker backend that inserts events in a MongoDB collection from an asyncio event loop.
+
+    `send` only encodes the event to BSON, appends it to a queue and returns, it can be called from any thread,
+    including from a coroutine running in another event loop. A daemon thread, started when the first event is sent
+    and again in forked child processes, runs an event loop with `concurrency` workers. Each worker takes up to
+    `batch_size` queued events and inserts them with an unordered `insert_many` call, so that up to `concurrency`
+    inserts are in flight at once over the connection pool of the client. Since the events are encoded when they are
+    sent, the queue does not share them with the other backends and an event that cannot be encoded is reported on
+    its own. Events sent while `max_queue_size` events, or `max_queue_bytes` bytes, are queued are dropped and
+    counted in `dropped_events`.
+
+    The connection options are the same as the ones of `MongoBackend`. The missing indexes of the collection are
+    created from the event loop when it starts, unless `create_indexes` is None. The queued events are inserted when
+    the process exits, or when `close` is called.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Configure the connection to a MongoDB.
+
+        :Parameters:
+
+          - `host`: hostname
+          - `port`: port
+          - `user`: collection username
+          - `password`: collection user password
+          - `database`: name of the database
+          - `collection`: name of the collection
+          - `extra`: parameters to pymongo.AsyncMongoClient not listed above
+          - `batch_size`: maximum number of events inserted at once
+          - `concurrency`: maximum number of inserts in flight
+          - `max_queue_size`: maximum number of events waiting to be inserted
+          - `max_queue_bytes`: maximum size of the events waiting to be inserted
+          - `create_indexes`: "background" to create the missing indexes when
+            the event loop starts, the default, or None
+
+        """
+        if AsyncMongoClient is None:
+            raise ValueError('AsyncMongoBackend requires pymongo 4.10 or later')
+
+        extra = dict(kwargs.get('extra', {}))
+        extra['w'] = extra.get('w', 0)
+        extra['tz_aware'] = extra.get('tz_aware', True)
+        if kwargs.get('user'):
+            extra['username'] = kwargs['user']
+            extra['password'] = kwargs.get('password', '')
+        self.codec_options = CodecOptions(tz_aware=extra['tz_aware'], type_registry=extra.get('type_registry'))
+        self.client_options = dict(extra, host=kwargs.get('host', 'localhost'), port=kwargs.get('port', 27017))
+        self.names = (kwargs.get('database', 'eventtracking'), kwargs.get('collection', 'events'))
+
+        self.batch_size = kwargs.get('batch_size', BATCH_SIZE)
+        self.concurrency = kwargs.get('concurrency', CONCURRENCY)
+        self.max_queue_size = kwargs.get('max_queue_size', MAX_QUEUE_SIZE)
+        self.max_queue_bytes = kwargs.get('max_queue_bytes', MAX_BUFFER_SIZE)
+        self.create_indexes = kwargs.get('create_indexes', INDEXES_IN_BACKGROUND)
+        if self.create_indexes not in (INDEXES_IN_BACKGROUND, None):
+            raise ValueError(f'Unknown value for create_indexes "{self.create_indexes}"')
+
+        self.dropped_events = 0
+        self._reset()
+        self.closed = False
+        BACKENDS.add(self)
+
+    def _reset(self):
+        """Start with an empty queue and no event loop, also used in forked child processes"""
+        self.events = deque()
+        self.queued_bytes = 0
+        self.pending = 0
+        self.sleeping = False
+        self.condition = threading.Condition()
+        self.loop = None
+        self.wakeup = None
+        self.thread = None
+
+    def send(self, event):
+        """Encode the event and queue it to be inserted from the event loop"""
+        try:
+            document = RawBSONDocument(bson.encode(event, codec_options=self.codec_options))
+        except BSONError:
+            log.exception('Error encoding event for MongoDB event tracker backend')
+            return
+
+        size = len(document.raw)
+        with self.condition:
+            if (
+                self.closed or len(self.events) >= self.max_queue_size
+                or self.queued_bytes + size > self.max_queue_bytes
+            ):
+                self.dropped_events += 1
+                return
+            self.events.append(document)
+            self.queued_bytes += size
+            self.pending += 1
+            if self.loop is None:
+                self._start()
+                return
+            if not self.sleeping:
+                # The workers take the event when they are done with their current inserts
+                return
+            self.sleeping = False
+            loop = self.loop
+        loop.call_soon_threadsafe(self._wake)
+
+    def _start(self):
+        """Start the thread running the event loop. Requires the condition."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='eventtracking-async-mongo', daemon=True)
+        self.thread.start()
+
+    def _wake(self):
+        """Wake up the idle workers, from the event loop"""
+        wakeup, self.wakeup = self.wakeup, asyncio.Event()
+        if wakeup is not None:
+            wakeup.set()
+
+    def _run(self):
+        """Run the event loop until the backend is closed"""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        """Insert the queued events with `concurrency` workers sharing a client"""
+        self.wakeup = asyncio.Event()
+        client = AsyncMongoClient(**self.client_options)
+        collection = client[self.names[0]][self.names[1]]
+        tasks = []
+        try:
+            if self.create_indexes == INDEXES_IN_BACKGROUND:
+                tasks.append(asyncio.ensure_future(self._ensure_indexes_safely(collection)))
+            await asyncio.gather(*(self._work(collection) for _ in range(self.concurrency)))
+            await asyncio.gather(*tasks)
+        finally:
+            await client.close()
+
+    async def _work(self, collection):
+        """Insert batches of queued events until the backend is closed and the queue is empty"""
+        while True:
+            with self.condition:
+                batch = [self.events.popleft() for _ in range(min(self.batch_size, len(self.events)))]
+                self.queued_bytes -= sum(len(document.raw) for document in batch)
+                if not batch:
+                    if self.closed:
+                        return
+                    self.sleeping = True
+            if not batch:
+                await self.wakeup.wait()
+                continue
+
+            try:
+                await collection.insert_many(batch, ordered=False)
+            except (PyMongoError, BSONError):
+                log.exception('Error inserting %d events to MongoDB event tracker backend', len(batch))
+            with self.condition:
+                self.pending -= len(batch)
+                if not self.pending:
+                    self.condition.notify_all()
+
+    async def ensure_indexes(self, collection):
+        """Create the indexes of the collection that do not exist yet, returning their names"""
+        information = await collection.index_information()
+        existing = [list(index['key']) for index in information.values()]
+        return [await collection.create_index(keys) for keys in INDEXES if keys not in existing]
+
+    async def _ensure_indexes_safely(self, collection):
+        """Create the missing indexes, logging errors"""
+        try:
+            created = await self.ensure_indexes(collection)
+        except PyMongoError:
+            log.exception('Error creating the indexes of the MongoDB event tracker backend')
+            return
+        if created:
+            log.info('Created the indexes %s of the MongoDB event tracker backend', created)
+
+    def flush(self, timeout=None):
+        """Wait until the queued events are inserted. Returns False if they were not inserted within `timeout`."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout)
+
+    def close(self):
+        """Insert the queued events and stop the event loop. Events sent afterwards are dropped."""
+        with self.condition:
+            self.closed = True
+            loop, thread = self.loop, self.thread
+        BACKENDS.discard(self)
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The event loop is already closed
+            return
+        if thread is not threading.current_thread():
+            thread.join()
@@ -2,15 +2,45 @@
 Route events to processors and backends.
 """
 import logging
+import threading
+import time
 
 from eventtracking.backends.routing import RoutingBackend
-from eventtracking.tasks import send_event
 from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.spool import SpoolDrainer
 
 logger = logging.getLogger(__name__)
 
+# Size (in bytes) of the serialized events above which the payload is saved to the blob store
+CLAIM_CHECK_THRESHOLD = 16 * 1024  # 16 KB
+# Number of seconds to wait for the broker to accept a task when a spool is configured
+ENQUEUE_TIMEOUT = 1.0
+# Number of seconds during which tasks are spooled without contacting the broker after it failed
+SPOOL_COOLDOWN = 10.0
 
-class AsyncRoutingBackend(RoutingBackend):
+
+def __getattr__(name):
+    """Import the `send_event` task when it is first used, see `import_send_event`"""
+    if name != 'send_event':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return import_send_event()
+
+
+def import_send_event():
+    """
+    Return the `send_event` Celery task, importing it when it is first needed.
+
+    Importing Celery is slow, it is only imported once an `AsyncRoutingBackend` is constructed, which also
+    registers the task in the workers. The task is looked up in the module so that it can be patched.
+    """
+    task = globals().get('send_event')
+    if task is None:
+        from eventtracking.tasks import send_event  # pylint: disable=import-outside-toplevel
+        task = globals()['send_event'] = send_event
+    return task
+
+
+class AsyncRoutingBackend(RoutingBackend):  # pylint: disable=too-many-instance-attributes
     """
     Route events to configured backends asynchronously.
 
@@ -21,9 +51,50 @@ class AsyncRoutingBackend(RoutingBackend):
     since the Celery task has to look up the backend again by name.
     This backend can also only be used from the default tracker, since
     again the Celery task does not know which other tracker to use.
+
+    `dead_letter_store` is an optional store (see `eventtracking.dead_letter`)
+        that receives the events that could still not be delivered once the
+        Celery task has exhausted its retries.
+    `blob_store` is an optional store (see `eventtracking.blob_store`). Events
+        whose serialized size exceeds `claim_check_threshold` bytes are saved
+        to it and only a reference to the payload is sent through the broker.
+    `spool` is an optional spool (see `eventtracking.spool`). When it is
+        configured, a task that cannot be enqueued, typically because the
+        broker is unreachable, is appended to the spool instead of raising in
+        the caller. A background thread re-enqueues the spooled tasks in
+        batches every `spool_drain_interval` seconds once the broker is back.
+        A single attempt is made at connecting to the broker (bounded by the
+        Celery `broker_connection_timeout` setting), and publishing is not
+        retried and times out after `enqueue_timeout` seconds. After a
+        failure, tasks are spooled directly for `spool_cooldown` seconds.
+        Then a single request probes the broker again, the others keep
+        spooling their tasks until it succeeds, so that at most one request
+        at a time pays for the timeout while the broker is down.
     """
-    def __init__(self, processors=None, backends=None, backend_name=''):
+    def __init__(  # pylint: disable=too-many-arguments
+        self, processors=None, backends=None, backend_name='', *, dead_letter_store=None, blob_store=None,
+        claim_check_threshold=CLAIM_CHECK_THRESHOLD, spool=None, enqueue_timeout=ENQUEUE_TIMEOUT,
+        spool_cooldown=SPOOL_COOLDOWN, spool_drain_interval=5.0, spool_batch_size=100,
+    ):
         self.backend_name = backend_name
+        # Registers the task in the Celery workers
+        import_send_event()
+        self.dead_letter_store = dead_letter_store
+        self.blob_store = blob_store
+        self.claim_check_threshold = claim_check_threshold
+        self.spool = spool
+        self.enqueue_timeout = enqueue_timeout
+        self.spool_cooldown = spool_cooldown
+        self.broker_unavailable_until = 0
+        self.probe_lock = threading.Lock()
+        self.spool_drainer = None
+        if self.spool is not None:
+            self.spool_drainer = SpoolDrainer(
+                self.spool,
+                self.enqueue_spooled,
+                interval=spool_drain_interval,
+                batch_size=spool_batch_size,
+            )
         super().__init__(processors=processors, backends=backends)
 
     def send(self, event):
@@ -40,5 +111,82 @@ class AsyncRoutingBackend(RoutingBackend):
         except EventEmissionExit:
             logger.info('[EventEmissionExit] skipping event {}'.format(event['name']))
             return
-        send_event.delay(self.backend_name, processed_event)
+
+        # The task is serialized, the lazy context values are computed in this process
+        self.resolve_lazy_values(processed_event)
+
+        if self.blob_store is not None:
+            # Encoded like the Celery task, so that the datetimes of the event are restored by the worker
+            from kombu.utils.json import dumps  # pylint: disable=import-outside-toplevel
+            payload = dumps(processed_event).encode('utf-8')
+            if len(payload) > self.claim_check_threshold:
+                claim_check = self.blob_store.put(payload)
+                self.enqueue((self.backend_name, {'name': processed_event['name']}), {'claim_check': claim_check})
+                logger.info('Scheduled celery task for event "{}" with claim check {}'.format(
+                    event['name'], claim_check
+                ))
+                return
+
+        self.enqueue((self.backend_name, processed_event), {})
         logger.info('Scheduled celery task for event "{}" processing and routing'.format(event['name']))
+
+    def send_batch(self, events):
+        """Schedule a task for each event, like `send`"""
+        for event in events:
+            self.send(event)
+
+    def enqueue(self, args, kwargs):
+        """
+        Enqueue the `send_event` task, or append it to the spool if the broker is unavailable.
+        """
+        if self.spool is None:
+            import_send_event().delay(*args, **kwargs)
+            return
+
+        with self.probe_lock:
+            now = time.monotonic()
+            unavailable = now < self.broker_unavailable_until
+            if not unavailable and self.broker_unavailable_until:
+                # This request probes the broker, the cooldown is extended for the others in the meantime
+                self.broker_unavailable_until = now + self.spool_cooldown
+        if unavailable:
+            self.spool_task(args, kwargs)
+            return
+
+        task = import_send_event()
+        try:
+            with task.app.producer_or_acquire() as producer:
+                self.publish(task, producer, args, kwargs)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception('Failed to enqueue event "{}", spooling it'.format(args[1]['name']))
+            self.broker_unavailable_until = time.monotonic() + self.spool_cooldown
+            self.spool_task(args, kwargs)
+            return
+        self.broker_unavailable_until = 0
+
+    def publish(self, task, producer, args, kwargs):
+        """
+        Publish the `send_event` task with `producer`, making a single attempt at connecting to the broker.
+
+        Celery would otherwise retry connecting for several seconds before failing, even though publishing is not
+        retried.
+        """
+        producer.connection.ensure_connection(max_retries=0, timeout=self.enqueue_timeout)
+        task.apply_async(args, kwargs, producer=producer, retry=False, timeout=self.enqueue_timeout)
+
+    def spool_task(self, args, kwargs):
+        """
+        Append the `send_event` task to the spool and make sure it will be drained.
+        """
+        self.spool.append({'args': list(args), 'kwargs': kwargs})
+        self.spool_drainer.notify()
+
+    def enqueue_spooled(self, records):
+        """
+        Enqueue a batch of spooled `send_event` tasks over a single broker connection.
+        """
+        task = import_send_event()
+        with task.app.producer_or_acquire() as producer:
+            for record in records:
+                self.publish(task, producer, record['args'], record['kwargs'])
+        self.broker_unavailable_until = 0
@@ -1,27 +1,135 @@
 """Event tracker backend that emits events to the event-bus."""
 
-import json
+import fnmatch
 import logging
+import re
 from datetime import datetime
+from functools import lru_cache
+from importlib import import_module
 
 from django.conf import settings
-from openedx_events.analytics.data import TrackingLogData
-from openedx_events.analytics.signals import TRACKING_EVENT_EMITTED
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
-from eventtracking.backends.logger import DateTimeJSONEncoder
+from eventtracking.backends.logger import DEFAULT_SERIALIZER, encode_event, get_serializer
 from eventtracking.backends.routing import RoutingBackend
-from eventtracking.config import SEND_TRACKING_EVENT_EMITTED_SIGNAL
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of names whose match against the prefixes and wildcards of `EventNameMatcher` is cached
+MAX_CACHED_NAMES = 4096
+WILDCARD_CHARACTERS = frozenset('*?[')
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+# Names of this module imported from the module they are mapped to when they are first used, since importing
+# openedx_events and edx_toggles takes longer than importing eventtracking
+LAZY_IMPORTS = {
+    "TrackingLogData": "openedx_events.analytics.data",
+    "TRACKING_EVENT_EMITTED": "openedx_events.analytics.signals",
+    "SEND_TRACKING_EVENT_EMITTED_SIGNAL": "eventtracking.config",
+}
+
+
+def __getattr__(name):
+    """Import the names of `LAZY_IMPORTS` when they are first used"""
+    module_name = LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = getattr(import_module(module_name), name)
+    return value
+
+
+def lazy_import(name):
+    """Return the value of a name of `LAZY_IMPORTS`, which can be patched like the other names of the module"""
+    try:
+        return globals()[name]
+    except KeyError:
+        return __getattr__(name)
+
+
+class EventNameMatcher:
+    """
+    Set of event names compiled from a list of names and patterns.
+
+    Patterns use the shell-style wildcards of `fnmatch`. Names without wildcards are looked up in a frozenset,
+    patterns that only end with a `*` are matched as prefixes and the other patterns with a single compiled regular
+    expression. Whether a name matches the prefixes and patterns is cached, so checking whether a name is
+    in the set costs a hash lookup once the name was seen.
+    """
+
+    def __init__(self, patterns):
+        names, prefixes, wildcards = set(), [], []
+        for pattern in patterns:
+            if WILDCARD_CHARACTERS.isdisjoint(pattern):
+                names.add(pattern)
+            elif pattern.endswith('*') and WILDCARD_CHARACTERS.isdisjoint(pattern[:-1]):
+                prefixes.append(pattern[:-1])
+            else:
+                wildcards.append(fnmatch.translate(pattern))
+        self.names = frozenset(names)
+        self.prefixes = tuple(prefixes)
+        self.regex = re.compile('|'.join(wildcards)) if wildcards else None
+        self.matches = {}
+
+    def __contains__(self, name):
+        if name in self.names:
+            return True
+        if not self.prefixes and self.regex is None:
+            return False
+        matched = self.matches.get(name)
+        if matched is None:
+            matched = self.match(name)
+            if len(self.matches) >= MAX_CACHED_NAMES:
+                self.matches.clear()
+            self.matches[name] = matched
+        return matched
+
+    def match(self, name):
+        """Whether the name matches one of the prefixes or wildcard patterns"""
+        if not isinstance(name, str):
+            return False
+        if name.startswith(self.prefixes):
+            return True
+        return self.regex is not None and self.regex.match(name) is not None
+
+
+def parse_timestamp(value):
+    """Parse the ISO 8601 timestamp of an event, falling back to `TIMESTAMP_FORMAT`"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+@lru_cache(maxsize=None)
+def allowed_event_names():
+    """Return the `EventNameMatcher` of the `EVENT_BUS_TRACKING_LOGS` setting"""
+    return EventNameMatcher(getattr(settings, "EVENT_BUS_TRACKING_LOGS", []))
+
+
+@receiver(setting_changed)
+def reset_allowed_event_names(setting, **kwargs):
+    """Compile the allowed event names again when the setting changes"""
+    if setting == "EVENT_BUS_TRACKING_LOGS":
+        allowed_event_names.cache_clear()
+
 
 class EventBusRoutingBackend(RoutingBackend):
     """
     Event tracker backend for the event bus.
+
+    Only the events whose name is listed in the `EVENT_BUS_TRACKING_LOGS` setting are sent. It can hold exact names
+    and shell-style patterns like `edx.course.enrollment.*`, see `EventNameMatcher`.
+
+    The `data` and `context` of the events are encoded by `serializer`, the name of a serializer registered with
+    `eventtracking.backends.logger.register_serializer`, "json" by default. The schema of `TrackingLogData` holds
+    them as two separate JSON strings.
     """
 
-    def __init__(self, processors=None, backends=None, backend_name=''):
+    def __init__(self, processors=None, backends=None, backend_name='', serializer=DEFAULT_SERIALIZER):
         self.backend_name = backend_name
+        get_serializer(serializer)
+        self.serializer = serializer
         super().__init__(processors=processors, backends=backends)
 
     def send(self, event):
@@ -29,28 +137,34 @@ class EventBusRoutingBackend(RoutingBackend):
         Send the tracking log event to the event bus by emitting the
         TRACKING_EVENT_EMITTED signal using custom metadata.
         """
-        if not SEND_TRACKING_EVENT_EMITTED_SIGNAL.is_enabled():
+        if not lazy_import("SEND_TRACKING_EVENT_EMITTED_SIGNAL").is_enabled():
             return
 
         name = event.get("name")
 
-        if name not in getattr(settings, "EVENT_BUS_TRACKING_LOGS", []):
+        if name not in allowed_event_names():
             return
 
-        data = json.dumps(event.get("data"), cls=DateTimeJSONEncoder)
-        context = json.dumps(event.get("context"), cls=DateTimeJSONEncoder)
+        self.resolve_lazy_values(event)
+        data = encode_event(event, "data", self.serializer)
+        context = encode_event(event, "context", self.serializer)
 
         timestamp = event.get("timestamp")
 
         if isinstance(timestamp, str):
-            timestamp = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%f%z")
+            timestamp = parse_timestamp(timestamp)
 
-        tracking_log = TrackingLogData(
+        tracking_log = lazy_import("TrackingLogData")(
             name=event.get("name"),
             timestamp=timestamp,
             data=data,
             context=context,
         )
-        TRACKING_EVENT_EMITTED.send_event(tracking_log=tracking_log)
+        lazy_import("TRACKING_EVENT_EMITTED").send_event(tracking_log=tracking_log)
 
         logger.info(f"Tracking log {tracking_log.name} emitted to the event bus.")
+
+    def send_batch(self, events):
+        """Send the events one at a time, each one is a separate tracking log on the event bus"""
+        for event in events:
+            self.send(event)
@@ -0,0 +1,193 @@
+"""
+Event tracker backend that appends events to a local file from a background thread.
+
+Events are written in the format of a `LoggerBackend` whose handler only outputs the message: one JSON encoded event
+per line.
+"""
+
+import glob
+import os
+import threading
+import time
+
+from eventtracking.backends.logger import DEFAULT_SERIALIZER, MAX_EVENT_SIZE, encode_event, get_serializer
+from eventtracking.batching import Batcher
+from eventtracking.instances import LiveInstances
+
+BUFFER_SIZE = 64 * 1024  # 64 KB
+MAX_BUFFER_SIZE = 16 * 1024 * 1024  # 16 MB
+FLUSH_INTERVAL = 1.0
+ROTATED_SUFFIX_FORMAT = '%Y%m%d-%H%M%S'
+# Replaced by the id of the process in the `path` of the backends
+PID_PLACEHOLDER = '{pid}'
+
+# The backends that are not closed yet, their batcher writes the buffered events when the process exits
+BACKENDS = LiveInstances(after_fork='_after_fork')
+
+
+def write_all(file, data):
+    """Write all of `data` to an unbuffered file, whose `write` may write only part of it"""
+    view = memoryview(data)
+    while view:
+        view = view[file.write(view):]
+
+
+class BufferedFileBackend:  # pylint: disable=too-many-instance-attributes
+    """
+    Event tracker backend that buffers encoded events in memory and appends them to a file in batches.
+
+    Sending an event only encodes it and appends it to the buffer. A background thread (see
+    `eventtracking.batching.Batcher`) writes the buffer to the file in a single `write` call once it holds
+    `buffer_size` bytes, or once its oldest event was sent `flush_interval` seconds ago. Events that are
+    sent while `max_buffer_size` bytes are waiting to be written are dropped, as are events longer than
+    `max_event_size` characters. Dropped events are counted in `dropped_events`.
+
+    The file can be rotated once it reaches `rotate_bytes` bytes and/or every `rotate_interval` seconds. It is then
+    renamed with a suffix holding the time of the rotation and a new file is started. Only the `backup_count` most
+    recent rotated files are kept if it is provided.
+
+    Writes are followed by an `fsync` at most every `fsync_interval` seconds, so that a batch of events is synced at
+    once. Files are never synced explicitly if it is None, the default, and after every write if it is 0.
+
+    Each process must write to its own file, since the processes would otherwise rotate the file independently. A
+    `{pid}` placeholder in `path` is replaced by the id of the current process, including in forked child processes,
+    which makes the path of the workers of a preforking server distinct.
+
+    The buffer is written when the process exits, or when `close` is called.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Event tracker backend that appends events to a local file.
+
+        `path` is the path of the file, its directory must exist. It may hold a `{pid}` placeholder.
+        `serializer` is the name of the serializer used to encode events
+            (see `eventtracking.backends.logger.register_serializer`), defaults to "json".
+        """
+        self.path_format = kwargs.get('path')
+        if not self.path_format:
+            raise ValueError('BufferedFileBackend requires a "path"')
+        self.serializer = kwargs.get('serializer', DEFAULT_SERIALIZER)
+        get_serializer(self.serializer)
+        self.max_event_size = kwargs.get('max_event_size', MAX_EVENT_SIZE)
+        self.rotate_bytes = kwargs.get('rotate_bytes')
+        self.rotate_interval = kwargs.get('rotate_interval')
+        self.backup_count = kwargs.get('backup_count')
+        self.fsync_interval = kwargs.get('fsync_interval')
+
+        self.batcher = Batcher(
+            self.write_batch,
+            max_bytes=kwargs.get('buffer_size', BUFFER_SIZE),
+            max_age=kwargs.get('flush_interval', FLUSH_INTERVAL),
+            max_buffer_bytes=kwargs.get('max_buffer_size', MAX_BUFFER_SIZE),
+            name='eventtracking-file-writer',
+        )
+        self.dropped_events = 0
+        self.write_lock = threading.Lock()
+        self.file = None
+        self.opened_at = 0
+        self.synced_at = 0
+        BACKENDS.add(self)
+
+    @property
+    def path(self):
+        """The path of the file written by the current process"""
+        return self.path_format.replace(PID_PLACEHOLDER, str(os.getpid()))
+
+    def send(self, event):
+        """Append the event to the buffer"""
+        line = self.encode(event)
+        if line is None or not self.batcher.add(self.buffer_item(event, line), len(line)):
+            self.dropped_events += 1
+
+    def encode(self, event):
+        """Return the line written for the event as bytes, or None if the event should be dropped"""
+        event_str = encode_event(event, serializer=self.serializer, limit=self.max_event_size)
+        if event_str is None:
+            return None
+        return (event_str + '\n').encode('utf-8')
+
+    def buffer_item(self, event, line):  # pylint: disable=unused-argument
+        """Return what is buffered for the event until it is written by `write`"""
+        return line
+
+    def _after_fork(self):
+        """Forget the file opened by the parent process, the child opens its own"""
+        self.write_lock = threading.Lock()
+        self.file = None
+
+    def flush(self):
+        """Write the buffered events to the file"""
+        self.batcher.flush()
+
+    def write_batch(self, items):
+        """Write a batch of buffered items to the file, syncing and rotating it as configured"""
+        with self.write_lock:
+            if self.file is None:
+                self._open()
+            self.write(items)
+            now = time.time()
+            if self.fsync_interval is not None and now - self.synced_at >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.synced_at = now
+            if self._should_rotate(now):
+                self._rotate()
+
+    def write(self, items):
+        """Write a batch of buffered items to the file. Requires the write lock."""
+        write_all(self.file, b''.join(items))
+
+    def _open(self):
+        """Open the file for appending. Requires the write lock."""
+        # Unbuffered, every batch is written with a single system call unless the write is short
+        self.file = open(self.path, 'ab', buffering=0)  # pylint: disable=consider-using-with
+        self.opened_at = time.time()
+
+    def _should_rotate(self, now):
+        """Whether the file is due for rotation. Requires the write lock."""
+        if self.rotate_bytes is not None and self.file.tell() >= self.rotate_bytes:
+            return True
+        return self.rotate_interval is not None and now - self.opened_at >= self.rotate_interval
+
+    def _rotate(self):
+        """Rename the current file and remove the oldest rotated files. Requires the write lock."""
+        self._close()
+
+        rotated = f'{self.path}.{time.strftime(ROTATED_SUFFIX_FORMAT)}'
+        candidate, index = rotated, 0
+        while os.path.exists(candidate):
+            index += 1
+            candidate = f'{rotated}.{index}'
+        self.rename(candidate)
+
+        if self.backup_count is not None:
+            backups = self.rotated_files()
+            for backup in backups[:max(len(backups) - self.backup_count, 0)]:
+                self.remove(backup)
+
+    def _close(self):
+        """Sync the file if required and close it. Requires the write lock."""
+        if self.fsync_interval is not None:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+    def rename(self, rotated):
+        """Rename the current file to `rotated`"""
+        os.rename(self.path, rotated)
+
+    def rotated_files(self):
+        """Return the paths of the rotated files, oldest first"""
+        return sorted(glob.glob(glob.escape(self.path) + '.[0-9]*'))
+
+    def remove(self, rotated):
+        """Remove a rotated file"""
+        os.remove(rotated)
+
+    def close(self):
+        """Write the remaining buffered events, stop the writer thread and close the file"""
+        self.batcher.close()
+        BACKENDS.discard(self)
+        with self.write_lock:
+            if self.file is not None:
+                self._close()
@@ -1,21 +1,84 @@
-"""Event tracker backend that saves events to a python logger."""
+"""
+Event tracker backend that saves events to a python logger.
 
+This module also holds the JSON serializers used by the backends. A serializer is a callable that returns the JSON
+encoding of an object as a string, encoding `datetime.datetime` objects in ISO format converted to UTC and
+`datetime.date` objects in ISO format. The following serializers are registered:
 
+* `json` - The standard library encoder, the default.
+* `orjson` - The native `orjson` encoder, only registered when `orjson` is installed. Its output is equivalent to the
+  `json` serializer once parsed, but it is compact (no whitespace after separators) and does not escape non-ASCII
+  characters, so it is not byte-identical. Like `orjson`, it also rejects integers that do not fit in 64 bits and
+  encodes NaN and infinite floats as `null`.
+* `fast` - `orjson` if it is installed, `json` otherwise.
+
+Additional serializers can be registered with `register_serializer`.
+"""
+
+
+from collections import Counter
+from copy import deepcopy
 from datetime import datetime
 from datetime import date
 import logging
+from logging.handlers import QueueListener
 import json
+import queue
+import threading
 
 from pytz import UTC
 
+from eventtracking.instances import LiveInstances
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)
+
 MAX_EVENT_SIZE = 1024  # 1 KB
+QUEUE_SIZE = 10000
+DEFAULT_SERIALIZER = 'json'
+SERIALIZERS = {}
+
+# Strategies for events larger than `max_event_size`
+DROP = 'drop'
+TRUNCATE = 'truncate'
+SPILL = 'spill'
+STUB = 'stub'
+OVERSIZE_STRATEGIES = (DROP, TRUNCATE, SPILL, STUB)
 
+# The backends in queue mode that are not closed yet
+QUEUED_BACKENDS = LiveInstances(after_fork='_after_fork', at_exit='close')
 
-class LoggerBackend:
+
+class LoggerBackend:  # pylint: disable=too-many-instance-attributes
     """
     Event tracker backend that uses a python logger.
 
     Events are logged to the INFO level as JSON strings.
+
+    Events whose encoding is longer than `max_event_size` characters are handled according to `oversize_strategy`:
+
+    * `drop` - The event is not logged, the default.
+    * `truncate` - The largest fields of the event `data` are removed until the event fits, their names are listed
+      in the `truncated_fields` key of the logged event.
+    * `spill` - The complete event is appended to the `spill_file` and a stub of the event is logged instead. The
+      stub has an empty `data` and an `oversized` key that references the location of the event in the file.
+    * `stub` - A stub of the event is logged instead. If a `blob_store` (see `eventtracking.blob_store`) is
+      provided the complete event is saved to it and the stub references it.
+
+    An event is dropped if it still cannot be made to fit. Most oversized events are detected before being encoded
+    (see `minimum_encoded_size`), so the cost of encoding them is not paid when they are dropped. The number of
+    events handled by each strategy is counted in `oversized_events`.
+
+    When `queue` is true events are logged from a background thread: `send` only puts the encoded event on a queue
+    of `queue_size` items, and a `LoggerQueueListener` logs it, so the handlers of the logger do not run on the
+    thread that sends the event. If `defer_encoding` is also true the event itself is put on the queue and it is
+    encoded by the listener thread, which requires that the event is not modified once it is sent, as expected from
+    backends. Events sent while the queue is full are dropped and counted in `dropped_events`. The remaining events
+    are logged when the process exits, or when `close` is called.
     """
 
     def __init__(self, **kwargs):
@@ -24,22 +87,208 @@ class LoggerBackend:
 
         `name` is an identifier for the logger, which should have
             been configured using the default python mechanisms.
+        `serializer` is the name of the serializer used to encode events
+            (see `register_serializer`), defaults to "json".
         """
         name = kwargs.get('name', None)
         self.max_event_size = kwargs.get('max_event_size', MAX_EVENT_SIZE)
+        self.serializer = kwargs.get('serializer', DEFAULT_SERIALIZER)
+        get_serializer(self.serializer)
+        self.oversize_strategy = kwargs.get('oversize_strategy', DROP)
+        if self.oversize_strategy not in OVERSIZE_STRATEGIES:
+            raise ValueError(f'Unknown oversize strategy "{self.oversize_strategy}"')
+        self.spill_file = kwargs.get('spill_file')
+        if self.oversize_strategy == SPILL and not self.spill_file:
+            raise ValueError('The "spill" oversize strategy requires a "spill_file"')
+        self.spill_lock = threading.Lock()
+        self.blob_store = kwargs.get('blob_store')
+        self.oversized_events = Counter()
         self.event_logger = logging.getLogger(name)
         level = kwargs.get('level', 'info')
         self.log = getattr(self.event_logger, level.lower())
 
+        self.queue = None
+        self.listener = None
+        self.defer_encoding = kwargs.get('defer_encoding', False)
+        self.dropped_events = 0
+        if kwargs.get('queue', False):
+            self.queue_size = kwargs.get('queue_size', QUEUE_SIZE)
+            self.listener_lock = threading.Lock()
+            self.queue = queue.Queue(self.queue_size)
+            QUEUED_BACKENDS.add(self)
+
     def send(self, event):
         """Send the event to the standard python logger"""
-        event_str = json.dumps(event, cls=DateTimeJSONEncoder)
+        if self.queue is None:
+            self.log_event(event)
+            return
+
+        if not self.defer_encoding:
+            event = self.encode(event)
+            if event is None:
+                return
 
-        # TODO: do something smarter than simply dropping the event on
-        # the floor.
-        if self.max_event_size is None or len(event_str) <= self.max_event_size:
+        if self.listener is None:
+            self._start_listener()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped_events += 1
+
+    def log_event(self, event):
+        """Encode the event and log it"""
+        event_str = self.encode(event)
+        if event_str is not None:
             self.log(event_str)
 
+    def encode(self, event):
+        """Return the encoding of the event that should be logged, or None if nothing should be logged"""
+        event_str = encode_event(event, serializer=self.serializer, limit=self.max_event_size)
+        if event_str is None:
+            event_str = self.handle_oversized_event(event)
+        return event_str
+
+    def _start_listener(self):
+        """Start the listener thread if it is not running"""
+        with self.listener_lock:
+            if self.listener is None:
+                self.listener = LoggerQueueListener(self.queue, self)
+                self.listener.start()
+
+    def _after_fork(self):
+        """
+        Reset the queue inherited from the parent process.
+
+        The events queued at the time of the fork are logged by the parent, and the listener thread is not running
+        in the child. It is started again when the next event is sent.
+        """
+        self.listener_lock = threading.Lock()
+        self.queue = queue.Queue(self.queue_size)
+        self.listener = None
+
+    def close(self):
+        """Log the events remaining in the queue and stop the listener thread"""
+        if self.queue is None:
+            return
+        QUEUED_BACKENDS.discard(self)
+        with self.listener_lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def handle_oversized_event(self, event):
+        """
+        Apply the oversize strategy to an event that is larger than `max_event_size`.
+
+        Returns the encoding of the event that should be logged instead, or None if nothing should be logged.
+        """
+        event_str = None
+        if self.oversize_strategy == TRUNCATE:
+            event_str = self.truncate(event)
+        elif self.oversize_strategy == SPILL:
+            event_str = self.stub(event, self.spill(event))
+        elif self.oversize_strategy == STUB:
+            event_str = self.stub(event, self.store(event))
+
+        outcome = {TRUNCATE: 'truncated', SPILL: 'spilled', STUB: 'stubbed'}.get(self.oversize_strategy)
+        if event_str is None:
+            outcome = 'dropped'
+        self.oversized_events[outcome] += 1
+        return event_str
+
+    def truncate(self, event):
+        """
+        Remove the largest fields of the event data until it fits in `max_event_size`.
+
+        Returns the encoding of the truncated event or None if it does not fit even without any data.
+        """
+        data = event.get('data')
+        if not isinstance(data, dict):
+            return None
+
+        serialize = get_serializer(self.serializer)
+        field_sizes = {key: len(serialize(str(key))) + len(serialize(value)) for key, value in data.items()}
+        # Lower bound of the size of the event without any data
+        remaining_size = len(encode_event(dict(event, data={}), serializer=self.serializer))
+        remaining_size += sum(field_sizes.values())
+
+        kept = dict(data)
+        removed = []
+        for key in sorted(field_sizes, key=field_sizes.get, reverse=True):
+            del kept[key]
+            removed.append(key)
+            remaining_size -= field_sizes[key]
+            if remaining_size > self.max_event_size:
+                continue
+
+            event_str = encode_event(
+                dict(event, data=kept, truncated_fields=removed),
+                serializer=self.serializer,
+                limit=self.max_event_size,
+            )
+            if event_str is not None:
+                return event_str
+
+        return None
+
+    def spill(self, event):
+        """Append the complete event to the spill file and return a reference to it"""
+        event_str = encode_event(event, serializer=self.serializer)
+        with self.spill_lock:
+            with open(self.spill_file, 'a', encoding='utf-8') as spill_file:
+                offset = spill_file.tell()
+                spill_file.write(event_str + '\n')
+        return {'size': len(event_str), 'spill_file': self.spill_file, 'offset': offset}
+
+    def store(self, event):
+        """Save the complete event in the blob store, if there is one, and return a reference to it"""
+        if self.blob_store is None:
+            return {'max_event_size': self.max_event_size}
+        event_str = encode_event(event, serializer=self.serializer)
+        return {'size': len(event_str), 'blob': self.blob_store.put(event_str.encode('utf-8'))}
+
+    def stub(self, event, reference):
+        """
+        Return the encoding of a stub of the event, which has no data and references the complete event.
+
+        Returns None if the stub does not fit in `max_event_size`.
+        """
+        stub = {key: value for key, value in event.items() if key != 'data'}
+        stub['data'] = {}
+        stub['oversized'] = reference
+        return encode_event(stub, serializer=self.serializer, limit=self.max_event_size)
+
+
+class LoggerQueueListener(QueueListener):
+    """
+    Log the events put on a queue by a `LoggerBackend` from a background thread.
+
+    The queue holds encoded events, or events to encode when the backend defers their encoding.
+    """
+
+    def __init__(self, event_queue, backend):
+        super().__init__(event_queue)
+        self.backend = backend
+
+    def prepare(self, record):
+        """Encode the event if its encoding was deferred"""
+        if isinstance(record, str):
+            return record
+        return self.backend.encode(record)
+
+    def handle(self, record):
+        """Log the event"""
+        try:
+            event_str = self.prepare(record)
+            if event_str is not None:
+                self.backend.log(event_str)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.exception('Failed to log event from the queue of %s', self.backend.event_logger.name)
+
+    def enqueue_sentinel(self):
+        """Wait for room in a full queue rather than failing to stop the thread"""
+        self.queue.put(self._sentinel)
+
 
 class DateTimeJSONEncoder(json.JSONEncoder):
     """JSON encoder aware of datetime.datetime and datetime.date objects"""
@@ -51,15 +300,200 @@ class DateTimeJSONEncoder(json.JSONEncoder):
         datatime objects are converted to UTC.
         """
 
-        if isinstance(obj, datetime):
-            if obj.tzinfo is None:
-                # Localize to UTC naive datetime objects
-                obj = UTC.localize(obj)  # pylint: disable=no-value-for-parameter
-            else:
-                # Convert to UTC datetime objects from other timezones
-                obj = obj.astimezone(UTC)
-            return obj.isoformat()
-        elif isinstance(obj, date):
-            return obj.isoformat()
+        if isinstance(obj, date):
+            return isoformat(obj)
 
         return super().default(obj)
+
+
+def isoformat(value):
+    """
+    Return the ISO format of a datetime.datetime or datetime.date object.
+
+    datatime objects are converted to UTC, naive ones are assumed to be in UTC.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            # Localize to UTC naive datetime objects
+            value = UTC.localize(value)  # pylint: disable=no-value-for-parameter
+        else:
+            # Convert to UTC datetime objects from other timezones
+            value = value.astimezone(UTC)
+    return value.isoformat()
+
+
+def _orjson_default(obj):
+    """Serialize the objects orjson is told not to serialize natively"""
+    if isinstance(obj, date):
+        return isoformat(obj)
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+def _orjson_serializer(obj):
+    """Serialize `obj` with orjson, using the same conventions as `DateTimeJSONEncoder`"""
+    return orjson.dumps(
+        obj,
+        default=_orjson_default,
+        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+    ).decode('utf-8')
+
+
+def register_serializer(name, serializer):
+    """
+    Register a serializer under `name`.
+
+    `serializer` is a callable that takes an object and returns its JSON encoding as a string. It must encode dates
+    like `DateTimeJSONEncoder` and raise a `TypeError` for objects it cannot serialize.
+    """
+    SERIALIZERS[name] = serializer
+
+
+def get_serializer(name=DEFAULT_SERIALIZER):
+    """
+    Return the serializer registered under `name`.
+
+    Raises a `ValueError` if there is no such serializer.
+    """
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f'Unknown serializer "{name}"') from None
+
+
+def decode_json(encoded):
+    """
+    Decode a JSON document, with `orjson` if it is installed.
+
+    Documents `orjson` rejects, like the ones holding NaN produced by `json`, are decoded with `json`.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(encoded)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(encoded)
+
+
+def _invalidating(method):
+    """Wrap a dict method that mutates the dictionary so that it invalidates the cached encodings."""
+    def wrapper(self, *args, **kwargs):
+        self.encodings.clear()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class EncodedEvent(dict):
+    """
+    An event dictionary that caches its JSON encoding.
+
+    The routing backends wrap the events they send to their backends in this class, so that the first backend that
+    needs the JSON encoding of the event (or of one of its fields) produces it and the following backends reuse it.
+    Serializing an event then costs the same regardless of the number of backends.
+
+    The cache is cleared when the top-level keys of the event are modified, and by the routing backends before
+    running processors on the event since they are allowed to mutate it in place. Backends must not mutate the events
+    they receive (see `RoutingBackend`), so nested values are not watched.
+    """
+
+    __slots__ = ('encodings',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encodings = {}
+
+    def encode(self, field=None, serializer=DEFAULT_SERIALIZER, limit=None):
+        """
+        Return the JSON encoding of the event, or of its `field` key if provided, produced by `serializer`.
+
+        Returns None if `limit` is provided and the encoding is longer than `limit` characters.
+        """
+        encoded = self.encodings.get((serializer, field))
+        if encoded is None:
+            value = self if field is None else self.get(field)
+            if limit is not None and minimum_encoded_size(value) > limit:
+                return None
+            encoded = self.encodings[serializer, field] = get_serializer(serializer)(value)
+
+        if limit is not None and len(encoded) > limit:
+            return None
+        return encoded
+
+    def invalidate(self):
+        """Clear the cached encodings"""
+        self.encodings.clear()
+
+    def __copy__(self):
+        # The copy may be modified independently, it gets its own cache
+        return EncodedEvent(self)
+
+    def __deepcopy__(self, memo):
+        copied = EncodedEvent(deepcopy(dict(self), memo))
+        copied.encodings.update(self.encodings)
+        return copied
+
+    def __reduce__(self):
+        # Unpickling a dict subclass sets its items before its slots, the cache is rebuilt by `__init__` instead
+        return (EncodedEvent, (dict(self),))
+
+    __setitem__ = _invalidating(dict.__setitem__)
+    __delitem__ = _invalidating(dict.__delitem__)
+    __ior__ = _invalidating(dict.__ior__)
+    clear = _invalidating(dict.clear)
+    pop = _invalidating(dict.pop)
+    popitem = _invalidating(dict.popitem)
+    setdefault = _invalidating(dict.setdefault)
+    update = _invalidating(dict.update)
+
+
+def encode_event(event, field=None, serializer=DEFAULT_SERIALIZER, limit=None):
+    """
+    Return the JSON encoding of `event`, or of its `field` key if provided, produced by `serializer`.
+
+    Returns None if `limit` is provided and the encoding is longer than `limit` characters. Events that are known to
+    be too large from `minimum_encoded_size` are not encoded at all.
+
+    The encoding is cached when `event` is an `EncodedEvent`.
+    """
+    if isinstance(event, EncodedEvent):
+        return event.encode(field, serializer, limit)
+
+    value = event if field is None else event.get(field)
+    if limit is not None and minimum_encoded_size(value) > limit:
+        return None
+
+    encoded = get_serializer(serializer)(value)
+    if limit is not None and len(encoded) > limit:
+        return None
+    return encoded
+
+
+def minimum_encoded_size(value):
+    """
+    Return a lower bound of the length of the JSON encoding of `value`.
+
+    The bound is the total length of the strings found in `value` and, if it is a dictionary, in its values and in
+    the values of its nested dictionaries. It is computed much faster than the encoding itself, which allows most
+    oversized events, whose size is usually due to large strings, to be rejected without being encoded.
+    """
+    if isinstance(value, str):
+        return len(value)
+    if not isinstance(value, dict):
+        return 0
+
+    size = 0
+    for item in value.values():
+        if isinstance(item, str):
+            size += len(item)
+        elif isinstance(item, dict):
+            for nested_item in item.values():
+                if isinstance(nested_item, str):
+                    size += len(nested_item)
+    return size
+
+
+register_serializer('json', DateTimeJSONEncoder().encode)
+if orjson is not None:
+    register_serializer('orjson', _orjson_serializer)
+register_serializer('fast', SERIALIZERS.get('orjson', SERIALIZERS['json']))
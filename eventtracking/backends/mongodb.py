@@ -1,19 +1,124 @@
 """MongoDB event tracker backend."""
 
 
+from datetime import datetime, timezone
 import logging
+import os
+import re
+import threading
+import time
 
+import bson
 import pymongo
 from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from pymongo.errors import CollectionInvalid, PyMongoError
 from bson.errors import BSONError
+from bson.raw_bson import RawBSONDocument
+
+from eventtracking.batching import Batcher
 
 
 log = logging.getLogger(__name__)
 
+BATCH_BYTES = 1024 * 1024  # 1 MB
+MAX_BUFFER_SIZE = 16 * 1024 * 1024  # 16 MB
+FLUSH_INTERVAL = 1.0
+
+# Indexes of the collection, as lists of (key, direction) pairs
+INDEXES = (
+    [('time', pymongo.DESCENDING)],
+    [('name', pymongo.ASCENDING)],
+)
+
+# When the indexes are created, see `MongoBackend`
+INDEXES_IN_BACKGROUND = 'background'
+INDEXES_AT_INIT = 'init'
+
+# How the events are partitioned in collections, see `MongoBackend`
+PARTITION_SECONDS = {'hour': 3600, 'day': 86400}
+PARTITION_FORMATS = {'hour': '%Y%m%d%H', 'day': '%Y%m%d'}
+TIMESERIES = 'timeseries'
+MAX_CACHED_PARTITIONS = 64
+TIME_FIELD = 'time'
+
+
+def partition_time(value):
+    """Return the POSIX timestamp of the time of an event, naive datetimes are UTC, or now if it has no time"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return time.time()
+
+
+class ClientRegistry:
+    """
+    Share `MongoClient` instances between the backends of a process.
+
+    A client is created for each distinct set of connection parameters, so that backends connected to the same
+    cluster share its connection pool. The registry is emptied in forked child processes, since the clients of the
+    parent process cannot be used after a fork.
+    """
+
+    def __init__(self):
+        self.clear()
+        os.register_at_fork(after_in_child=self.clear)
+
+    def clear(self):
+        """Forget all the clients"""
+        self.lock = threading.Lock()
+        self.clients = {}
+
+    def get(self, **kwargs):
+        """Return the client for the connection parameters `kwargs`, creating it if needed"""
+        key = tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = MongoClient(**kwargs)
+            return client
+
+
+CLIENTS = ClientRegistry()
+
+
+class MongoBackend:  # pylint: disable=too-many-instance-attributes
+    """
+    Class for a MongoDB event tracker Backend
 
-class MongoBackend:
-    """Class for a MongoDB event tracker Backend"""
+    The backend does not connect to MongoDB when it is constructed. Its `connection` (the `MongoClient`),
+    `database` and `collection` are created when they are first used in each process, so that a client is never
+    used on both sides of a fork. Backends with the same connection parameters share the same client, see
+    `ClientRegistry`, unless `share_client` is false. The indexes of the collection are created
+    according to `create_indexes`:
+
+    * `background` - Once per process, from a background thread started when the first event is sent, the default.
+    * `init` - When the backend is constructed, blocking until they are created.
+    * None - Never, they are expected to be created with the `ensure_mongo_indexes` management command.
+
+    Only the indexes that do not exist yet are created, see `ensure_indexes`. Creating an index on a large
+    collection can take a long time and, depending on the version of MongoDB, lock the collection.
+
+    Instead of a single ever growing collection, events can be partitioned by time with `partition`:
+
+    * `day` or `hour` - Each event is inserted in the collection of the UTC day or hour of its `time_field`, named
+      after `collection` with a `_YYYYMMDD` or `_YYYYMMDDHH` suffix, like `events_20240501`. Events without a time
+      go to the partition of the current time. The collection of each partition is cached, and its indexes are
+      created when it is first used in the process, according to `create_indexes`, so they stay small. When
+      `retention` is provided, the partitions that ended more than `retention` seconds ago are dropped whenever a
+      new partition is first used, see `drop_expired_partitions`.
+    * `timeseries` - `collection` is a MongoDB time series collection, created when it is first used if it does not
+      exist, whose documents expire after `retention` seconds.
+
+    By default every event is inserted with its own `insert_one` call, and the batches of events received with
+    `send_batch` are encoded to BSON, skipping the events that cannot be, and inserted with one unordered
+    `insert_many` call per collection. When `batch_size` is provided events are
+    encoded to BSON and buffered instead, and a background thread (see `eventtracking.batching.Batcher`) inserts them
+    with a single unordered `insert_many` call once `batch_size` events or `batch_bytes` bytes are buffered, or once
+    the oldest buffered event was sent `flush_interval` seconds ago. Events sent while `max_buffer_size` bytes are
+    waiting to be inserted are dropped and counted in `dropped_events`. The remaining events are inserted when the
+    process exits, or when `close` is called.
+    """
 
     def __init__(self, **kwargs):
         """
@@ -23,11 +128,22 @@ class MongoBackend:
 
           - `host`: hostname
           - `port`: port
-          - `user`: collection username
+          - `user`: collection username, authenticated against the
+            database unless `extra` sets the `authSource`
           - `password`: collection user password
           - `database`: name of the database
           - `collection`: name of the collection
           - `extra`: parameters to pymongo.MongoClient not listed above
+          - `batch_size`: maximum number of events inserted at once, events
+            are inserted one at a time if it is not provided
+          - `batch_bytes`: maximum size of the events inserted at once
+          - `flush_interval`: maximum number of seconds an event is buffered
+          - `create_indexes`: when to create the indexes, "background" by default
+          - `partition`: "day", "hour" or "timeseries" to partition the events by time
+          - `time_field`: key holding the time of the events, "time" by default
+          - `retention`: number of seconds the events of a partitioned collection are kept
+          - `share_client`: whether to share the client with the other
+            backends using the same connection parameters, true by default
 
         """
 
@@ -38,14 +154,11 @@ class MongoBackend:
         host = kwargs.get('host', 'localhost')
         port = kwargs.get('port', 27017)
 
-        user = kwargs.get('user', '')
-        password = kwargs.get('password', '')
-
         db_name = kwargs.get('database', 'eventtracking')
         collection_name = kwargs.get('collection', 'events')
 
         # Other mongo connection arguments
-        extra = kwargs.get('extra', {})
+        extra = dict(kwargs.get('extra', {}))
 
         # By default disable write acknowledgments, reducing the time
         # blocking during an insert
@@ -54,39 +167,239 @@ class MongoBackend:
         # Make timezone aware by default
         extra['tz_aware'] = extra.get('tz_aware', True)
 
-        # Connect to database and get collection
+        # Connect when the first operation is performed rather than now
+        extra['connect'] = extra.get('connect', False)
+
+        # Authenticate against the database of the events by default. The credentials are part of the connection
+        # parameters, so that backends using different users do not share a client.
+        if kwargs.get('user'):
+            extra['username'] = kwargs['user']
+            extra['password'] = kwargs.get('password', '')
+            extra['authSource'] = extra.get('authSource', db_name)
+
+        # The client, database and collection are created lazily in each process
+        self.client_options = dict(extra, host=host, port=port)
+        self.share_client = kwargs.get('share_client', True)
+        self.names = (db_name, collection_name)
+        self.pid = None
+        self._connection = self._database = self._collection = None
 
-        self.connection = MongoClient(
-            host=host,
-            port=port,
-            **extra
-        )
+        self.create_indexes = kwargs.get('create_indexes', INDEXES_IN_BACKGROUND)
+        if self.create_indexes not in (INDEXES_IN_BACKGROUND, INDEXES_AT_INIT, None):
+            raise ValueError(f'Unknown value for create_indexes "{self.create_indexes}"')
+        self.partition = kwargs.get('partition')
+        if self.partition not in (None, TIMESERIES, *PARTITION_SECONDS):
+            raise ValueError(f'Unknown value for partition "{self.partition}"')
+        self.partition_seconds = PARTITION_SECONDS.get(self.partition)
+        self.time_field = kwargs.get('time_field', TIME_FIELD)
+        self.retention = kwargs.get('retention')
+        if self.retention is not None and self.partition is None:
+            raise ValueError('MongoBackend requires a "partition" to enforce a retention')
+        self.partitions = {}
+        self.partitions_lock = threading.Lock()
 
-        self.database = self.connection[db_name]
+        self.indexes_pending = self.create_indexes == INDEXES_IN_BACKGROUND and self.partition is None
+        self.indexes_lock = threading.Lock()
+        if self.create_indexes == INDEXES_AT_INIT:
+            self.ensure_indexes()
 
-        if user or password:
-            self.database.authenticate(user, password)
+        self.batcher = None
+        self.dropped_events = 0
+        if kwargs.get('batch_size') is not None:
+            self.batcher = Batcher(
+                self.insert_batch,
+                max_count=kwargs['batch_size'],
+                max_bytes=kwargs.get('batch_bytes', BATCH_BYTES),
+                max_age=kwargs.get('flush_interval', FLUSH_INTERVAL),
+                max_buffer_bytes=kwargs.get('max_buffer_size', MAX_BUFFER_SIZE),
+                name='eventtracking-mongo-writer',
+            )
 
-        self.collection = self.database[collection_name]
+    def _connect(self):
+        """Get a client and the collection for the current process"""
+        if self.share_client:
+            connection = CLIENTS.get(**self.client_options)
+        else:
+            connection = MongoClient(**self.client_options)
+        database = connection[self.names[0]]
+        self._connection, self._database = connection, database
+        self._collection = database[self.names[1]]
+        self.partitions = {}
+        self.pid = os.getpid()
 
-        self._create_indexes()
+    @property
+    def connection(self):
+        """The `MongoClient` of the current process"""
+        if self.pid != os.getpid():
+            self._connect()
+        return self._connection
 
-    def _create_indexes(self):
-        """Ensures the proper fields are indexed"""
-        # WARNING: The collection will be locked during the index
-        # creation. If the collection has a large number of
-        # documents in it, the operation can take a long time.
+    @property
+    def database(self):
+        """The database of the current process"""
+        if self.pid != os.getpid():
+            self._connect()
+        return self._database
 
-        # TODO: The creation of indexes can be moved to a Django
-        # management command or equivalent. There is also an option to
-        # run the indexing on the background, without locking.
-        self.collection.create_index([('time', pymongo.DESCENDING)])
-        self.collection.create_index('name')
+    @property
+    def collection(self):
+        """The collection of the current process"""
+        if self.pid != os.getpid():
+            self._connect()
+        return self._collection
+
+    def route(self, event):
+        """Return the collection the event is inserted in, the collection of its partition if partitioned"""
+        if self.partition is None:
+            return self.collection
+        if self.pid != os.getpid():
+            self._connect()
+        if self.partition_seconds is None:
+            bucket = 0
+        else:
+            bucket = int(partition_time(event.get(self.time_field)) // self.partition_seconds)
+        collection = self.partitions.get(bucket)
+        if collection is None:
+            collection = self.open_partition(bucket)
+        return collection
+
+    def open_partition(self, bucket):
+        """
+        Return the collection of a partition used for the first time in the process, and create its indexes.
+
+        `bucket` is the number of partitions since the epoch, or 0 for a time series collection.
+        """
+        with self.partitions_lock:
+            collection = self.partitions.get(bucket)
+            if collection is not None:
+                return collection
+            if self.partition_seconds is None:
+                collection = self.create_timeseries()
+            else:
+                collection = self.database[self.partition_name(bucket)]
+            if len(self.partitions) >= MAX_CACHED_PARTITIONS:
+                # Events spread over many partitions, for example when replaying old events
+                self.partitions.clear()
+            self.partitions[bucket] = collection
+
+        if self.create_indexes == INDEXES_AT_INIT:
+            self.ensure_indexes(collection)
+        elif self.create_indexes == INDEXES_IN_BACKGROUND or self.retention is not None:
+            threading.Thread(
+                target=self._maintain_partitions, args=(collection,), name='eventtracking-mongo-partitions', daemon=True
+            ).start()
+        return collection
+
+    def partition_name(self, bucket):
+        """Return the name of the collection of a partition"""
+        start = datetime.fromtimestamp(bucket * self.partition_seconds, tz=timezone.utc)
+        return f'{self.names[1]}_{start.strftime(PARTITION_FORMATS[self.partition])}'
+
+    def partition_start(self, name):
+        """Return the POSIX timestamp of the start of the partition of a collection, or None if it is not one"""
+        prefix = self.names[1] + '_'
+        if not name.startswith(prefix):
+            return None
+        try:
+            start = datetime.strptime(name[len(prefix):], PARTITION_FORMATS[self.partition])
+        except ValueError:
+            return None
+        return start.replace(tzinfo=timezone.utc).timestamp()
+
+    def partition_names(self):
+        """Return the names of the existing collections of the partitions, oldest first"""
+        pattern = f'^{re.escape(self.names[1])}_[0-9]+$'
+        names = self.database.list_collection_names(filter={'name': {'$regex': pattern}})
+        return sorted(name for name in names if self.partition_start(name) is not None)
+
+    def create_timeseries(self):
+        """Create the time series collection if it does not exist, and return it"""
+        name = self.names[1]
+        if not self.database.list_collection_names(filter={'name': name}):
+            options = {'timeseries': {'timeField': self.time_field, 'metaField': 'name', 'granularity': 'seconds'}}
+            if self.retention is not None:
+                options['expireAfterSeconds'] = int(self.retention)
+            try:
+                self.database.create_collection(name, **options)
+            except CollectionInvalid:
+                # Created by another process in the meantime
+                pass
+        return self.collection
+
+    def drop_expired_partitions(self, now=None):
+        """
+        Drop the collections of the partitions that ended more than `retention` seconds before `now`.
+
+        Returns the names of the dropped collections. The documents of time series collections expire by themselves.
+        """
+        if self.retention is None or self.partition_seconds is None:
+            return []
+        expiry = (time.time() if now is None else now) - self.retention
+        dropped = []
+        for name in self.partition_names():
+            if self.partition_start(name) + self.partition_seconds <= expiry:
+                self.database.drop_collection(name)
+                dropped.append(name)
+        return dropped
+
+    def _maintain_partitions(self, collection):
+        """Create the missing indexes of a new partition and drop the expired ones, logging errors"""
+        if self.create_indexes == INDEXES_IN_BACKGROUND:
+            self._ensure_indexes_safely(collection)
+        try:
+            dropped = self.drop_expired_partitions()
+        except PyMongoError:
+            log.exception('Error dropping the expired partitions of the MongoDB event tracker backend')
+            return
+        if dropped:
+            log.info('Dropped the expired partitions %s of the MongoDB event tracker backend', dropped)
+
+    def ensure_indexes(self, collection=None):
+        """
+        Create the indexes of the collection that do not exist yet.
+
+        When the events are partitioned in collections and no `collection` is provided, the indexes of every
+        existing partition are created. Returns the names of the indexes that were created.
+        """
+        if collection is None:
+            if self.partition_seconds is not None:
+                return [
+                    name for partition in self.partition_names()
+                    for name in self.ensure_indexes(self.database[partition])
+                ]
+            collection = self.create_timeseries() if self.partition == TIMESERIES else self.collection
+        existing = [list(index['key']) for index in collection.index_information().values()]
+        return [collection.create_index(keys) for keys in INDEXES if keys not in existing]
+
+    def _ensure_indexes_in_background(self):
+        """Start a thread that creates the missing indexes, unless one was already started"""
+        with self.indexes_lock:
+            if not self.indexes_pending:
+                return
+            self.indexes_pending = False
+        threading.Thread(target=self._ensure_indexes_safely, name='eventtracking-mongo-indexes', daemon=True).start()
+
+    def _ensure_indexes_safely(self, collection=None):
+        """Create the missing indexes, logging errors"""
+        try:
+            created = self.ensure_indexes(collection)
+        except PyMongoError:
+            log.exception('Error creating the indexes of the MongoDB event tracker backend')
+            return
+        if created:
+            log.info('Created the indexes %s of the MongoDB event tracker backend', created)
 
     def send(self, event):
         """Insert the event in to the Mongo collection"""
+        if self.indexes_pending:
+            self._ensure_indexes_in_background()
+
+        if self.batcher is not None:
+            self.buffer(event)
+            return
+
         try:
-            self.collection.insert_one(event)
+            self.route(event).insert_one(event)
         except (PyMongoError, BSONError):
             # The event will be lost in case of a connection error or any error
             # that occurs when trying to insert the event into Mongo.
@@ -94,3 +407,56 @@ class MongoBackend:
             # during the next event.
             msg = 'Error inserting to MongoDB event tracker backend'
             log.exception(msg)
+
+    def send_batch(self, events):
+        """Insert a batch of events, with one unordered `insert_many` call per collection"""
+        if self.indexes_pending:
+            self._ensure_indexes_in_background()
+
+        if self.batcher is not None:
+            for event in events:
+                self.buffer(event)
+            return
+
+        # Each event is encoded on its own, so that an event that cannot be inserted does not fail the batch
+        self.insert_batch([item for item in map(self.encode, events) if item is not None])
+
+    def buffer(self, event):
+        """Encode the event and add it to the buffer of events to insert"""
+        item = self.encode(event)
+        if item is not None and not self.batcher.add(item, len(item[1].raw)):
+            self.dropped_events += 1
+
+    def encode(self, event):
+        """
+        Return the collection the event is inserted in and the event encoded to BSON.
+
+        Returns None, and logs the error, if the collection cannot be opened or the event cannot be encoded.
+        """
+        try:
+            collection = self.route(event)
+            return collection, RawBSONDocument(bson.encode(event, codec_options=collection.codec_options))
+        except (PyMongoError, BSONError):
+            log.exception('Error encoding event for MongoDB event tracker backend')
+            return None
+
+    def insert_batch(self, items):
+        """Insert a batch of (collection, encoded event) pairs, with one `insert_many` call per collection"""
+        batches = {}
+        for collection, document in items:
+            batches.setdefault(collection.name, (collection, []))[1].append(document)
+        for collection, documents in batches.values():
+            try:
+                collection.insert_many(documents, ordered=False)
+            except (PyMongoError, BSONError):
+                log.exception('Error inserting %d events to MongoDB event tracker backend', len(documents))
+
+    def flush(self):
+        """Insert the buffered events now"""
+        if self.batcher is not None:
+            self.batcher.flush()
+
+    def close(self):
+        """Insert the buffered events and stop the background thread"""
+        if self.batcher is not None:
+            self.batcher.close()
@@ -5,7 +5,10 @@ import logging
 from collections import OrderedDict
 from copy import deepcopy
 
+from eventtracking.backends.logger import EncodedEvent
+from eventtracking.lazy import resolve_lazy_values
 from eventtracking.processors.exceptions import (
+    BackendDeliveryError,
     EventEmissionExit,
     NoBackendEnabled,
     NoTransformerImplemented,
@@ -34,11 +37,13 @@ class RoutingBackend:
        the order that they were registered. Backends typically persist the event in some way, either by sending it
        to an external system or saving it to disk. They are called synchronously and in sequence, so a long running
        backend will block other backends until it is done persisting the event. Note that you can register another
-       `RoutingBackend` as a backend of a `RoutingBackend`, allowing for arbitrary processing trees.
+       `RoutingBackend` as a backend of a `RoutingBackend`, allowing for arbitrary processing trees. Backends receive
+       the event as an `EncodedEvent`, so that its JSON encoding is only computed once for all of them.
 
     `backends` is a collection that supports iteration over its items using `iteritems()`. The keys are expected to be
         sortable and the values are expected to expose a `send(event)` method that will be called for each event. Each
-        backend in this collection is registered in order sorted alphanumeric ascending by key.
+        backend in this collection is registered in order sorted alphanumeric ascending by key. Backends can also
+        expose a `send_batch(events)` method, which receives the whole batches of events passed to `send_batch`.
     `processors` is an iterable of callables.
 
     Raises a `ValueError` if any of the provided backends do not have a callable "send" attribute or any of the
@@ -48,6 +53,7 @@ class RoutingBackend:
     def __init__(self, backends=None, processors=None):
         self.backends = OrderedDict()
         self.processors = []
+        self.backends_by_type = {}
 
         if backends is not None:
             for name in sorted(backends.keys()):
@@ -67,6 +73,21 @@ class RoutingBackend:
             raise ValueError('Backend %s does not have a callable "send" method.' % backend.__class__.__name__)
 
         self.backends[name] = backend
+        self.backends_by_type.clear()
+
+    def backends_of_type(self, backend_class):
+        """
+        Return the (name, backend) pairs of the registered backends that are instances of `backend_class`.
+
+        The result is cached until another backend is registered, backends must be registered with
+        `register_backend` rather than added to `backends` directly.
+        """
+        backends = self.backends_by_type.get(backend_class)
+        if backends is None:
+            backends = self.backends_by_type[backend_class] = tuple(
+                (name, backend) for name, backend in self.backends.items() if isinstance(backend, backend_class)
+            )
+        return backends
 
     def register_processor(self, processor):
         """
@@ -94,6 +115,32 @@ class RoutingBackend:
         else:
             self.send_to_backends(processed_event)
 
+    def send_batch(self, events):
+        """
+        Process a batch of events using all registered processors and send them to all registered backends.
+
+        The events filtered out by a processor are left out of the batch. Logs and swallows all `Exception`.
+        """
+        events = deepcopy(events)
+        self.send_batch_to_backends(self.process_batch(events))
+
+    def process_batch(self, events):
+        """
+        Executes all event processors on each event of the batch in order.
+
+        Returns the list of modified events, without the events for which a processor raised `EventEmissionExit`.
+        """
+        if len(self.processors) == 0:
+            return list(events)
+
+        processed_events = []
+        for event in events:
+            try:
+                processed_events.append(self.process_event(event))
+            except EventEmissionExit:
+                continue
+        return processed_events
+
     def process_event(self, event):
         """
 
@@ -109,6 +156,10 @@ class RoutingBackend:
         if len(self.processors) == 0:
             return event
 
+        if isinstance(event, EncodedEvent):
+            # Processors may mutate the event in place
+            event.invalidate()
+
         processed_event = event
 
         for processor in self.processors:
@@ -125,24 +176,118 @@ class RoutingBackend:
 
         return processed_event
 
-    def send_to_backends(self, event):
+    def send_to_backends(self, event, raise_errors=False):
         """
         Sends the event to all registered backends.
 
-        Logs and swallows all `Exception`.
+        Logs and swallows all `Exception`. When `raise_errors` is true, the event is still sent to every backend, then
+        `BackendDeliveryError` is raised with the names of the backends that failed, so that the caller can retry.
+        Nested routing backends that do not override `send` report the failures of their own backends too.
+        """
+        if isinstance(event, dict) and not isinstance(event, EncodedEvent):
+            event = EncodedEvent(event)
+
+        resolved = False
+        failed = []
+        for name, backend in self.backends.items():
+            if not resolved and not isinstance(backend, RoutingBackend):
+                self.resolve_lazy_values(event)
+                resolved = True
+            send = backend.send
+            if raise_errors and isinstance(backend, RoutingBackend) and type(backend).send is RoutingBackend.send:
+                send = backend.send_or_raise
+            if not self._send_to_backend(name, send, event):
+                failed.append(name)
+
+        if raise_errors and failed:
+            raise BackendDeliveryError(failed)
+
+    def send_or_raise(self, event):
+        """
+        Process the event and send it to all registered backends like `send`.
+
+        Raises `BackendDeliveryError` if some backends failed, see `send_to_backends`.
         """
+        try:
+            processed_event = self.process_event(deepcopy(event))
+        except EventEmissionExit:
+            return
+        self.send_to_backends(processed_event, raise_errors=True)
+
+    def resolve_lazy_values(self, event):
+        """
+        Replace the lazy context values of the event by their value (see `eventtracking.lazy`).
+
+        Called before an event is sent to a backend that is not a routing backend, since nested routing backends
+        may still filter it out.
+        """
+        if resolve_lazy_values(event) and isinstance(event, EncodedEvent):
+            event.invalidate()
+
+    def send_batch_to_backends(self, events):
+        """
+        Sends a batch of events to all registered backends.
+
+        Backends with a `send_batch(events)` method receive the whole batch at once, the other backends receive the
+        events one at a time. Logs and swallows all `Exception`.
+        """
+        if not events:
+            return
+        events = [
+            EncodedEvent(event) if isinstance(event, dict) and not isinstance(event, EncodedEvent) else event
+            for event in events
+        ]
 
+        resolved = False
         for name, backend in self.backends.items():
+            if not resolved and not isinstance(backend, RoutingBackend):
+                for event in events:
+                    self.resolve_lazy_values(event)
+                resolved = True
+            send_batch = getattr(backend, 'send_batch', None)
+            if send_batch is None:
+                for event in events:
+                    self._send_to_backend(name, backend.send, event)
+            else:
+                try:
+                    send_batch(events)
+                except Exception:   # pylint: disable=broad-exception-caught
+                    LOG.exception('Unable to send a batch of %d edx events to backend: %s', len(events), name)
+
+    def close(self):
+        """
+        Close the registered backends that have a `close` method, which sends the events they buffer.
+
+        Nested routing backends close their own backends. Logs and swallows all `Exception`.
+        """
+        for name, backend in self.backends.items():
+            close = getattr(backend, 'close', None)
+            if close is None:
+                continue
             try:
-                backend.send(event)
-            except NoTransformerImplemented as exc:
-                LOG.info('[send_to_backends] No transformer has been implemented for edx event "%s", [%s]',
-                         event["name"], repr(exc))
-            except NoBackendEnabled as exc:
-                LOG.info('[send_to_backends] Failed to send edx event "%s" to "%s" backend. "%s" backend has'
-                         ' not been enabled, [%s]', event["name"], name, name, repr(exc)
-                         )
+                close()
             except Exception:   # pylint: disable=broad-exception-caught
-                LOG.exception(
-                    'Unable to send edx event "%s" to backend: %s', event["name"], name
-                )
+                LOG.exception('Unable to close backend: %s', name)
+
+    def _send_to_backend(self, name, send, event):
+        """
+        Send the event with the `send` method of the backend `name`, logging the exceptions it raises.
+
+        Returns False if the backend failed to send the event. Events that the backend does not handle, see
+        `NoTransformerImplemented` and `NoBackendEnabled`, are not failures.
+        """
+        try:
+            send(event)
+        except NoTransformerImplemented as exc:
+            LOG.info('[send_to_backends] No transformer has been implemented for edx event "%s", [%s]',
+                     event["name"], repr(exc))
+        except NoBackendEnabled as exc:
+            LOG.info('[send_to_backends] Failed to send edx event "%s" to "%s" backend. "%s" backend has'
+                     ' not been enabled, [%s]', event["name"], name, name, repr(exc)
+                     )
+        except Exception:   # pylint: disable=broad-exception-caught
+            LOG.exception(
+                'Unable to send edx event "%s" to backend: %s', event["name"], name
+            )
+            return False
+        return True
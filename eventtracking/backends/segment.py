@@ -1,12 +1,52 @@
-"""Event tracking backend that sends events to segment.com"""
+"""Event tracking backends that send events to segment.com"""
 
-from six.moves.urllib.parse import urlunsplit
+import base64
+from datetime import datetime
+from functools import lru_cache
+import gzip
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+import logging
+import time
+import uuid
+
+from pytz import UTC
+from six.moves.urllib.parse import urlsplit, urlunsplit
+
+from eventtracking.backends.logger import DEFAULT_SERIALIZER, get_serializer, isoformat
+from eventtracking.batching import Batcher
+from eventtracking.instances import LiveInstances
 
 try:
     import analytics
 except ImportError:
     analytics = None
 
+log = logging.getLogger(__name__)
+
+BATCH_URL = 'https://api.segment.io/v1/batch'
+BATCH_SIZE = 100
+# The batch API rejects batches larger than 500 KB and messages larger than 32 KB
+BATCH_BYTES = 450 * 1024  # 450 KB
+MAX_MESSAGE_SIZE = 32 * 1024  # 32 KB
+MAX_BUFFER_SIZE = 16 * 1024 * 1024  # 16 MB
+FLUSH_INTERVAL = 5.0
+TIMEOUT = 15
+COMPRESSION_LEVEL = 6
+MAX_RETRIES = 3
+RETRY_DELAY = 0.5
+
+# The backends that are not closed yet
+BACKENDS = LiveInstances(after_fork='_after_fork')
+
+# Maximum number of page URLs built from a host and a path that are cached
+PAGE_URL_CACHE_SIZE = 1024
+
+# Fields of the tracking context copied as is to the Segment context, as (context key, Segment key) pairs
+CONTEXT_FIELDS = (
+    ('ip', 'ip'),
+    ('agent', 'userAgent'),
+)
+
 
 class SegmentBackend:
     """
@@ -48,52 +88,206 @@ class SegmentBackend:
 
     def send(self, event):
         """Use the segment.com python API to send the event to segment.com"""
-        if analytics is None:
+        context = event.get('context')
+        if not context or analytics is None:
             return
-
-        context = event.get('context', {})
         user_id = context.get('user_id')
         name = event.get('name')
         if name is None or user_id is None:
             return
 
-        segment_context = {}
-
-        ga_client_id = context.get('client_id')
-        if ga_client_id is not None:
-            segment_context['Google Analytics'] = {
-                'clientId': ga_client_id
-            }
-        ip_address = context.get('ip')
-        if ip_address is not None:
-            segment_context['ip'] = ip_address
-        user_agent = context.get('agent')
-        if user_agent is not None:
-            segment_context['userAgent'] = user_agent
-        path = context.get('path')
-        referer = context.get('referer')
-        page = context.get('page')
-
-        if path and not page:
-            # Try to put together a url from host and path, hardcoding the schema.
-            # (Segment doesn't care about the schema for GA, but will extract the host and path from the url.)
-            host = context.get('host')
-            if host:
-                parts = ("https", host, path, "", "")
-                page = urlunsplit(parts)
-
-        if path is not None or referer is not None or page is not None:
-            segment_context['page'] = {}
-            if path is not None:
-                segment_context['page']['path'] = path
-            if referer is not None:
-                segment_context['page']['referrer'] = referer
-            if page is not None:
-                segment_context['page']['url'] = page
-
         analytics.track(
             user_id,
             name,
             event,
-            context=segment_context
+            context=segment_context(context)
         )
+
+
+class SegmentBatchBackend:  # pylint: disable=too-many-instance-attributes
+    """
+    Send events to the batch API of segment.com without the `analytics` package.
+
+    Events are mapped to Segment "track" messages like in `SegmentBackend`, encoded and buffered. A background thread
+    (see `eventtracking.batching.Batcher`) uploads them as a gzip compressed batch once `batch_size` messages or
+    `batch_bytes` bytes are buffered, or once the oldest message was buffered `flush_interval` seconds ago. Batches
+    are posted to `url` over a persistent HTTP connection, which is reused until it fails. Batches rejected with a
+    429 or a 5xx response, or that fail to be sent, are retried up to `max_retries` times with an exponential
+    backoff starting at `retry_delay` seconds, then their events are counted in `failed_events`.
+
+    Events without a `user_id` or a `name` are ignored. Events whose message is larger than `max_message_size`
+    bytes, or sent while `max_buffer_size` bytes are waiting to be uploaded, are dropped and counted in
+    `dropped_events`. The buffered events are uploaded when the process exits, or when `close` is called.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Send events to segment.com in batches.
+
+        `write_key` is the write key of the Segment source.
+        `url` is the URL of the batch API, defaults to "https://api.segment.io/v1/batch".
+        `serializer` is the name of the serializer used to encode messages
+            (see `eventtracking.backends.logger.register_serializer`), defaults to "json".
+        """
+        write_key = kwargs.get('write_key')
+        if not write_key:
+            raise ValueError('SegmentBatchBackend requires a "write_key"')
+        credentials = base64.b64encode(f'{write_key}:'.encode('utf-8')).decode('ascii')
+        self.headers = {
+            'Authorization': f'Basic {credentials}',
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            'User-Agent': 'eventtracking',
+        }
+        url = urlsplit(kwargs.get('url', BATCH_URL))
+        self.connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+        self.netloc = url.netloc
+        self.path = url.path or '/'
+        self.timeout = kwargs.get('timeout', TIMEOUT)
+        self.serializer = get_serializer(kwargs.get('serializer', DEFAULT_SERIALIZER))
+        self.max_message_size = kwargs.get('max_message_size', MAX_MESSAGE_SIZE)
+        self.compression_level = kwargs.get('compression_level', COMPRESSION_LEVEL)
+        self.max_retries = kwargs.get('max_retries', MAX_RETRIES)
+        self.retry_delay = kwargs.get('retry_delay', RETRY_DELAY)
+
+        self.batcher = Batcher(
+            self.upload,
+            max_count=kwargs.get('batch_size', BATCH_SIZE),
+            max_bytes=kwargs.get('batch_bytes', BATCH_BYTES),
+            max_age=kwargs.get('flush_interval', FLUSH_INTERVAL),
+            max_buffer_bytes=kwargs.get('max_buffer_size', MAX_BUFFER_SIZE),
+            name='eventtracking-segment-uploader',
+        )
+        self.dropped_events = 0
+        self.failed_events = 0
+        self.connection = None
+        BACKENDS.add(self)
+
+    def _after_fork(self):
+        """Do not use the connection of the parent process"""
+        self.connection = None
+
+    def send(self, event):
+        """Encode the event as a Segment message and add it to the buffer"""
+        context = event.get('context')
+        if not context:
+            return
+        user_id = context.get('user_id')
+        name = event.get('name')
+        if name is None or user_id is None:
+            return
+
+        message = {
+            'type': 'track',
+            'userId': user_id,
+            'event': name,
+            'properties': event,
+            'context': segment_context(context),
+            'messageId': str(uuid.uuid4()),
+        }
+        timestamp = event.get('timestamp')
+        if timestamp is not None:
+            message['timestamp'] = timestamp
+        try:
+            encoded = self.serializer(message).encode('utf-8')
+        except (TypeError, ValueError):
+            log.exception('Unable to encode the event %s for segment.com', name)
+            self.dropped_events += 1
+            return
+
+        if len(encoded) > self.max_message_size or not self.batcher.add(encoded, len(encoded)):
+            self.dropped_events += 1
+
+    def upload(self, messages):
+        """Post a batch of encoded messages, retrying on connection errors, throttling and server errors"""
+        sent_at = isoformat(datetime.now(UTC)).encode('ascii')
+        payload = b''.join((b'{"batch":[', b','.join(messages), b'],"sentAt":"', sent_at, b'"}'))
+        body = gzip.compress(payload, self.compression_level)
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                status, reason = self.post(body)
+            except (OSError, HTTPException) as exc:
+                status, reason = None, repr(exc)
+            if status is not None and status < 300:
+                return
+            if status is not None and status != 429 and status < 500:
+                # The batch is invalid, sending it again would fail again
+                break
+
+        self.failed_events += len(messages)
+        log.error('Failed to upload %d events to segment.com: %s %s', len(messages), status, reason)
+
+    def post(self, body):
+        """Post `body` over the persistent connection and return the status and reason of the response"""
+        if self.connection is None:
+            self.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        try:
+            self.connection.request('POST', self.path, body=body, headers=self.headers)
+            response = self.connection.getresponse()
+            # The response must be read before the connection can be reused
+            response.read()
+        except BaseException:
+            self.connection.close()
+            self.connection = None
+            raise
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status, response.reason
+
+    def flush(self):
+        """Upload the buffered events now"""
+        self.batcher.flush()
+
+    def close(self):
+        """Upload the buffered events, stop the background thread and close the connection"""
+        self.batcher.close()
+        BACKENDS.discard(self)
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def segment_context(context):
+    """Return the Segment context of an event with the given tracking `context`"""
+    result = {}
+
+    ga_client_id = context.get('client_id')
+    if ga_client_id is not None:
+        result['Google Analytics'] = {
+            'clientId': ga_client_id
+        }
+    for key, segment_key in CONTEXT_FIELDS:
+        value = context.get(key)
+        if value is not None:
+            result[segment_key] = value
+
+    path = context.get('path')
+    referer = context.get('referer')
+    page = context.get('page')
+
+    if path and not page:
+        # Try to put together a url from host and path, hardcoding the schema.
+        # (Segment doesn't care about the schema for GA, but will extract the host and path from the url.)
+        host = context.get('host')
+        if host:
+            page = page_url(host, path)
+
+    if path is not None or referer is not None or page is not None:
+        page_context = result['page'] = {}
+        if path is not None:
+            page_context['path'] = path
+        if referer is not None:
+            page_context['referrer'] = referer
+        if page is not None:
+            page_context['url'] = page
+    return result
+
+
+@lru_cache(maxsize=PAGE_URL_CACHE_SIZE)
+def page_url(host, path):
+    """Return the URL of the page at `path` on `host`, the few hosts and paths of a site repeat a lot"""
+    return urlunsplit(("https", host, path, "", ""))
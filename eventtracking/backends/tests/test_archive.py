@@ -0,0 +1,217 @@
+"""Test the compressed archive backend and reader"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from pytz import UTC
+
+from eventtracking.backends.archive import ArchiveBackend, ArchiveReader, event_time
+
+
+class TestArchive(TestCase):
+    """Test writing and reading archives"""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'tracking.arc')
+        self.start = datetime(2024, 5, 1, tzinfo=UTC)
+
+    def create_backend(self, **kwargs):
+        """Create a backend writing to the temporary archive, closed at the end of the test"""
+        kwargs.setdefault('flush_interval', 60)
+        backend = ArchiveBackend(path=self.path, max_event_size=None, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def write_days(self, backend, days=3, per_day=4):
+        """Write one block of events per day, alternating two event names"""
+        events = []
+        for day in range(days):
+            for index in range(per_day):
+                event = {
+                    'name': 'even' if index % 2 == 0 else 'odd',
+                    'timestamp': self.start + timedelta(days=day, hours=index),
+                    'data': {'day': day, 'index': index},
+                }
+                backend.send(event)
+                events.append(event)
+            backend.flush()
+        return events
+
+    def read_index(self, path=None):
+        """Return the entries of the index of the archive"""
+        with open((path or self.path) + '.idx', encoding='utf-8') as index_file:
+            return [json.loads(line) for line in index_file]
+
+    def test_index(self):
+        backend = self.create_backend()
+        self.write_days(backend, days=2)
+        backend.close()
+
+        index = self.read_index()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index[0]['offset'], 0)
+        self.assertEqual(index[1]['offset'], index[0]['length'])
+        self.assertEqual(os.path.getsize(self.path), index[0]['length'] + index[1]['length'])
+        self.assertEqual(index[0]['count'], 4)
+        self.assertEqual(index[0]['names'], ['even', 'odd'])
+        self.assertEqual(index[0]['start'], self.start.timestamp())
+        self.assertEqual(index[0]['end'], (self.start + timedelta(hours=3)).timestamp())
+
+    def test_round_trip(self):
+        backend = self.create_backend()
+        events = self.write_days(backend)
+        backend.close()
+
+        with ArchiveReader(self.path) as reader:
+            read = list(reader.events())
+        for event in events:
+            event['timestamp'] = event['timestamp'].isoformat()
+        self.assertEqual(read, events)
+
+    def test_time_filter_skips_blocks(self):
+        backend = self.create_backend()
+        self.write_days(backend)
+        backend.close()
+
+        day = self.start + timedelta(days=1)
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(len(reader.blocks(start=day, end=day + timedelta(hours=23))), 1)
+            with patch('eventtracking.backends.archive.zlib.decompress', wraps=zlib.decompress) as mock:
+                events = list(reader.events(start=day + timedelta(hours=1), end=day + timedelta(hours=2)))
+            self.assertEqual(mock.call_count, 1)
+        self.assertEqual([event['data'] for event in events], [{'day': 1, 'index': 1}, {'day': 1, 'index': 2}])
+
+    def test_processes_sharing_an_archive(self):
+        first, second = self.create_backend(), self.create_backend()
+        for backend, name in ((first, 'a1'), (second, 'b1'), (first, 'a2')):
+            backend.send({'name': name})
+            backend.flush()
+        first.close()
+        second.close()
+
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual([event['name'] for event in reader.events()], ['a1', 'b1', 'a2'])
+
+    def test_naive_times_are_utc(self):
+        backend = self.create_backend()
+        backend.send({'name': 'naive', 'timestamp': datetime(2024, 5, 1, 12)})
+        backend.close()
+
+        with patch.dict(os.environ, TZ='Asia/Tokyo'):
+            time.tzset()
+            self.addCleanup(time.tzset)
+            with ArchiveReader(self.path) as reader:
+                events = reader.events(start=datetime(2024, 5, 1, 11), end=datetime(2024, 5, 1, 13))
+                self.assertEqual([event['name'] for event in events], ['naive'])
+                self.assertEqual(reader.blocks(start=self.start + timedelta(hours=13)), [])
+
+    def test_name_filter(self):
+        backend = self.create_backend()
+        self.write_days(backend, days=1)
+        backend.send({'name': 'rare', 'timestamp': self.start + timedelta(days=1)})
+        backend.close()
+
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(len(reader.blocks(names={'rare'})), 1)
+            self.assertEqual(len(reader.blocks(names={'missing'})), 0)
+            self.assertEqual([event['name'] for event in reader.events(names=['rare'])], ['rare'])
+            self.assertEqual(len(list(reader.events(names={'odd'}))), 2)
+
+    def test_events_without_time(self):
+        backend = self.create_backend()
+        backend.send({'name': 'untimed'})
+        backend.send({'name': 'timed', 'timestamp': self.start})
+        backend.close()
+
+        self.assertIsNone(self.read_index()[0]['start'])
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(len(reader.blocks(end=self.start - timedelta(days=1))), 1)
+            self.assertEqual(list(reader.events(end=self.start - timedelta(days=1))), [])
+            self.assertEqual([event['name'] for event in reader.events(start=self.start)], ['timed'])
+            self.assertEqual(len(list(reader.events())), 2)
+
+    def test_non_ascii_events(self):
+        backend = self.create_backend(serializer='fast')
+        event = {'name': 'unicode', 'data': {'text': 'line\u2028separator café ☃'}}
+        backend.send(event)
+        backend.close()
+
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(list(reader.events()), [event])
+
+    def test_incomplete_index_entry(self):
+        backend = self.create_backend()
+        self.write_days(backend, days=2)
+        backend.close()
+        with open(self.path + '.idx', 'a', encoding='utf-8') as index_file:
+            index_file.write('{"offset": ')
+
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(len(reader.index), 2)
+
+    def test_empty_archive(self):
+        for suffix in ('', '.idx'):
+            with open(self.path + suffix, 'w', encoding='utf-8'):
+                pass
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(list(reader.events()), [])
+
+    def test_rotation(self):
+        backend = self.create_backend(rotate_bytes=1, backup_count=2)
+        for index in range(3):
+            with patch('eventtracking.backends.file.time.strftime', return_value=f'2024050{index}-000000'):
+                backend.send({'name': str(index), 'timestamp': self.start})
+                backend.flush()
+
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            [
+                'tracking.arc.20240501-000000',
+                'tracking.arc.20240501-000000.idx',
+                'tracking.arc.20240502-000000',
+                'tracking.arc.20240502-000000.idx',
+            ],
+        )
+        with ArchiveReader(os.path.join(self.directory, 'tracking.arc.20240502-000000')) as reader:
+            self.assertEqual([event['name'] for event in reader.events()], ['2'])
+
+    def test_remove_without_index(self):
+        backend = self.create_backend()
+        with open(self.path + '.1', 'w', encoding='utf-8'):
+            pass
+        backend.remove(self.path + '.1')
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_after_fork(self):
+        backend = self.create_backend()
+        backend.send({'name': 'parent'})
+        backend.flush()
+        inherited = (backend.file, backend.index_file)
+        backend.batcher._reset()  # pylint: disable=protected-access
+        backend._after_fork()  # pylint: disable=protected-access
+        self.assertIsNone(backend.index_file)
+        for inherited_file in inherited:
+            inherited_file.close()
+
+    def test_event_time(self):
+        self.assertEqual(event_time(self.start), self.start.timestamp())
+        self.assertEqual(event_time(self.start.isoformat()), self.start.timestamp())
+        self.assertIsNone(event_time('not a time'))
+        # Naive times are UTC, whatever the local time zone
+        naive = self.start.replace(tzinfo=None)
+        with patch.dict(os.environ, TZ='America/New_York'):
+            time.tzset()
+            self.addCleanup(time.tzset)
+            self.assertEqual(event_time(naive), self.start.timestamp())
+            self.assertEqual(event_time(naive.isoformat()), self.start.timestamp())
+        self.assertIsNone(event_time(None))
@@ -0,0 +1,253 @@
+"""Unit tests for the asyncio driven Mongo backend, using an in-process stand-in for `AsyncMongoClient`"""
+
+import asyncio
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import bson
+from pymongo.errors import PyMongoError
+
+from eventtracking.backends.async_mongodb import AsyncMongoBackend
+
+
+class FakeAsyncCollection:
+    """Record the batches inserted in a collection, allowing inserts to be held until released"""
+
+    def __init__(self):
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+
+    async def insert_many(self, documents, ordered=True):
+        """Record the documents once the insert is released"""
+        assert not ordered
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            while not self.release.is_set():
+                await asyncio.sleep(0.001)
+            if self.error is not None:
+                raise self.error
+            self.batches.append([bson.decode(document.raw) for document in documents])
+        finally:
+            self.in_flight -= 1
+
+    async def index_information(self):
+        """Return the existing indexes"""
+        return self.indexes
+
+    async def create_index(self, keys):
+        """Record the index"""
+        name = '_'.join(f'{key}_{direction}' for key, direction in keys)
+        self.indexes[name] = {'key': keys}
+        return name
+
+
+class FakeAsyncMongoClient:
+    """Stand-in for `AsyncMongoClient` holding a single collection"""
+
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.options = kwargs
+        self.collection = FakeAsyncCollection()
+        self.closed = False
+        self.instances.append(self)
+
+    def __getitem__(self, name):
+        return {'events': self.collection}
+
+    async def close(self):
+        """Close the client"""
+        self.closed = True
+
+
+class TestAsyncMongoBackend(TestCase):
+    """Unit tests for the asyncio driven Mongo backend"""
+
+    def setUp(self):
+        super().setUp()
+        FakeAsyncMongoClient.instances = []
+        patcher = patch('eventtracking.backends.async_mongodb.AsyncMongoClient', FakeAsyncMongoClient)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def create_backend(self, **kwargs):
+        """Create a backend closed at the end of the test"""
+        backend = AsyncMongoBackend(**kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    @property
+    def client(self):
+        """The stand-in client created by the backend"""
+        self.assertEqual(len(FakeAsyncMongoClient.instances), 1)
+        return FakeAsyncMongoClient.instances[0]
+
+    def inserted(self):
+        """Return the names of the inserted events"""
+        return [event['name'] for batch in self.client.collection.batches for event in batch]
+
+    def test_events_are_inserted(self):
+        backend = self.create_backend(create_indexes=None)
+        for index in range(5):
+            backend.send({'name': str(index)})
+        self.assertTrue(backend.flush(timeout=5))
+        self.assertEqual(sorted(self.inserted()), ['0', '1', '2', '3', '4'])
+        self.assertEqual(self.client.options, {'host': 'localhost', 'port': 27017, 'w': 0, 'tz_aware': True})
+
+    def test_no_loop_until_first_event(self):
+        backend = self.create_backend()
+        self.assertIsNone(backend.thread)
+        self.assertEqual(FakeAsyncMongoClient.instances, [])
+        backend.close()
+        self.assertEqual(FakeAsyncMongoClient.instances, [])
+
+    def test_send_does_not_block(self):
+        backend = self.create_backend(create_indexes=None)
+        backend.send({'name': 'first'})
+        backend.flush(timeout=5)
+        self.client.collection.release.clear()
+        for index in range(100):
+            backend.send({'name': str(index)})
+        self.assertFalse(backend.flush(timeout=0.01))
+
+        self.client.collection.release.set()
+        self.assertTrue(backend.flush(timeout=5))
+        self.assertEqual(len(self.inserted()), 101)
+
+    def test_inserts_are_pipelined(self):
+        backend = self.create_backend(create_indexes=None, batch_size=2, concurrency=3)
+        backend.send({'name': 'first'})
+        backend.flush(timeout=5)
+        collection = self.client.collection
+        collection.release.clear()
+        for index in range(20):
+            backend.send({'name': str(index)})
+        deadline = time.time() + 5
+        while collection.in_flight < 3 and time.time() < deadline:
+            time.sleep(0.001)
+        collection.release.set()
+        self.assertTrue(backend.flush(timeout=5))
+        self.assertEqual(collection.max_in_flight, 3)
+        self.assertTrue(all(len(batch) <= 2 for batch in collection.batches))
+        self.assertEqual(len(self.inserted()), 21)
+
+    def test_full_queue(self):
+        backend = self.create_backend(create_indexes=None, max_queue_size=2)
+        backend.send({'name': 'first'})
+        backend.flush(timeout=5)
+        self.client.collection.release.clear()
+        for index in range(10):
+            backend.send({'name': str(index)})
+        self.client.collection.release.set()
+        backend.flush(timeout=5)
+        self.assertGreater(backend.dropped_events, 0)
+        self.assertEqual(len(self.inserted()) + backend.dropped_events, 11)
+
+    def test_close_inserts_queued_events(self):
+        backend = self.create_backend(create_indexes=None)
+        for index in range(3):
+            backend.send({'name': str(index)})
+        backend.close()
+        self.assertEqual(sorted(self.inserted()), ['0', '1', '2'])
+        self.assertTrue(self.client.closed)
+        self.assertFalse(backend.thread.is_alive())
+
+        backend.send({'name': 'late'})
+        self.assertEqual(backend.dropped_events, 1)
+        backend.close()
+
+    def test_events_are_encoded_when_sent(self):
+        backend = self.create_backend(create_indexes=None)
+        event = {'name': 'first', 'data': {'value': 1}}
+        backend.send(event)
+        event['data']['value'] = 2
+        self.assertTrue(backend.flush(timeout=5))
+        (document,), = self.client.collection.batches
+        self.assertEqual(document['data'], {'value': 1})
+        self.assertNotIn('_id', event)
+
+    def test_encoding_error(self):
+        backend = self.create_backend(create_indexes=None)
+        with self.assertLogs('eventtracking.backends.async_mongodb', level='ERROR'):
+            backend.send({'name': 'invalid', 'data': object()})
+        backend.send({'name': 'valid'})
+        self.assertTrue(backend.flush(timeout=5))
+        self.assertEqual(self.inserted(), ['valid'])
+        self.assertEqual(backend.dropped_events, 0)
+
+    def test_queue_is_bounded_by_bytes(self):
+        backend = self.create_backend(create_indexes=None, max_queue_bytes=100)
+        backend.send({'name': 'first'})
+        backend.flush(timeout=5)
+        self.client.collection.release.clear()
+        backend.send({'name': 'large', 'data': 'x' * 200})
+        self.assertEqual(backend.dropped_events, 1)
+        backend.send({'name': 'small'})
+        self.client.collection.release.set()
+        self.assertTrue(backend.flush(timeout=5))
+        self.assertEqual(self.inserted(), ['first', 'small'])
+        self.assertEqual(backend.queued_bytes, 0)
+
+    def test_insertion_error(self):
+        backend = self.create_backend(create_indexes=None)
+        backend.send({'name': 'first'})
+        backend.flush(timeout=5)
+        self.client.collection.error = PyMongoError()
+        with self.assertLogs('eventtracking.backends.async_mongodb', level='ERROR'):
+            backend.send({'name': 'lost'})
+            self.assertTrue(backend.flush(timeout=5))
+
+    def test_indexes(self):
+        backend = self.create_backend()
+        with self.assertLogs('eventtracking.backends.async_mongodb', level='INFO') as logs:
+            backend.send({'name': 'first'})
+            backend.close()
+        self.assertIn("['time_-1', 'name_1']", logs.output[0])
+        self.assertEqual(sorted(self.client.collection.indexes), ['_id_', 'name_1', 'time_-1'])
+
+    def test_index_errors_are_logged(self):
+        backend = self.create_backend()
+        with patch.object(FakeAsyncCollection, 'index_information', side_effect=PyMongoError):
+            with self.assertLogs('eventtracking.backends.async_mongodb', level='ERROR'):
+                backend.send({'name': 'first'})
+                backend.close()
+        self.assertEqual(self.inserted(), ['first'])
+
+    def test_after_fork(self):
+        backend = self.create_backend(create_indexes=None)
+        backend.send({'name': 'parent'})
+        parent_thread = backend.thread
+        # The thread of the parent does not exist in a child process, stop it
+        backend.close()
+        backend.closed = False
+
+        backend._reset()  # pylint: disable=protected-access
+        backend.send({'name': 'child'})
+        self.assertIsNot(backend.thread, parent_thread)
+        backend.close()
+        self.assertEqual(len(FakeAsyncMongoClient.instances), 2)
+        self.assertEqual(FakeAsyncMongoClient.instances[1].collection.batches, [[{'name': 'child'}]])
+
+    def test_credentials(self):
+        backend = self.create_backend(user='user', password='secret', create_indexes=None)
+        backend.send({'name': 'first'})
+        backend.flush(timeout=5)
+        self.assertEqual(self.client.options['username'], 'user')
+        self.assertEqual(self.client.options['password'], 'secret')
+
+    def test_unknown_create_indexes(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown value for create_indexes'):
+            AsyncMongoBackend(create_indexes='init')
+
+    def test_requires_async_client(self):
+        with patch('eventtracking.backends.async_mongodb.AsyncMongoClient', None):
+            with self.assertRaisesRegex(ValueError, 'requires pymongo 4.10'):
+                AsyncMongoBackend()
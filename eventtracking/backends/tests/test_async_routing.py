@@ -1,9 +1,12 @@
 """
 Test the async routing backend.
 """
+import json
+import time
 from unittest import TestCase
 
-from unittest.mock import sentinel, patch
+from unittest.mock import MagicMock, sentinel, patch
+from celery import Celery
 from eventtracking.backends.async_routing import AsyncRoutingBackend
 
 
@@ -30,3 +33,114 @@ class TestAsyncRoutingBackend(TestCase):
         processed_event = backend.process_event(self.sample_event)
         backend.send(self.sample_event)
         mocked_send_event.delay.assert_called_once_with('test', processed_event)
+
+    @patch('eventtracking.backends.async_routing.send_event')
+    def test_send_batch(self, mocked_send_event):
+        backend = AsyncRoutingBackend(backend_name='test')
+        backend.send_batch([self.sample_event, self.sample_event])
+        self.assertEqual(mocked_send_event.delay.call_count, 2)
+
+    @patch('eventtracking.backends.async_routing.send_event')
+    def test_small_event_is_not_claim_checked(self, mocked_send_event):
+        blob_store = MagicMock()
+        backend = AsyncRoutingBackend(backend_name='test', blob_store=blob_store)
+        backend.send(self.sample_event)
+        mocked_send_event.delay.assert_called_once_with('test', self.sample_event)
+        blob_store.put.assert_not_called()
+
+    @patch('eventtracking.backends.async_routing.send_event')
+    def test_large_event_is_claim_checked(self, mocked_send_event):
+        blob_store = MagicMock()
+        blob_store.put.return_value = sentinel.claim_check
+        backend = AsyncRoutingBackend(backend_name='test', blob_store=blob_store, claim_check_threshold=10)
+        backend.send(self.sample_event)
+
+        self.assertEqual(json.loads(blob_store.put.call_args.args[0]), self.sample_event)
+        mocked_send_event.delay.assert_called_once_with(
+            'test', {'name': self.sample_event['name']}, claim_check=sentinel.claim_check
+        )
+
+    def test_unknown_option(self):
+        with self.assertRaises(TypeError):
+            AsyncRoutingBackend(backend_name='test', claim_check_treshold=10)  # pylint: disable=unexpected-keyword-arg
+
+
+@patch('eventtracking.backends.async_routing.send_event')
+class TestAsyncRoutingBackendSpool(TestCase):
+    """
+    Test the spooling of the async routing backend.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.event = {'name': str(sentinel.name)}
+        self.spool = MagicMock()
+        self.backend = AsyncRoutingBackend(backend_name='test', spool=self.spool, enqueue_timeout=0.5)
+        self.backend.spool_drainer = MagicMock()
+
+    def test_enqueue(self, mocked_send_event):
+        producer = mocked_send_event.app.producer_or_acquire.return_value.__enter__.return_value
+
+        self.backend.send(self.event)
+
+        producer.connection.ensure_connection.assert_called_once_with(max_retries=0, timeout=0.5)
+        mocked_send_event.apply_async.assert_called_once_with(
+            ('test', self.event), {}, producer=producer, retry=False, timeout=0.5
+        )
+        self.spool.append.assert_not_called()
+
+    def test_broker_failure_is_spooled(self, mocked_send_event):
+        mocked_send_event.apply_async.side_effect = OSError
+
+        self.backend.send(self.event)
+        self.backend.send(self.event)
+
+        mocked_send_event.apply_async.assert_called_once()
+        self.spool.append.assert_called_with({'args': ['test', self.event], 'kwargs': {}})
+        self.assertEqual(self.spool.append.call_count, 2)
+        self.backend.spool_drainer.notify.assert_called()
+
+    def test_broker_is_probed_by_a_single_request(self, mocked_send_event):
+        self.backend.broker_unavailable_until = 1
+        spooled_while_probing = []
+
+        def probe(*_args, **_kwargs):
+            """Send another event while the broker is being probed"""
+            self.backend.send(self.event)
+            spooled_while_probing.append(self.spool.append.call_count)
+
+        mocked_send_event.apply_async.side_effect = probe
+
+        self.backend.send(self.event)
+
+        mocked_send_event.apply_async.assert_called_once()
+        self.assertEqual(spooled_while_probing, [1])
+        self.assertEqual(self.backend.broker_unavailable_until, 0)
+
+    def test_refused_broker_connection(self, mocked_send_event):
+        app = Celery(broker='amqp://guest@127.0.0.1:1//')
+        mocked_send_event.app = app
+
+        @app.task
+        def task():
+            """A task that is never run"""
+
+        mocked_send_event.apply_async = task.apply_async
+
+        start = time.monotonic()
+        self.backend.send(self.event)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.spool.append.assert_called_once_with({'args': ['test', self.event], 'kwargs': {}})
+
+    def test_enqueue_spooled(self, mocked_send_event):
+        self.backend.broker_unavailable_until = float('inf')
+        producer = mocked_send_event.app.producer_or_acquire.return_value.__enter__.return_value
+
+        self.backend.enqueue_spooled([{'args': ['test', self.event], 'kwargs': {}}])
+
+        producer.connection.ensure_connection.assert_called_once_with(max_retries=0, timeout=0.5)
+        mocked_send_event.apply_async.assert_called_once_with(
+            ['test', self.event], {}, producer=producer, retry=False, timeout=0.5
+        )
+        self.assertEqual(self.backend.broker_unavailable_until, 0)
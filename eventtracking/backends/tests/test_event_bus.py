@@ -3,14 +3,15 @@ Test the async routing backend.
 """
 
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 from unittest import TestCase
 from unittest.mock import patch
 
 from django.test import override_settings
 from openedx_events.analytics.data import TrackingLogData
 
-from eventtracking.backends.event_bus import EventBusRoutingBackend
+from eventtracking.backends.event_bus import EventBusRoutingBackend, EventNameMatcher, parse_timestamp
+from eventtracking.backends.tests import PerformanceTestCase
 
 
 class TestAsyncRoutingBackend(TestCase):
@@ -33,6 +34,12 @@ class TestAsyncRoutingBackend(TestCase):
         backend.send(self.sample_event)
         mocked_send_event.assert_called_once_with(self.sample_event)
 
+    @patch("eventtracking.backends.event_bus.EventBusRoutingBackend.send")
+    def test_send_batch(self, mocked_send_event):
+        backend = EventBusRoutingBackend()
+        backend.send_batch([self.sample_event, self.sample_event])
+        self.assertEqual(mocked_send_event.call_count, 2)
+
     @override_settings(
         SEND_TRACKING_EVENT_EMITTED_SIGNAL=True,
         EVENT_BUS_TRACKING_LOGS=["sample_event"],
@@ -66,3 +73,108 @@ class TestAsyncRoutingBackend(TestCase):
         backend.send(self.sample_event)
         mock_is_enabled.assert_called_once()
         mock_send_event.assert_not_called()
+
+    @override_settings(
+        SEND_TRACKING_EVENT_EMITTED_SIGNAL=True,
+        EVENT_BUS_TRACKING_LOGS=["other_event"],
+    )
+    @patch("eventtracking.backends.event_bus.TRACKING_EVENT_EMITTED.send_event")
+    def test_event_is_not_allowed(self, mock_send_event):
+        EventBusRoutingBackend().send(self.sample_event)
+        mock_send_event.assert_not_called()
+
+    @override_settings(SEND_TRACKING_EVENT_EMITTED_SIGNAL=True)
+    @patch("eventtracking.backends.event_bus.TRACKING_EVENT_EMITTED.send_event")
+    def test_allowed_names_are_refreshed_when_the_setting_changes(self, mock_send_event):
+        backend = EventBusRoutingBackend()
+        with override_settings(EVENT_BUS_TRACKING_LOGS=["other_event"]):
+            backend.send(self.sample_event)
+            mock_send_event.assert_not_called()
+        with override_settings(EVENT_BUS_TRACKING_LOGS=["sample_*"]):
+            backend.send(self.sample_event)
+            mock_send_event.assert_called_once()
+
+    @override_settings(
+        SEND_TRACKING_EVENT_EMITTED_SIGNAL=True,
+        EVENT_BUS_TRACKING_LOGS=["sample_event"],
+    )
+    @patch("eventtracking.backends.event_bus.TRACKING_EVENT_EMITTED.send_event")
+    def test_serializer(self, mock_send_event):
+        self.sample_event["data"] = {"foo": "bar", "unicode": "café"}
+        EventBusRoutingBackend(serializer="fast").send(self.sample_event)
+        tracking_log = mock_send_event.call_args.kwargs["tracking_log"]
+        self.assertEqual(json.loads(tracking_log.data), self.sample_event["data"])
+        self.assertEqual(json.loads(tracking_log.context), self.sample_event["context"])
+
+    def test_unknown_serializer(self):
+        with self.assertRaisesRegex(ValueError, "Unknown serializer"):
+            EventBusRoutingBackend(serializer="unknown")
+
+    def test_parse_timestamp(self):
+        expected = datetime(2020, 1, 1, 12, 12, 12, 500000, tzinfo=timezone.utc)
+        for value in ("2020-01-01T12:12:12.500000+00:00", "2020-01-01T12:12:12.5Z", "2020-01-01T12:12:12.500000+0000"):
+            self.assertEqual(parse_timestamp(value), expected)
+        with self.assertRaises(ValueError):
+            parse_timestamp("not a timestamp")
+
+
+class TestEventNameMatcher(TestCase):
+    """
+    Test the compiled set of event names allowed on the event bus.
+    """
+
+    def test_exact_names(self):
+        matcher = EventNameMatcher(["edx.course.enrollment.activated", "problem_check"])
+        self.assertIn("problem_check", matcher)
+        self.assertNotIn("problem_check.extra", matcher)
+        self.assertNotIn(None, matcher)
+        self.assertEqual(matcher.matches, {})
+
+    def test_prefixes(self):
+        matcher = EventNameMatcher(["edx.course.enrollment.*"])
+        self.assertEqual(matcher.prefixes, ("edx.course.enrollment.",))
+        self.assertIsNone(matcher.regex)
+        self.assertIn("edx.course.enrollment.activated", matcher)
+        self.assertNotIn("edx.course.grade.changed", matcher)
+        self.assertNotIn(None, matcher)
+
+    def test_wildcards(self):
+        matcher = EventNameMatcher(["edx.*.completed", "problem_?heck", "[ab]_event"])
+        self.assertEqual(matcher.prefixes, ())
+        self.assertIn("edx.video.completed", matcher)
+        self.assertIn("problem_check", matcher)
+        self.assertIn("a_event", matcher)
+        self.assertNotIn("c_event", matcher)
+        self.assertNotIn("edx.video.completed.extra", matcher)
+
+    def test_matches_are_cached(self):
+        matcher = EventNameMatcher(["edx.*"])
+        with patch.object(matcher, "match", wraps=matcher.match) as mock_match:
+            for _ in range(3):
+                self.assertIn("edx.video.played", matcher)
+                self.assertNotIn("other", matcher)
+        self.assertEqual(mock_match.call_count, 2)
+
+    def test_cache_is_bounded(self):
+        matcher = EventNameMatcher(["edx.*"])
+        with patch("eventtracking.backends.event_bus.MAX_CACHED_NAMES", 2):
+            for name in ("a", "b", "c"):
+                self.assertNotIn(name, matcher)
+        self.assertEqual(matcher.matches, {"c": False})
+
+
+class TestEventBusRoutingBackendPerformance(PerformanceTestCase):
+    """
+    Measure the time it takes to reject the events that are not sent to the event bus.
+    """
+
+    @override_settings(
+        SEND_TRACKING_EVENT_EMITTED_SIGNAL=True,
+        EVENT_BUS_TRACKING_LOGS=[f"edx.allowed.event.{index}" for index in range(200)] + ["edx.course.*"],
+    )
+    def test_rejected_events(self):
+        backend = EventBusRoutingBackend()
+        event = {"name": "edx.ui.lms.link_clicked", "data": {}, "context": {}}
+        with self.assert_execution_time_less_than_threshold():
+            for _ in range(self.num_events):
+                backend.send(event)
@@ -0,0 +1,307 @@
+"""Test the buffered file backend"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from pytz import UTC
+
+from eventtracking.backends.file import BufferedFileBackend
+from eventtracking.backends.logger import LoggerBackend
+from eventtracking.backends.tests import PerformanceTestCase
+
+
+class ShortWriteFile:
+    """Wrap a file whose `write` writes at most 5 bytes at once, like a raw file interrupted by a signal"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        """Write the first bytes of `data`"""
+        return self.file.write(bytes(data[:5]))
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class TestBufferedFileBackend(TestCase):
+    """Test the buffered file backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'tracking.log')
+
+    def create_backend(self, **kwargs):
+        """Create a backend writing to the temporary file, closed at the end of the test"""
+        kwargs.setdefault('flush_interval', 60)
+        backend = BufferedFileBackend(path=self.path, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def read_events(self, path=None):
+        """Return the events written to `path`"""
+        with open(path or self.path, encoding='utf-8') as events_file:
+            return [json.loads(line) for line in events_file]
+
+    def test_requires_path(self):
+        with self.assertRaisesRegex(ValueError, 'requires a "path"'):
+            BufferedFileBackend()
+
+    def test_unknown_serializer(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown serializer'):
+            BufferedFileBackend(path=self.path, serializer='unknown')
+
+    def test_events_are_buffered(self):
+        backend = self.create_backend()
+        backend.send({'name': 'foo'})
+        self.assertFalse(os.path.exists(self.path))
+
+        backend.flush()
+        self.assertEqual(self.read_events(), [{'name': 'foo'}])
+
+    def test_same_format_as_logger_backend(self):
+        event = {
+            'name': 'test',
+            'time': datetime(2012, 5, 1, 7, 27, 1, 200, tzinfo=UTC),
+            'data': {'unicode': 'café ☃', 'nested': {'list': [1, 2]}},
+        }
+        logger_path = os.path.join(self.directory, 'logger.log')
+        handler = logging.FileHandler(logger_path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(fmt='%(message)s'))
+        test_logger = logging.getLogger('test.file.format')
+        test_logger.setLevel(logging.INFO)
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+
+        backend = self.create_backend()
+        for _ in range(2):
+            LoggerBackend(name='test.file.format').send(event)
+            backend.send(event)
+        backend.close()
+        handler.flush()
+
+        with open(logger_path, 'rb') as logger_file, open(self.path, 'rb') as events_file:
+            self.assertEqual(events_file.read(), logger_file.read())
+
+    def test_writer_thread_flushes_full_buffer(self):
+        backend = self.create_backend(buffer_size=1)
+        backend.send({'name': 'foo'})
+        self.wait_for_file()
+        self.assertEqual(self.read_events(), [{'name': 'foo'}])
+
+    def test_writer_thread_flushes_periodically(self):
+        backend = self.create_backend(flush_interval=0.01)
+        backend.send({'name': 'foo'})
+        backend.send({'name': 'bar'})
+        self.wait_for_file()
+        self.assertEqual(self.read_events(), [{'name': 'foo'}, {'name': 'bar'}])
+
+    def wait_for_file(self):
+        """Wait for the writer thread to create the file"""
+        deadline = time.time() + 5
+        while not os.path.exists(self.path) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_write_failure(self):
+        backend = self.create_backend(flush_interval=0.01)
+        with patch.object(backend, 'write', side_effect=OSError) as mock_write:
+            with self.assertLogs('eventtracking.batching', level='ERROR'):
+                backend.send({'name': 'foo'})
+                deadline = time.time() + 5
+                while not mock_write.called and time.time() < deadline:
+                    time.sleep(0.01)
+
+    def test_oversized_events_are_dropped(self):
+        backend = self.create_backend(max_event_size=20)
+        backend.send({'name': 'x' * 20})
+        backend.send({'name': 'foo'})
+        backend.flush()
+        self.assertEqual(self.read_events(), [{'name': 'foo'}])
+        self.assertEqual(backend.dropped_events, 1)
+
+    def test_full_buffer_drops_events(self):
+        backend = self.create_backend(max_buffer_size=40)
+        for i in range(3):
+            backend.send({'name': str(i)})
+        backend.flush()
+        self.assertEqual(self.read_events(), [{'name': '0'}, {'name': '1'}])
+        self.assertEqual(backend.dropped_events, 1)
+
+    def test_close_writes_the_buffer(self):
+        backend = self.create_backend()
+        backend.send({'name': 'foo'})
+        backend.close()
+        self.assertEqual(self.read_events(), [{'name': 'foo'}])
+        self.assertIsNone(backend.file)
+
+        backend.send({'name': 'bar'})
+        backend.close()
+        self.assertEqual(self.read_events(), [{'name': 'foo'}])
+
+    def test_events_are_appended(self):
+        with open(self.path, 'w', encoding='utf-8') as events_file:
+            events_file.write('{"name": "existing"}\n')
+        backend = self.create_backend()
+        backend.send({'name': 'foo'})
+        backend.flush()
+        self.assertEqual(self.read_events(), [{'name': 'existing'}, {'name': 'foo'}])
+
+    def test_path_of_each_process(self):
+        backend = BufferedFileBackend(path=os.path.join(self.directory, 'tracking-{pid}.log'), flush_interval=60)
+        self.addCleanup(backend.close)
+        self.assertEqual(backend.path, os.path.join(self.directory, f'tracking-{os.getpid()}.log'))
+
+        with patch('eventtracking.backends.file.os.getpid', return_value=123):
+            backend._after_fork()  # pylint: disable=protected-access
+            backend.send({'name': 'child'})
+            backend.flush()
+            self.assertEqual(self.read_events(os.path.join(self.directory, 'tracking-123.log')), [{'name': 'child'}])
+            backend.close()
+
+    def test_short_writes(self):
+        backend = self.create_backend()
+        backend._open()  # pylint: disable=protected-access
+        backend.file = ShortWriteFile(backend.file)
+        backend.send({'name': 'foo', 'data': {'bar': 'baz'}})
+        backend.send({'name': 'qux'})
+        backend.flush()
+        self.assertEqual(self.read_events(), [{'name': 'foo', 'data': {'bar': 'baz'}}, {'name': 'qux'}])
+
+    def test_size_rotation(self):
+        backend = self.create_backend(rotate_bytes=30)
+        backend.send({'name': 'foo'})
+        backend.flush()
+        self.assertEqual(os.listdir(self.directory), ['tracking.log'])
+
+        backend.send({'name': 'bar'})
+        backend.flush()
+        backend.send({'name': 'baz'})
+        backend.flush()
+
+        rotated = sorted(name for name in os.listdir(self.directory) if name != 'tracking.log')
+        self.assertEqual(len(rotated), 1)
+        self.assertEqual(self.read_events(os.path.join(self.directory, rotated[0])), [{'name': 'foo'}, {'name': 'bar'}])
+        self.assertEqual(self.read_events(), [{'name': 'baz'}])
+
+    def test_time_rotation(self):
+        backend = self.create_backend(rotate_interval=3600)
+        backend.send({'name': 'foo'})
+        backend.flush()
+        self.assertEqual(os.listdir(self.directory), ['tracking.log'])
+
+        with patch('eventtracking.backends.file.time.time', return_value=time.time() + 3600):
+            backend.send({'name': 'bar'})
+            backend.flush()
+        self.assertNotIn('tracking.log', os.listdir(self.directory))
+
+    def test_rotated_name_collision(self):
+        backend = self.create_backend(rotate_bytes=1)
+        with patch('eventtracking.backends.file.time.strftime', return_value='20130101-000000'):
+            for name in ('foo', 'bar', 'baz'):
+                backend.send({'name': name})
+                backend.flush()
+
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ['tracking.log.20130101-000000', 'tracking.log.20130101-000000.1', 'tracking.log.20130101-000000.2'],
+        )
+
+    def test_backup_count(self):
+        backend = self.create_backend(rotate_bytes=1, backup_count=2)
+        for index in range(4):
+            with patch('eventtracking.backends.file.time.strftime', return_value=f'2013010{index}-000000'):
+                backend.send({'name': str(index)})
+                backend.flush()
+
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ['tracking.log.20130102-000000', 'tracking.log.20130103-000000'],
+        )
+
+    @patch('eventtracking.backends.file.os.fsync')
+    def test_fsync_is_batched(self, mock_fsync):
+        backend = self.create_backend(fsync_interval=3600)
+        for name in ('foo', 'bar'):
+            backend.send({'name': name})
+            backend.flush()
+        self.assertEqual(mock_fsync.call_count, 1)
+
+        backend.close()
+        self.assertEqual(mock_fsync.call_count, 2)
+
+    @patch('eventtracking.backends.file.os.fsync')
+    def test_fsync_every_write(self, mock_fsync):
+        backend = self.create_backend(fsync_interval=0, rotate_bytes=30)
+        for name in ('foo', 'bar'):
+            backend.send({'name': name})
+            backend.flush()
+        # One fsync per write and one before the rotation
+        self.assertEqual(mock_fsync.call_count, 3)
+
+    @patch('eventtracking.backends.file.os.fsync')
+    def test_no_fsync_by_default(self, mock_fsync):
+        backend = self.create_backend(rotate_bytes=1)
+        backend.send({'name': 'foo'})
+        backend.close()
+        mock_fsync.assert_not_called()
+
+    def test_after_fork(self):
+        backend = self.create_backend()
+        backend.send({'name': 'parent'})
+        backend.flush()
+        backend.send({'name': 'buffered in parent'})
+        inherited = backend.file
+
+        # pylint: disable=protected-access
+        backend.batcher._reset()
+        backend._after_fork()
+        inherited.close()
+        self.assertIsNone(backend.batcher.thread)
+        self.assertIsNone(backend.file)
+
+        backend.send({'name': 'child'})
+        self.assertIsNotNone(backend.batcher.thread)
+        backend.close()
+        self.assertEqual(self.read_events(), [{'name': 'parent'}, {'name': 'child'}])
+
+
+class TestBufferedFileBackendPerformance(PerformanceTestCase):
+    """Compare the time it takes to write events to a file with a LoggerBackend and a BufferedFileBackend"""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def send_events(self, backend):
+        """Send `num_events` events to `backend`"""
+        for i in range(self.num_events):
+            backend.send({'name': 'perf.event', 'data': {'sequence': i, 'payload': self.random_payload}})
+
+    def test_logger_backend(self):
+        handler = logging.FileHandler(os.path.join(self.directory, 'logger.log'))
+        handler.setFormatter(logging.Formatter(fmt='%(message)s'))
+        test_logger = logging.getLogger('test.file.performance')
+        test_logger.setLevel(logging.INFO)
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+
+        with self.assert_execution_time_less_than_threshold():
+            self.send_events(LoggerBackend(name='test.file.performance', max_event_size=None))
+
+    def test_buffered_file_backend(self):
+        backend = BufferedFileBackend(path=os.path.join(self.directory, 'events.log'), max_event_size=None)
+        with self.assert_execution_time_less_than_threshold():
+            self.send_events(backend)
+            backend.close()
@@ -3,13 +3,28 @@
 
 import json
 import datetime
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from copy import copy, deepcopy
 from unittest import TestCase
 
+from unittest.mock import MagicMock
 from unittest.mock import patch
 from unittest.mock import sentinel
 import pytz
 
-from eventtracking.backends.logger import LoggerBackend
+from eventtracking.backends.logger import (
+    SERIALIZERS,
+    EncodedEvent,
+    LoggerBackend,
+    encode_event,
+    get_serializer,
+    minimum_encoded_size,
+)
 
 
 class TestLoggerBackend(TestCase):
@@ -91,3 +106,302 @@ class TestLoggerBackend(TestCase):
         backend.send({})
         self.assertFalse(self.mock_logger.info.called)
         self.mock_logger.warning.assert_called_once_with('{}')
+
+
+class TestEncodedEvent(TestCase):
+    """Test the caching of event encodings"""
+
+    def setUp(self):
+        super().setUp()
+        self.event = EncodedEvent({'name': 'foo', 'data': {'bar': datetime.date(2012, 5, 7)}})
+
+    def test_encoding_is_cached(self):
+        mock_dumps = MagicMock(wraps=get_serializer())
+        with patch.dict(SERIALIZERS, json=mock_dumps):
+            self.assertEqual(encode_event(self.event), '{"name": "foo", "data": {"bar": "2012-05-07"}}')
+            self.assertEqual(encode_event(self.event), '{"name": "foo", "data": {"bar": "2012-05-07"}}')
+            self.assertEqual(encode_event(self.event, 'data'), '{"bar": "2012-05-07"}')
+            self.assertEqual(encode_event(self.event, 'data'), '{"bar": "2012-05-07"}')
+        self.assertEqual(mock_dumps.call_count, 2)
+
+    def test_plain_dict(self):
+        self.assertEqual(encode_event({'name': 'foo'}), '{"name": "foo"}')
+        self.assertEqual(encode_event({'name': 'foo'}, 'context'), 'null')
+
+    def test_mutation_invalidates_encoding(self):
+        mutations = [
+            lambda event: event.__setitem__('name', 'baz'),
+            lambda event: event.__delitem__('data'),
+            lambda event: event.update(name='baz'),
+            lambda event: event.pop('data'),
+            lambda event: event.popitem(),
+            lambda event: event.setdefault('context', {}),
+            lambda event: event.clear(),
+            lambda event: event.__ior__({'name': 'baz'}),
+            lambda event: event.invalidate() or event['data'].clear(),
+        ]
+        for mutate in mutations:
+            event = EncodedEvent({'name': 'foo', 'data': {'bar': 1}})
+            encode_event(event)
+            mutate(event)
+            self.assertEqual(json.loads(encode_event(event)), dict(event))
+
+    def test_deepcopy_keeps_encoding(self):
+        encoded = encode_event(self.event)
+        copied = deepcopy(self.event)
+
+        self.assertIsInstance(copied, EncodedEvent)
+        self.assertIsNot(copied['data'], self.event['data'])
+        self.assertIs(encode_event(copied), encoded)
+
+    def test_copy_has_its_own_cache(self):
+        encoded = encode_event(self.event)
+        copied = copy(self.event)
+        copied['name'] = 'bar'
+
+        self.assertIsInstance(copied, EncodedEvent)
+        self.assertIs(encode_event(self.event), encoded)
+        self.assertNotEqual(encode_event(copied), encoded)
+
+    def test_pickle(self):
+        encode_event(self.event)
+        unpickled = pickle.loads(pickle.dumps(self.event))
+
+        self.assertIsInstance(unpickled, EncodedEvent)
+        self.assertEqual(unpickled, self.event)
+        self.assertEqual(unpickled.encodings, {})
+        self.assertEqual(encode_event(unpickled), encode_event(self.event))
+
+
+class TestOversizedEvents(TestCase):
+    """Test the handling of events larger than `max_event_size`"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch('eventtracking.backends.logger.logging')
+        self.mock_logger = patcher.start().getLogger.return_value
+        self.addCleanup(patcher.stop)
+        self.event = {
+            'name': 'big',
+            'context': {'user_id': 1},
+            'data': {'small': 'a', 'medium': 'b' * 50, 'large': 'c' * 100},
+        }
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.spill_file = os.path.join(directory, 'spill.log')
+
+    def logged_event(self):
+        """Return the single event that was logged"""
+        self.mock_logger.info.assert_called_once()
+        return json.loads(self.mock_logger.info.call_args.args[0])
+
+    def test_drop(self):
+        backend = LoggerBackend(max_event_size=100)
+        backend.send(self.event)
+        self.mock_logger.info.assert_not_called()
+        self.assertEqual(backend.oversized_events, {'dropped': 1})
+
+    def test_large_events_are_not_encoded(self):
+        serializer = MagicMock(wraps=get_serializer())
+        event = {'name': 'big', 'data': {'state': 'x' * 100}}
+        with patch.dict(SERIALIZERS, json=serializer):
+            self.assertIsNone(encode_event(event, limit=50))
+            self.assertIsNone(encode_event(EncodedEvent(event), limit=50))
+        serializer.assert_not_called()
+
+    def test_truncate(self):
+        backend = LoggerBackend(max_event_size=170, oversize_strategy='truncate')
+        backend.send(self.event)
+        self.assertEqual(self.logged_event(), {
+            'name': 'big',
+            'context': {'user_id': 1},
+            'data': {'small': 'a', 'medium': 'b' * 50},
+            'truncated_fields': ['large'],
+        })
+        self.assertEqual(backend.oversized_events, {'truncated': 1})
+
+    def test_truncate_several_fields(self):
+        backend = LoggerBackend(max_event_size=110, oversize_strategy='truncate')
+        backend.send(EncodedEvent(self.event))
+        self.assertEqual(self.logged_event()['truncated_fields'], ['large', 'medium'])
+
+    def test_truncate_impossible(self):
+        backend = LoggerBackend(max_event_size=20, oversize_strategy='truncate')
+        backend.send(self.event)
+        backend.send({'name': 'big', 'data': 'x' * 100})
+        self.mock_logger.info.assert_not_called()
+        self.assertEqual(backend.oversized_events, {'dropped': 2})
+
+    def test_spill(self):
+        backend = LoggerBackend(max_event_size=200, oversize_strategy='spill', spill_file=self.spill_file)
+        backend.send(self.event)
+        backend.send(self.event)
+
+        with open(self.spill_file, encoding='utf-8') as spill_file:
+            spilled = spill_file.read().splitlines()
+        self.assertEqual([json.loads(line) for line in spilled], [self.event, self.event])
+        self.assertEqual(json.loads(self.mock_logger.info.call_args.args[0]), {
+            'name': 'big',
+            'context': {'user_id': 1},
+            'data': {},
+            'oversized': {'size': len(spilled[1]), 'spill_file': self.spill_file, 'offset': len(spilled[0]) + 1},
+        })
+        self.assertEqual(backend.oversized_events, {'spilled': 2})
+
+    def test_spill_requires_file(self):
+        with self.assertRaises(ValueError):
+            LoggerBackend(oversize_strategy='spill')
+
+    def test_stub(self):
+        backend = LoggerBackend(max_event_size=100, oversize_strategy='stub')
+        backend.send(self.event)
+        self.assertEqual(self.logged_event()['oversized'], {'max_event_size': 100})
+        self.assertEqual(backend.oversized_events, {'stubbed': 1})
+
+    def test_stub_with_blob_store(self):
+        blob_store = MagicMock()
+        blob_store.put.return_value = 'key'
+        backend = LoggerBackend(max_event_size=100, oversize_strategy='stub', blob_store=blob_store)
+        backend.send(self.event)
+        event_bytes = blob_store.put.call_args.args[0]
+        self.assertEqual(json.loads(event_bytes), self.event)
+        self.assertEqual(self.logged_event()['oversized'], {'size': len(event_bytes), 'blob': 'key'})
+
+    def test_stub_too_large(self):
+        backend = LoggerBackend(max_event_size=10, oversize_strategy='stub')
+        backend.send(self.event)
+        self.mock_logger.info.assert_not_called()
+        self.assertEqual(backend.oversized_events, {'dropped': 1})
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            LoggerBackend(oversize_strategy='unknown')
+
+
+class TestMinimumEncodedSize(TestCase):
+    """Test the lower bound of the size of encoded events"""
+
+    def test_lower_bound(self):
+        events = [
+            'a string',
+            12,
+            {},
+            {'name': 'foo', 'data': {'a': [1, 2, {'b': None}], 'b': 'bar'}, 'context': {'unicode': 'café ☃'}},
+            {'time': datetime.datetime(2012, 5, 1, 7, 27, 1, 200), 'deep': {'deeper': {'deepest': 'x' * 100}}},
+            {1: 'non string key'},
+        ]
+        for event in events:
+            for serializer in SERIALIZERS:
+                self.assertLessEqual(minimum_encoded_size(event), len(get_serializer(serializer)(event)))
+
+    def test_cached_encoding_with_limit(self):
+        event = EncodedEvent({'a': 1})
+        self.assertEqual(encode_event(event), '{"a": 1}')
+        self.assertIsNone(encode_event(event, limit=7))
+        self.assertIsNone(encode_event(event, 'a', limit=0))
+        self.assertIsNone(encode_event({'a': 1}, 'a', limit=0))
+
+
+class RecordingHandler(logging.Handler):
+    """Record the messages it handles and the threads they are handled from"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        self.threads.add(threading.current_thread())
+
+
+class TestQueuedLoggerBackend(TestCase):
+    """Test logging events from the listener thread"""
+
+    def setUp(self):
+        super().setUp()
+        self.handler = RecordingHandler()
+        test_logger = logging.getLogger('test.queued')
+        test_logger.setLevel(logging.INFO)
+        test_logger.propagate = False
+        test_logger.addHandler(self.handler)
+        self.addCleanup(test_logger.removeHandler, self.handler)
+
+    def create_backend(self, **kwargs):
+        """Create a queued backend, closed at the end of the test"""
+        backend = LoggerBackend(name='test.queued', queue=True, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_events_are_logged_from_the_listener_thread(self):
+        backend = self.create_backend()
+        self.assertIsNone(backend.listener)
+        for name in ('foo', 'bar'):
+            backend.send({'name': name})
+        self.assertIsNotNone(backend.listener)
+        backend.close()
+
+        self.assertEqual(self.handler.messages, ['{"name": "foo"}', '{"name": "bar"}'])
+        self.assertNotIn(threading.current_thread(), self.handler.threads)
+        self.assertIsNone(backend.listener)
+
+    def test_encoding_on_the_sending_thread(self):
+        backend = self.create_backend(max_event_size=20)
+        with patch.object(backend, '_start_listener'):
+            backend.send({'name': 'foo'})
+            backend.send({'name': 'x' * 20})
+        self.assertEqual(list(backend.queue.queue), ['{"name": "foo"}'])
+        self.assertEqual(backend.oversized_events, {'dropped': 1})
+
+    def test_deferred_encoding(self):
+        backend = self.create_backend(max_event_size=20, defer_encoding=True)
+        event = {'name': 'foo'}
+        with patch.object(backend, '_start_listener'):
+            backend.send(event)
+            backend.send({'name': 'x' * 20})
+        self.assertIs(backend.queue.queue[0], event)
+        self.assertEqual(backend.oversized_events, {})
+
+        backend._start_listener()  # pylint: disable=protected-access
+        backend.close()
+        self.assertEqual(self.handler.messages, ['{"name": "foo"}'])
+        self.assertEqual(backend.oversized_events, {'dropped': 1})
+
+    def test_full_queue(self):
+        backend = self.create_backend(queue_size=1)
+        with patch.object(backend, '_start_listener'):
+            backend.send({'name': 'foo'})
+            backend.send({'name': 'bar'})
+        self.assertEqual(backend.dropped_events, 1)
+
+        # Stopping waits for room in the queue
+        backend._start_listener()  # pylint: disable=protected-access
+        backend.close()
+        self.assertEqual(self.handler.messages, ['{"name": "foo"}'])
+
+    def test_listener_survives_failures(self):
+        backend = self.create_backend(defer_encoding=True)
+        with self.assertLogs('eventtracking.backends.logger', level='ERROR'):
+            backend.send({'name': object()})
+            backend.send({'name': 'foo'})
+            backend.close()
+        self.assertEqual(self.handler.messages, ['{"name": "foo"}'])
+
+    def test_after_fork(self):
+        backend = self.create_backend()
+        backend.send({'name': 'parent'})
+        listener = backend.listener
+
+        # pylint: disable=protected-access
+        backend._after_fork()
+        self.assertIsNone(backend.listener)
+        self.assertTrue(backend.queue.empty())
+        backend.send({'name': 'child'})
+        self.assertIsNotNone(backend.listener)
+
+        listener.stop()
+        backend.close()
+        self.assertEqual(sorted(self.handler.messages), ['{"name": "child"}', '{"name": "parent"}'])
+
+    def test_close_without_queue(self):
+        LoggerBackend(name='test.queued').close()
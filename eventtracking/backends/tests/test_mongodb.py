@@ -1,13 +1,19 @@
 """Unit tests for the Mongo backend"""
 
+import time
+from datetime import datetime
 from unittest import TestCase
+from unittest.mock import MagicMock
 from unittest.mock import patch
 from unittest.mock import sentinel
 
-from pymongo.errors import PyMongoError
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid, PyMongoError
+from pytz import UTC
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
 from bson.errors import BSONError
 
-from eventtracking.backends.mongodb import MongoBackend
+from eventtracking.backends.mongodb import CLIENTS, MongoBackend
 
 
 class TestMongoBackend(TestCase):
@@ -17,7 +23,8 @@ class TestMongoBackend(TestCase):
         super().setUp()
         self.mongo_patcher = patch('eventtracking.backends.mongodb.MongoClient')
         self.addCleanup(self.mongo_patcher.stop)
-        self.mongo_patcher.start()
+        self.addCleanup(CLIENTS.clear)
+        self.mock_client = self.mongo_patcher.start()
 
         self.backend = MongoBackend()
 
@@ -44,8 +51,15 @@ class TestMongoBackend(TestCase):
         self.assertEqual(events[1], first_argument(calls[1]))
 
     def test_authentication_settings(self):
-        backend = MongoBackend(user=sentinel.user, password=sentinel.password)
-        backend.database.authenticate.assert_called_once_with(sentinel.user, sentinel.password)
+        backend = MongoBackend(user=sentinel.user, password=sentinel.password, database='tracking')
+        backend.send({'test': 1})
+        self.assertEqual(
+            self.mock_client.call_args.kwargs,
+            {
+                'host': 'localhost', 'port': 27017, 'w': 0, 'tz_aware': True, 'connect': False,
+                'username': sentinel.user, 'password': sentinel.password, 'authSource': 'tracking',
+            }
+        )
 
     def test_mongo_pymongo_insertion_error(self):
         self.backend.collection.insert.side_effect = PyMongoError
@@ -58,3 +72,458 @@ class TestMongoBackend(TestCase):
 
         self.backend.send({'test': 1})
         # Ensure this error is caught
+
+    def test_send_batch(self):
+        self.backend.collection.codec_options = DEFAULT_CODEC_OPTIONS
+        events = [{'test': 1}, {'test': 2}]
+        self.backend.send_batch(events)
+        self.backend.collection.insert_one.assert_not_called()
+        (documents,), kwargs = self.backend.collection.insert_many.call_args
+        self.assertEqual([dict(document) for document in documents], events)
+        self.assertEqual(kwargs, {'ordered': False})
+        # The events are not modified by the insertion
+        self.assertNotIn('_id', events[0])
+
+    def test_send_batch_skips_invalid_events(self):
+        self.backend.collection.codec_options = DEFAULT_CODEC_OPTIONS
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            self.backend.send_batch([{'test': 1}, {'test': object()}, {'test': 3}])
+        (documents,), _ = self.backend.collection.insert_many.call_args
+        self.assertEqual([document['test'] for document in documents], [1, 3])
+
+    def test_send_batch_skips_events_that_cannot_be_routed(self):
+        collection = self.backend.collection
+        collection.codec_options = DEFAULT_CODEC_OPTIONS
+        with patch.object(self.backend, 'route', side_effect=[PyMongoError, collection]):
+            with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+                self.backend.send_batch([{'test': 1}, {'test': 2}])
+        (documents,), _ = collection.insert_many.call_args
+        self.assertEqual([document['test'] for document in documents], [2])
+
+    def test_send_batch_insertion_error(self):
+        self.backend.collection.codec_options = DEFAULT_CODEC_OPTIONS
+        self.backend.collection.insert_many.side_effect = PyMongoError
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            self.backend.send_batch([{'test': 1}])
+
+
+class TestBufferedMongoBackend(TestCase):
+    """Unit tests for the bulk inserts of the Mongo backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.mongo_patcher = patch('eventtracking.backends.mongodb.MongoClient')
+        self.addCleanup(self.mongo_patcher.stop)
+        self.addCleanup(CLIENTS.clear)
+        self.mongo_patcher.start()
+
+    def create_backend(self, **kwargs):
+        """Create a buffered backend, closed at the end of the test"""
+        kwargs.setdefault('flush_interval', 60)
+        backend = MongoBackend(create_indexes=None, **kwargs)
+        backend.collection.codec_options = DEFAULT_CODEC_OPTIONS
+        self.addCleanup(backend.close)
+        return backend
+
+    def inserted_batches(self, backend):
+        """Return the decoded events of each `insert_many` call"""
+        batches = []
+        for call in backend.collection.insert_many.call_args_list:
+            self.assertEqual(call.kwargs, {'ordered': False})
+            batches.append([dict(document) for document in call.args[0]])
+        return batches
+
+    def test_events_are_buffered(self):
+        backend = self.create_backend(batch_size=10)
+        backend.send({'name': 'foo', 'time': datetime(2013, 1, 1, tzinfo=UTC)})
+        backend.send({'name': 'bar'})
+        backend.collection.insert_many.assert_not_called()
+
+        backend.flush()
+        backend.collection.insert_one.assert_not_called()
+        self.assertEqual(
+            self.inserted_batches(backend),
+            [[{'name': 'foo', 'time': datetime(2013, 1, 1)}, {'name': 'bar'}]],
+        )
+
+    def test_full_batch_is_inserted_from_the_background_thread(self):
+        backend = self.create_backend(batch_size=2)
+        for name in ('foo', 'bar', 'baz'):
+            backend.send({'name': name})
+        deadline = time.time() + 5
+        while not backend.collection.insert_many.called and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.inserted_batches(backend)[0], [{'name': 'foo'}, {'name': 'bar'}])
+        backend.close()
+        self.assertEqual(self.inserted_batches(backend), [[{'name': 'foo'}, {'name': 'bar'}], [{'name': 'baz'}]])
+
+    def test_batch_size_is_a_maximum(self):
+        backend = self.create_backend(batch_size=2)
+        with patch.object(backend.batcher, 'thread'):
+            for name in ('foo', 'bar', 'baz'):
+                backend.send({'name': name})
+        backend.flush()
+        self.assertEqual(self.inserted_batches(backend), [[{'name': 'foo'}, {'name': 'bar'}], [{'name': 'baz'}]])
+
+    def test_batch_bytes(self):
+        backend = self.create_backend(batch_size=100, batch_bytes=10)
+        self.assertEqual(backend.batcher.max_bytes, 10)
+        self.assertEqual(backend.batcher.max_count, 100)
+
+    def test_full_buffer(self):
+        backend = self.create_backend(batch_size=100, max_buffer_size=30)
+        for name in ('foo', 'bar'):
+            backend.send({'name': name})
+        self.assertEqual(backend.dropped_events, 1)
+
+    def test_encoding_error(self):
+        backend = self.create_backend(batch_size=10)
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            backend.send({'name': object()})
+        backend.close()
+        backend.collection.insert_many.assert_not_called()
+
+    def test_insertion_error(self):
+        backend = self.create_backend(batch_size=10)
+        backend.collection.insert_many.side_effect = PyMongoError
+        backend.send({'name': 'foo'})
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            backend.flush()
+
+    def test_send_batch_is_buffered(self):
+        backend = self.create_backend(batch_size=10)
+        backend.send_batch([{'name': 'foo'}, {'name': 'bar'}])
+        backend.collection.insert_many.assert_not_called()
+        backend.flush()
+        self.assertEqual(self.inserted_batches(backend), [[{'name': 'foo'}, {'name': 'bar'}]])
+
+    def test_unbuffered_flush_and_close(self):
+        backend = MongoBackend()
+        backend.flush()
+        backend.close()
+        self.assertIsNone(backend.batcher)
+
+
+class TestMongoBackendIndexes(TestCase):
+    """Unit tests for the creation of the indexes of the Mongo backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.mongo_patcher = patch('eventtracking.backends.mongodb.MongoClient')
+        self.addCleanup(self.mongo_patcher.stop)
+        self.addCleanup(CLIENTS.clear)
+        self.mock_client = self.mongo_patcher.start()
+        self.collection = self.mock_client.return_value.__getitem__.return_value.__getitem__.return_value
+        self.collection.index_information.return_value = {'_id_': {'key': [('_id', 1)]}}
+
+    def test_no_connection_at_construction(self):
+        backend = MongoBackend()
+        self.mock_client.assert_not_called()
+        self.collection.index_information.assert_not_called()
+        self.collection.create_index.assert_not_called()
+
+        self.assertIs(backend.collection, self.collection)
+        self.assertFalse(self.mock_client.call_args.kwargs['connect'])
+
+    def test_connect_can_be_overridden(self):
+        extra = {'connect': True}
+        self.assertIsNotNone(MongoBackend(extra=extra).connection)
+        self.assertTrue(self.mock_client.call_args.kwargs['connect'])
+        self.assertEqual(extra, {'connect': True})
+
+    def test_indexes_are_created_in_background_once(self):
+        backend = MongoBackend()
+        with patch('eventtracking.backends.mongodb.threading.Thread') as mock_thread:
+            backend.send({'name': 'foo'})
+            backend.send({'name': 'bar'})
+        mock_thread.assert_called_once()
+        self.assertTrue(mock_thread.call_args.kwargs['daemon'])
+        mock_thread.return_value.start.assert_called_once_with()
+
+        mock_thread.call_args.kwargs['target']()
+        self.assertEqual(
+            [create_call.args for create_call in self.collection.create_index.call_args_list],
+            [([('time', DESCENDING)],), ([('name', ASCENDING)],)],
+        )
+
+    def test_indexes_at_init(self):
+        MongoBackend(create_indexes='init')
+        self.assertEqual(self.collection.create_index.call_count, 2)
+
+    def test_indexes_never_created(self):
+        backend = MongoBackend(create_indexes=None)
+        backend.send({'name': 'foo'})
+        self.collection.index_information.assert_not_called()
+
+    def test_unknown_create_indexes(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown value for create_indexes'):
+            MongoBackend(create_indexes='later')
+
+    def test_existing_indexes_are_not_created(self):
+        self.collection.index_information.return_value = {
+            '_id_': {'key': [('_id', 1)]},
+            'time_-1': {'key': [('time', -1)]},
+        }
+        self.collection.create_index.return_value = 'name_1'
+        self.assertEqual(MongoBackend(create_indexes=None).ensure_indexes(), ['name_1'])
+        self.collection.create_index.assert_called_once_with([('name', ASCENDING)])
+
+    def test_background_errors_are_logged(self):
+        backend = MongoBackend()
+        self.collection.index_information.side_effect = PyMongoError
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            backend._ensure_indexes_safely()  # pylint: disable=protected-access
+
+    def test_created_indexes_are_logged(self):
+        backend = MongoBackend()
+        self.collection.create_index.side_effect = ['time_-1', 'name_1']
+        with self.assertLogs('eventtracking.backends.mongodb', level='INFO') as logs:
+            backend._ensure_indexes_safely()  # pylint: disable=protected-access
+        self.assertIn("['time_-1', 'name_1']", logs.output[0])
+
+
+class TestMongoBackendClients(TestCase):
+    """Unit tests for the lazy, per process and shared clients of the Mongo backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.mongo_patcher = patch(
+            'eventtracking.backends.mongodb.MongoClient', side_effect=lambda **kwargs: MagicMock()
+        )
+        self.addCleanup(self.mongo_patcher.stop)
+        self.addCleanup(CLIENTS.clear)
+        self.mock_client = self.mongo_patcher.start()
+
+    def test_client_is_created_lazily_once(self):
+        backend = MongoBackend(create_indexes=None)
+        self.mock_client.assert_not_called()
+        backend.send({'name': 'foo'})
+        backend.send({'name': 'bar'})
+        self.mock_client.assert_called_once_with(host='localhost', port=27017, w=0, tz_aware=True, connect=False)
+        self.assertEqual(backend.collection.insert_one.call_count, 2)
+
+    def test_clients_are_shared(self):
+        first = MongoBackend(collection='first')
+        second = MongoBackend(collection='second')
+        other = MongoBackend(host='other')
+        self.assertIs(first.connection, second.connection)
+        self.assertIsNot(first.connection, other.connection)
+        self.assertEqual(self.mock_client.call_count, 2)
+
+    def test_clients_of_other_users_are_not_shared(self):
+        first = MongoBackend(user='first', password='secret')
+        second = MongoBackend(user='second', password='secret')
+        self.assertIsNot(first.connection, second.connection)
+
+    def test_client_sharing_can_be_disabled(self):
+        first = MongoBackend()
+        second = MongoBackend(share_client=False)
+        self.assertIsNot(first.connection, second.connection)
+
+    def test_new_client_after_fork(self):
+        backend = MongoBackend()
+        parent_collection = backend.collection
+
+        with patch('eventtracking.backends.mongodb.os.getpid', return_value=backend.pid + 1):
+            CLIENTS.clear()
+            child_collection = backend.collection
+            self.assertIsNot(child_collection, parent_collection)
+            self.assertIs(backend.collection, child_collection)
+        self.assertEqual(self.mock_client.call_count, 2)
+
+    def test_registry_key(self):
+        self.assertIs(CLIENTS.get(host='a', extra={'x': 1}), CLIENTS.get(extra={'x': 1}, host='a'))
+        self.assertIsNot(CLIENTS.get(host='a', extra={'x': 1}), CLIENTS.get(host='a', extra={'x': 2}))
+
+
+class TestPartitionedMongoBackend(TestCase):
+    """Unit tests for the time partitioned collections of the Mongo backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.mongo_patcher = patch(
+            'eventtracking.backends.mongodb.MongoClient', side_effect=lambda **kwargs: MagicMock()
+        )
+        self.addCleanup(self.mongo_patcher.stop)
+        self.addCleanup(CLIENTS.clear)
+        self.mongo_patcher.start()
+        self.collections = {}
+
+    def create_backend(self, **kwargs):
+        """Create a partitioned backend whose database returns a distinct collection per name"""
+        kwargs.setdefault('create_indexes', None)
+        backend = MongoBackend(share_client=False, **kwargs)
+        backend.database.__getitem__.reset_mock()
+        backend.database.__getitem__.side_effect = self.get_collection
+        backend.database.list_collection_names.side_effect = lambda **kwargs: sorted(self.collections)
+        self.addCleanup(backend.close)
+        return backend
+
+    def get_collection(self, name):
+        """Return the mock collection named `name`"""
+        if name not in self.collections:
+            collection = self.collections[name] = MagicMock(codec_options=DEFAULT_CODEC_OPTIONS)
+            collection.name = name
+            collection.index_information.return_value = {'_id_': {'key': [('_id', 1)]}}
+        return self.collections[name]
+
+    def test_events_are_routed_by_time(self):
+        backend = self.create_backend(partition='day')
+        backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, 23, 59, tzinfo=UTC)})
+        backend.send({'name': 'bar', 'time': datetime(2024, 5, 2)})
+        self.assertEqual(sorted(self.collections), ['events_20240501', 'events_20240502'])
+        self.collections['events_20240501'].insert_one.assert_called_once()
+        self.collections['events_20240502'].insert_one.assert_called_once()
+
+    def test_batches_are_inserted_per_partition(self):
+        backend = self.create_backend(partition='day')
+        backend.send_batch([
+            {'name': 'foo', 'time': datetime(2024, 5, 1, tzinfo=UTC)},
+            {'name': 'bar', 'time': datetime(2024, 5, 2, tzinfo=UTC)},
+            {'name': 'baz', 'time': datetime(2024, 5, 1, 12, tzinfo=UTC)},
+        ])
+        first, second = self.collections['events_20240501'], self.collections['events_20240502']
+        self.assertEqual([event['name'] for event in first.insert_many.call_args.args[0]], ['foo', 'baz'])
+        self.assertEqual([event['name'] for event in second.insert_many.call_args.args[0]], ['bar'])
+
+    def test_batch_routing_error(self):
+        backend = self.create_backend(partition='timeseries')
+        backend.database.list_collection_names.side_effect = PyMongoError
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            backend.send_batch([{'name': 'foo'}])
+
+    def test_hour_partitions(self):
+        backend = self.create_backend(partition='hour', time_field='timestamp', collection='tracking')
+        backend.send({'name': 'foo', 'timestamp': datetime(2024, 5, 1, 13, 30, tzinfo=UTC)})
+        self.assertEqual(list(self.collections), ['tracking_2024050113'])
+
+    def test_events_without_time_use_the_current_partition(self):
+        backend = self.create_backend(partition='day')
+        now = datetime(2024, 5, 1, tzinfo=UTC).timestamp()
+        with patch('eventtracking.backends.mongodb.time.time', return_value=now):
+            backend.send({'name': 'foo'})
+        self.assertEqual(list(self.collections), ['events_20240501'])
+
+    def test_partitions_are_cached(self):
+        backend = self.create_backend(partition='day')
+        for hour in range(3):
+            backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, hour, tzinfo=UTC)})
+        backend.database.__getitem__.assert_called_once_with('events_20240501')
+        self.assertEqual(self.collections['events_20240501'].insert_one.call_count, 3)
+
+    def test_partition_cache_is_bounded(self):
+        backend = self.create_backend(partition='hour')
+        with patch('eventtracking.backends.mongodb.MAX_CACHED_PARTITIONS', 2):
+            for hour in range(3):
+                backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, hour, tzinfo=UTC)})
+        self.assertEqual(len(backend.partitions), 1)
+
+    def test_indexes_of_new_partitions(self):
+        backend = self.create_backend(partition='day', create_indexes='background')
+        with patch('eventtracking.backends.mongodb.threading.Thread') as mock_thread:
+            backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, tzinfo=UTC)})
+            backend.send({'name': 'bar', 'time': datetime(2024, 5, 1, 1, tzinfo=UTC)})
+        mock_thread.assert_called_once()
+        mock_thread.call_args.kwargs['target'](*mock_thread.call_args.kwargs['args'])
+        self.assertEqual(self.collections['events_20240501'].create_index.call_count, 2)
+
+    def test_indexes_of_new_partitions_at_init(self):
+        backend = self.create_backend(partition='day', create_indexes='init')
+        backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, tzinfo=UTC)})
+        self.assertEqual(self.collections['events_20240501'].create_index.call_count, 2)
+
+    def test_ensure_indexes_of_all_partitions(self):
+        backend = self.create_backend(partition='day')
+        for name in ('events_20240501', 'events_20240502', 'events_archive', 'events_2024'):
+            self.get_collection(name)
+        backend.ensure_indexes()
+        for name in ('events_20240501', 'events_20240502'):
+            self.assertEqual(self.collections[name].create_index.call_count, 2)
+        for name in ('events_archive', 'events_2024'):
+            self.collections[name].create_index.assert_not_called()
+
+    def test_drop_expired_partitions(self):
+        backend = self.create_backend(partition='day', retention=2 * 86400)
+        for name in ('events_20240429', 'events_20240430', 'events_20240501', 'events_archive'):
+            self.get_collection(name)
+        now = datetime(2024, 5, 2, 12, tzinfo=UTC).timestamp()
+        self.assertEqual(backend.drop_expired_partitions(now), ['events_20240429'])
+        backend.database.drop_collection.assert_called_once_with('events_20240429')
+
+    def test_expired_partitions_are_dropped_with_new_partitions(self):
+        backend = self.create_backend(partition='hour', retention=3600)
+        self.get_collection('events_2024050100')
+        with patch('eventtracking.backends.mongodb.threading.Thread') as mock_thread:
+            backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, 3, tzinfo=UTC)})
+        now = datetime(2024, 5, 1, 3, tzinfo=UTC).timestamp()
+        with patch('eventtracking.backends.mongodb.time.time', return_value=now):
+            with self.assertLogs('eventtracking.backends.mongodb', level='INFO') as logs:
+                mock_thread.call_args.kwargs['target'](*mock_thread.call_args.kwargs['args'])
+        self.assertIn('events_2024050100', logs.output[0])
+        backend.database.drop_collection.assert_called_once_with('events_2024050100')
+
+    def test_drop_errors_are_logged(self):
+        backend = self.create_backend(partition='day', retention=86400)
+        backend.database.drop_collection.side_effect = PyMongoError
+        self.get_collection('events_20000101')
+        with self.assertLogs('eventtracking.backends.mongodb', level='ERROR'):
+            backend._maintain_partitions(None)  # pylint: disable=protected-access
+
+    def test_timeseries(self):
+        backend = self.create_backend(partition='timeseries', retention=86400)
+        backend.database.list_collection_names.side_effect = None
+        backend.database.list_collection_names.return_value = []
+        backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, tzinfo=UTC)})
+        backend.send({'name': 'bar', 'time': datetime(2024, 5, 2, tzinfo=UTC)})
+        backend.database.create_collection.assert_called_once_with(
+            'events',
+            timeseries={'timeField': 'time', 'metaField': 'name', 'granularity': 'seconds'},
+            expireAfterSeconds=86400,
+        )
+        self.assertEqual(backend.collection.insert_one.call_count, 2)
+        self.assertEqual(backend.drop_expired_partitions(), [])
+
+    def test_existing_timeseries(self):
+        backend = self.create_backend(partition='timeseries')
+        backend.database.list_collection_names.side_effect = None
+        backend.database.list_collection_names.return_value = ['events']
+        backend.database.create_collection.side_effect = CollectionInvalid
+        backend.ensure_indexes()
+        backend.database.create_collection.assert_not_called()
+        self.assertEqual(backend.collection.create_index.call_count, 2)
+
+    def test_concurrently_created_timeseries(self):
+        backend = self.create_backend(partition='timeseries')
+        backend.database.list_collection_names.side_effect = None
+        backend.database.list_collection_names.return_value = []
+        backend.database.create_collection.side_effect = CollectionInvalid
+        self.assertIs(backend.create_timeseries(), backend.collection)
+
+    def test_buffered_events_are_inserted_per_partition(self):
+        backend = self.create_backend(partition='day', batch_size=10, flush_interval=60)
+        for day in (1, 2, 1):
+            backend.send({'name': 'foo', 'time': datetime(2024, 5, day, tzinfo=UTC)})
+        backend.flush()
+        inserted = self.collections['events_20240501'].insert_many.call_args
+        self.assertEqual(len(inserted.args[0]), 2)
+        self.assertEqual(len(self.collections['events_20240502'].insert_many.call_args.args[0]), 1)
+
+    def test_naive_times_are_utc(self):
+        backend = self.create_backend(partition='hour')
+        backend.send({'name': 'foo', 'time': datetime(2024, 5, 1, 13)})
+        self.assertEqual(list(self.collections), ['events_2024050113'])
+
+    def test_new_partitions_after_fork(self):
+        backend = self.create_backend(partition='day')
+        event = {'name': 'foo', 'time': datetime(2024, 5, 1, tzinfo=UTC)}
+        parent_collection = backend.route(event)
+        with patch('eventtracking.backends.mongodb.os.getpid', return_value=backend.pid + 1):
+            self.assertIsNot(backend.route(event), parent_collection)
+            self.assertEqual(len(backend.partitions), 1)
+
+    def test_invalid_options(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown value for partition'):
+            MongoBackend(partition='week')
+        with self.assertRaisesRegex(ValueError, 'requires a "partition"'):
+            MongoBackend(retention=86400)
@@ -7,6 +7,7 @@ been introduced to the MongoBackend.
 from uuid import uuid4
 
 
+from eventtracking.backends.async_mongodb import AsyncMongoBackend
 from eventtracking.backends.mongodb import MongoBackend
 from eventtracking.backends.tests import PerformanceTestCase
 from eventtracking.tracker import Tracker
@@ -30,10 +31,40 @@ class TestBackendPerformance(PerformanceTestCase):
         self.mongo_backend.connection.drop_database(self.database_name)
         super().tearDown()
 
+    def emit_events(self):
+        """Emit `num_events` events"""
+        for i in range(self.num_events):
+            self.tracker.emit('perf.event', {
+                'sequence': i,
+                'payload': self.random_payload
+            })
+
     def test_sequential_events(self):
         with self.assert_execution_time_less_than_threshold():
-            for i in range(self.num_events):
-                self.tracker.emit('perf.event', {
-                    'sequence': i,
-                    'payload': self.random_payload
-                })
+            self.emit_events()
+
+    def test_bulk_events(self):
+        bulk_backend = MongoBackend(database=self.database_name, batch_size=1000)
+        self.tracker = Tracker({
+            'mongo': bulk_backend
+        })
+        with self.assert_execution_time_less_than_threshold():
+            self.emit_events()
+            bulk_backend.close()
+
+    def test_partitioned_events(self):
+        partitioned_backend = MongoBackend(database=self.database_name, partition='hour')
+        self.tracker = Tracker({
+            'mongo': partitioned_backend
+        })
+        with self.assert_execution_time_less_than_threshold():
+            self.emit_events()
+
+    def test_async_events(self):
+        async_backend = AsyncMongoBackend(database=self.database_name)
+        self.tracker = Tracker({
+            'mongo': async_backend
+        })
+        with self.assert_execution_time_less_than_threshold():
+            self.emit_events()
+            async_backend.close()
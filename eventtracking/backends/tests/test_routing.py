@@ -1,12 +1,14 @@
 """Test the routing backend"""
 
 
+import json
 from unittest import TestCase
 
-from unittest.mock import MagicMock, sentinel
+from unittest.mock import MagicMock, patch, sentinel
 
+from eventtracking.backends.logger import SERIALIZERS, encode_event
 from eventtracking.backends.routing import RoutingBackend
-from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.processors.exceptions import BackendDeliveryError, EventEmissionExit
 
 
 class TestRoutingBackend(TestCase):
@@ -84,6 +86,24 @@ class TestRoutingBackend(TestCase):
         for backend in backends.values():
             backend.send.assert_called_once_with(self.sample_event)
 
+    def test_backend_failure_is_raised(self):
+        backends = {str(i): MagicMock() for i in range(3)}
+        backends['1'].send.side_effect = RuntimeError
+        backends['2'] = RoutingBackend(backends={'inner': MagicMock(send=MagicMock(side_effect=RuntimeError))})
+        router = RoutingBackend(backends=backends)
+
+        with self.assertRaises(BackendDeliveryError) as context:
+            router.send_to_backends(self.sample_event, raise_errors=True)
+
+        self.assertEqual(context.exception.backends, ['1', '2'])
+        backends['0'].send.assert_called_once_with(self.sample_event)
+
+    def test_nested_backend_filters_without_failure(self):
+        nested = RoutingBackend(backends={'inner': MagicMock()}, processors=[MagicMock(side_effect=EventEmissionExit)])
+        router = RoutingBackend(backends={'nested': nested})
+        router.send_to_backends(self.sample_event, raise_errors=True)
+        nested.backends['inner'].send.assert_not_called()
+
     def test_multiple_processors(self):
         processors = [
             MagicMock()
@@ -278,3 +298,107 @@ class TestRoutingBackend(TestCase):
 
         router.send(self.sample_event)
         self.assertEqual(call_order, ['0', '1', '2', '3', '4'])
+
+    def test_encoding_is_shared_between_backends(self):
+        encodings = []
+
+        class EncodingBackend:
+            """Record the encoding of the events it receives"""
+
+            def send(self, event):
+                """Encode the event"""
+                encodings.append(encode_event(event))
+
+        nested_router = RoutingBackend(backends={'0': EncodingBackend()})
+        router = RoutingBackend(backends={'0': EncodingBackend(), '1': EncodingBackend(), '2': nested_router})
+
+        mock_dumps = MagicMock(return_value='{}')
+        with patch.dict(SERIALIZERS, json=mock_dumps):
+            router.send({'name': 'event'})
+
+        mock_dumps.assert_called_once()
+        self.assertEqual(encodings, ['{}', '{}', '{}'])
+
+    def test_processors_invalidate_the_encoding(self):
+        def processor(event):
+            event['data']['foo'] = 'baz'
+
+        received = []
+        nested_router = RoutingBackend(backends={'0': MagicMock(send=received.append)}, processors=[processor])
+        router = RoutingBackend(backends={'0': MagicMock(send=encode_event), '1': nested_router})
+
+        router.send({'name': 'event', 'data': {'foo': 'bar'}})
+
+        self.assertEqual(json.loads(encode_event(received[0])), {'name': 'event', 'data': {'foo': 'baz'}})
+
+    def test_backends_of_type(self):
+        nested_router = RoutingBackend()
+        router = RoutingBackend(backends={'a': nested_router, 'b': self.mock_backend, 'c': RoutingBackend()})
+
+        first = router.backends_of_type(RoutingBackend)
+        self.assertEqual([name for name, _ in first], ['a', 'c'])
+        self.assertIs(first[0][1], nested_router)
+        self.assertIs(router.backends_of_type(RoutingBackend), first)
+
+        router.register_backend('d', RoutingBackend())
+        self.assertEqual([name for name, _ in router.backends_of_type(RoutingBackend)], ['a', 'c', 'd'])
+
+    def test_send_batch(self):
+        def abort_bar(event):
+            if event['name'] == 'bar':
+                raise EventEmissionExit
+
+        batch_backend = MagicMock()
+        single_backend = MagicMock(spec=['send'])
+        router = RoutingBackend(backends={'0': batch_backend, '1': single_backend}, processors=[abort_bar])
+        events = [{'name': 'foo'}, {'name': 'bar'}, {'name': 'baz'}]
+
+        router.send_batch(events)
+
+        batch = batch_backend.send_batch.call_args.args[0]
+        self.assertEqual(batch, [{'name': 'foo'}, {'name': 'baz'}])
+        self.assertIsNot(batch[0], events[0])
+        batch_backend.send.assert_not_called()
+        self.assertEqual([call.args[0] for call in single_backend.send.call_args_list], batch)
+
+    def test_nested_send_batch(self):
+        nested_backend = MagicMock()
+        router = RoutingBackend(backends={'0': RoutingBackend(backends={'0': nested_backend})})
+        router.send_batch([{'name': 'foo'}, {'name': 'bar'}])
+        self.assertEqual(nested_backend.send_batch.call_args.args[0], [{'name': 'foo'}, {'name': 'bar'}])
+
+    def test_empty_batch_is_not_sent(self):
+        self.router.register_processor(MagicMock(side_effect=EventEmissionExit))
+        self.router.send_batch([{'name': 'foo'}])
+        self.mock_backend.send_batch.assert_not_called()
+
+    def test_send_batch_failure(self):
+        failing_backend = MagicMock()
+        failing_backend.send_batch.side_effect = RuntimeError
+        single_backend = MagicMock(spec=['send'])
+        single_backend.send.side_effect = [RuntimeError, None]
+        router = RoutingBackend(backends={'0': failing_backend, '1': single_backend, '2': self.mock_backend})
+
+        with self.assertLogs('eventtracking.backends.routing', level='ERROR') as logs:
+            router.send_batch([{'name': 'foo'}, {'name': 'bar'}])
+
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(single_backend.send.call_count, 2)
+        self.mock_backend.send_batch.assert_called_once()
+
+    def test_close(self):
+        nested_backend = MagicMock()
+        failing_backend = MagicMock()
+        failing_backend.close.side_effect = RuntimeError
+        router = RoutingBackend(backends={
+            '0': failing_backend,
+            '1': RoutingBackend(backends={'0': nested_backend}),
+            '2': MagicMock(spec=['send']),
+            '3': self.mock_backend,
+        })
+
+        with self.assertLogs('eventtracking.backends.routing', level='ERROR'):
+            router.close()
+
+        nested_backend.close.assert_called_once_with()
+        self.mock_backend.close.assert_called_once_with()
@@ -1,11 +1,24 @@
 """Test the segment.com backend"""
 
 
+import base64
+from datetime import datetime
+import gzip
+from http.client import HTTPSConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import urlunsplit
 from unittest import TestCase
 from unittest.mock import patch
 from unittest.mock import sentinel
 
-from eventtracking.backends.segment import SegmentBackend
+from pytz import UTC
+
+from eventtracking.backends.segment import SegmentBackend, SegmentBatchBackend, page_url
+from eventtracking.backends.tests import PerformanceTestCase
 
 
 class TestSegmentBackend(TestCase):
@@ -173,6 +186,26 @@ class TestSegmentBackend(TestCase):
         self.mock_analytics.track.assert_called_once_with(
             sentinel.user_id, sentinel.name, event, context=expected_segment_context)
 
+    def test_missing_user_id_is_rejected_before_building_the_context(self):
+        with patch('eventtracking.backends.segment.segment_context') as mock_segment_context:
+            self.backend.send({'name': sentinel.name, 'context': {'path': '/path', 'host': 'hostname'}})
+        mock_segment_context.assert_not_called()
+        self.assert_no_event_emitted()
+
+    def test_page_url_is_cached(self):
+        page_url.cache_clear()
+        with patch('eventtracking.backends.segment.urlunsplit', wraps=urlunsplit) as mock_urlunsplit:
+            for _ in range(3):
+                self.backend.send({
+                    'name': sentinel.name,
+                    'context': {'user_id': sentinel.user_id, 'path': '/this/is/a/path', 'host': 'hostname'},
+                })
+        mock_urlunsplit.assert_called_once()
+        self.assertEqual(
+            [call.kwargs['context']['page']['url'] for call in self.mock_analytics.track.call_args_list],
+            ['https://hostname/this/is/a/path'] * 3,
+        )
+
 
 class TestSegmentBackendMissingDependency(TestCase):
     """Test the segment.com backend without the package installed"""
@@ -189,3 +222,259 @@ class TestSegmentBackendMissingDependency(TestCase):
         }
         backend = SegmentBackend()
         backend.send(event)
+
+
+class TestSegmentBackendPerformance(PerformanceTestCase):
+    """Measure the time it takes to map the context of events to their Segment context"""
+
+    def test_send(self):
+        backend = SegmentBackend()
+        contexts = [
+            {
+                'user_id': user_id,
+                'client_id': 'GA1.2.3',
+                'ip': '127.0.0.1',
+                'agent': 'Mozilla/5.0',
+                'host': 'courses.example.com',
+                'path': f'/courses/{user_id % 20}/progress',
+                'referer': 'https://courses.example.com/dashboard',
+            }
+            for user_id in range(100)
+        ]
+        with patch('eventtracking.backends.segment.analytics', SimpleNamespace(track=lambda *args, **kwargs: None)):
+            with self.assert_execution_time_less_than_threshold():
+                for i in range(self.num_events):
+                    backend.send({'name': 'perf.event', 'context': contexts[i % 100], 'data': self.random_payload})
+
+
+class SegmentStandIn(ThreadingHTTPServer):
+    """
+    Local stand-in for the batch API of segment.com.
+
+    It records the decoded batches and the headers of the requests it receives, and the number of connections that
+    were opened. It responds with the statuses of `statuses` in order, then with 200, and a None status closes the
+    connection without responding. The connection is closed after each response if `close_connections` is true.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SegmentStandInHandler)
+        self.requests = []
+        self.statuses = []
+        self.connections = 0
+        self.close_connections = False
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        """URL of the batch endpoint"""
+        return f'http://127.0.0.1:{self.server_address[1]}/v1/batch'
+
+    def batches(self):
+        """Return the messages of each batch received"""
+        return [body['batch'] for _, body in self.requests]
+
+    def stop(self):
+        """Stop serving"""
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class SegmentStandInHandler(BaseHTTPRequestHandler):
+    """Handle the requests of the stand-in for segment.com"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Record the batch and respond with the next status"""
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((dict(self.headers), json.loads(gzip.decompress(body))))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        if status is None:
+            self.close_connection = True
+            return
+        response = b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.close_connections:
+            self.send_header('Connection', 'close')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        """Do not log the requests"""
+
+
+class TestSegmentBatchBackend(TestCase):
+    """Test the batched segment.com backend against a local stand-in server"""
+
+    def setUp(self):
+        super().setUp()
+        self.server = SegmentStandIn()
+        self.addCleanup(self.server.stop)
+
+    def create_backend(self, **kwargs):
+        """Create a backend posting to the stand-in server, closed at the end of the test"""
+        kwargs.setdefault('flush_interval', 60)
+        kwargs.setdefault('retry_delay', 0)
+        backend = SegmentBatchBackend(write_key='secret', url=self.server.url, **kwargs)
+        self.addCleanup(backend.close)
+        return backend
+
+    def event(self, name='navigation.request', user_id=10, **context):
+        """Return an event of a user"""
+        return {
+            'name': name,
+            'timestamp': datetime(2024, 5, 1, 12, 30, tzinfo=UTC),
+            'context': dict(context, user_id=user_id),
+            'data': {'foo': 'bar'},
+        }
+
+    def test_batch(self):
+        backend = self.create_backend()
+        backend.send(self.event(ip='127.0.0.1', host='hostname', path='/path'))
+        backend.send(self.event('other', user_id=11))
+        self.assertEqual(self.server.requests, [])
+        backend.flush()
+
+        self.assertEqual(len(self.server.requests), 1)
+        headers, body = self.server.requests[0]
+        self.assertEqual(headers['Authorization'], 'Basic ' + base64.b64encode(b'secret:').decode('ascii'))
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('sentAt', body)
+        first, second = body['batch']
+        self.assertEqual(first['type'], 'track')
+        self.assertEqual(first['userId'], 10)
+        self.assertEqual(first['event'], 'navigation.request')
+        self.assertEqual(first['timestamp'], '2024-05-01T12:30:00+00:00')
+        self.assertEqual(first['properties']['data'], {'foo': 'bar'})
+        self.assertEqual(
+            first['context'],
+            {'ip': '127.0.0.1', 'page': {'path': '/path', 'url': 'https://hostname/path'}},
+        )
+        self.assertEqual(second['userId'], 11)
+        self.assertNotEqual(first['messageId'], second['messageId'])
+
+    def test_events_without_user_or_name_are_ignored(self):
+        backend = self.create_backend()
+        backend.send({'name': 'anonymous', 'context': {}})
+        backend.send({'name': 'anonymous'})
+        backend.send({'context': {'user_id': 10}})
+        backend.flush()
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(backend.dropped_events, 0)
+
+    def test_connection_is_reused(self):
+        backend = self.create_backend(batch_size=2)
+        with patch.object(backend.batcher, 'thread'):
+            for index in range(5):
+                backend.send(self.event(sequence=index))
+        backend.flush()
+        self.assertEqual([len(batch) for batch in self.server.batches()], [2, 2, 1])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_background_upload(self):
+        backend = self.create_backend(flush_interval=0.01)
+        backend.send(self.event())
+        deadline = time.time() + 5
+        while not self.server.requests and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.server.batches()), 1)
+
+    def test_retries(self):
+        self.server.statuses = [500, 429]
+        backend = self.create_backend()
+        backend.send(self.event())
+        backend.flush()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(backend.failed_events, 0)
+
+    def test_retries_are_exhausted(self):
+        self.server.statuses = [503] * 3
+        backend = self.create_backend(max_retries=2)
+        backend.send(self.event())
+        with self.assertLogs('eventtracking.backends.segment', level='ERROR'):
+            backend.flush()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(backend.failed_events, 1)
+
+    def test_invalid_batches_are_not_retried(self):
+        self.server.statuses = [400]
+        backend = self.create_backend()
+        backend.send(self.event())
+        with self.assertLogs('eventtracking.backends.segment', level='ERROR'):
+            backend.flush()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(backend.failed_events, 1)
+
+    def test_connection_errors_are_retried(self):
+        self.server.statuses = [None]
+        backend = self.create_backend()
+        backend.send(self.event())
+        backend.flush()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(backend.failed_events, 0)
+
+    def test_oversized_messages_are_dropped(self):
+        backend = self.create_backend(max_message_size=400)
+        backend.send(self.event(payload='x' * 400))
+        backend.send(self.event())
+        backend.flush()
+        self.assertEqual(len(self.server.batches()[0]), 1)
+        self.assertEqual(backend.dropped_events, 1)
+
+    def test_unserializable_events_are_dropped(self):
+        backend = self.create_backend()
+        with self.assertLogs('eventtracking.backends.segment', level='ERROR'):
+            backend.send(self.event(unserializable=object()))
+        self.assertEqual(backend.dropped_events, 1)
+
+    def test_full_buffer(self):
+        backend = self.create_backend(max_buffer_size=600)
+        with patch.object(backend.batcher, 'thread'):
+            for _ in range(3):
+                backend.send(self.event())
+        self.assertEqual(backend.dropped_events, 2)
+
+    def test_close_uploads_and_closes_the_connection(self):
+        backend = self.create_backend()
+        backend.send(self.event())
+        backend.close()
+        self.assertEqual(len(self.server.batches()), 1)
+        self.assertIsNone(backend.connection)
+
+    def test_server_closing_the_connection(self):
+        self.server.close_connections = True
+        backend = self.create_backend()
+        backend.send(self.event())
+        backend.flush()
+        self.assertEqual(len(self.server.batches()), 1)
+        self.assertIsNone(backend.connection)
+
+    def test_after_fork(self):
+        backend = self.create_backend()
+        backend.send(self.event())
+        backend.flush()
+        inherited = backend.connection
+        backend._after_fork()  # pylint: disable=protected-access
+        inherited.close()
+        self.assertIsNone(backend.connection)
+
+    def test_requires_write_key(self):
+        with self.assertRaisesRegex(ValueError, 'requires a "write_key"'):
+            SegmentBatchBackend()
+
+    def test_https_by_default(self):
+        backend = SegmentBatchBackend(write_key='secret')
+        backend.close()
+        self.assertIs(backend.connection_class, HTTPSConnection)
+        self.assertEqual((backend.netloc, backend.path), ('api.segment.io', '/v1/batch'))
@@ -0,0 +1,105 @@
+"""
+Conformance tests for the JSON serializers.
+
+Every registered serializer must produce the same JSON document as the reference `DateTimeJSONEncoder`.
+"""
+
+import datetime
+import json
+import math
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+
+import ddt
+import pytz
+
+from eventtracking.backends.logger import (
+    SERIALIZERS,
+    DateTimeJSONEncoder,
+    LoggerBackend,
+    decode_json,
+    get_serializer,
+    orjson,
+    register_serializer,
+)
+
+EASTERN = pytz.timezone('US/Eastern')
+NAIVE_TIME = datetime.datetime(2012, 5, 1, 7, 27, 1, 200)
+
+CONFORMANCE_EVENTS = [
+    {},
+    {'name': 'simple', 'data': {'foo': 'bar'}},
+    {'naive': NAIVE_TIME},
+    {'naive_without_microseconds': NAIVE_TIME.replace(microsecond=0)},
+    {'utc': pytz.UTC.localize(NAIVE_TIME)},  # pylint: disable=no-value-for-parameter
+    {'eastern': EASTERN.localize(NAIVE_TIME)},
+    {'fixed_offset': NAIVE_TIME.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=5, minutes=30)))},
+    {'date': datetime.date(2012, 5, 7)},
+    {'nested': {'list': [1, 2.5, True, False, None, 'x', {'time': NAIVE_TIME}], 'empty': []}},
+    {'unicode': 'café ☃ \U0001f600', 'escapes': 'quote " backslash \\ newline \n tab \t \x00'},
+    {'numbers': [0, -1, 2 ** 53, 1e-7, 1.5e300, -0.0]},
+    {1: 'integer key', 2.5: 'float key', False: 'boolean key', None: 'null key'},
+    {'tuple': (1, 2)},
+]
+
+
+@ddt.ddt
+class TestSerializerConformance(TestCase):
+    """Ensure every serializer encodes events like `DateTimeJSONEncoder`"""
+
+    def reference(self, event):
+        """The reference encoding of the event, parsed back"""
+        return json.loads(json.dumps(event, cls=DateTimeJSONEncoder))
+
+    def test_json_is_byte_identical(self):
+        for event in CONFORMANCE_EVENTS:
+            self.assertEqual(get_serializer('json')(event), json.dumps(event, cls=DateTimeJSONEncoder))
+
+    @ddt.data(*sorted(SERIALIZERS))
+    def test_equivalent_output(self, name):
+        serializer = get_serializer(name)
+        for event in CONFORMANCE_EVENTS:
+            self.assertEqual(json.loads(serializer(event)), self.reference(event), event)
+
+    @ddt.data(*sorted(SERIALIZERS))
+    def test_unserializable(self, name):
+        with self.assertRaises(TypeError):
+            get_serializer(name)({'foo': object()})
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_fast_is_orjson(self):
+        self.assertIs(get_serializer('fast'), get_serializer('orjson'))
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(ValueError):
+            get_serializer('unknown')
+        with self.assertRaises(ValueError):
+            LoggerBackend(serializer='unknown')
+
+    def test_register_serializer(self):
+        with patch.dict(SERIALIZERS):
+            register_serializer('custom', lambda event: '{}')
+            self.assertEqual(get_serializer('custom')({'foo': 'bar'}), '{}')
+
+    @patch('eventtracking.backends.logger.logging')
+    def test_logger_backend_serializer(self, mock_logging):
+        backend = LoggerBackend(serializer='fast')
+        backend.send({'name': 'foo', 'time': NAIVE_TIME})
+
+        logged = mock_logging.getLogger.return_value.info.call_args.args[0]
+        self.assertEqual(json.loads(logged), {'name': 'foo', 'time': '2012-05-01T07:27:01.000200+00:00'})
+
+
+class TestDecodeJson(TestCase):
+    """Test decoding JSON documents"""
+
+    def test_decode(self):
+        encoded = json.dumps({'unicode': 'café ☃', 'numbers': [1, 2.5, 2 ** 70], 'nested': {'empty': []}})
+        self.assertEqual(decode_json(encoded), json.loads(encoded))
+
+    def test_documents_rejected_by_orjson(self):
+        self.assertTrue(math.isnan(decode_json('{"nan": NaN}')['nan']))
+
+    def test_without_orjson(self):
+        with patch('eventtracking.backends.logger.orjson', None):
+            self.assertEqual(decode_json('{"foo": "bar"}'), {'foo': 'bar'})
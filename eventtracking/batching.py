@@ -0,0 +1,129 @@
+"""
+Collect items and hand them over in batches from a background thread.
+
+Backends that write to slow sinks use a `Batcher` so that sending an event only appends it to a buffer, and the
+events are written in batches, amortizing the cost of each write.
+"""
+
+import logging
+import threading
+import time
+
+from eventtracking.instances import LiveInstances
+
+log = logging.getLogger(__name__)
+
+MAX_AGE = 1.0
+
+# The batchers that are not closed yet
+BATCHERS = LiveInstances(after_fork='_reset', at_exit='close')
+
+
+class Batcher:  # pylint: disable=too-many-instance-attributes
+    """
+    Buffer items and call `callback` with batches of them from a background thread.
+
+    A batch is handed over once it holds `max_count` items or `max_bytes` bytes, as measured by the sizes passed to
+    `add`, or once its oldest item was added `max_age` seconds ago. Limits that are None are not enforced. Items are
+    rejected while `max_buffer_bytes` bytes are waiting to be handed over.
+
+    Batches are handed over in order, one at a time, and hold at most `max_count` items. Exceptions raised by
+    `callback` are logged and the batch is lost. The thread is started when the first item is added, and again in a
+    forked child process, which does not inherit the items buffered by its parent. The remaining items are handed
+    over when the process exits or when `close` is called.
+    """
+
+    def __init__(self, callback, **kwargs):
+        self.callback = callback
+        self.max_count = kwargs.get('max_count')
+        self.max_bytes = kwargs.get('max_bytes')
+        self.max_age = kwargs.get('max_age', MAX_AGE)
+        self.max_buffer_bytes = kwargs.get('max_buffer_bytes')
+        self.name = kwargs.get('name', 'eventtracking-batcher')
+        self._reset()
+        self.closed = False
+        BATCHERS.add(self)
+
+    def _reset(self):
+        """Start with an empty buffer and no thread, also used in forked child processes"""
+        self.items = []
+        self.buffered_bytes = 0
+        self.started = None
+        self.condition = threading.Condition()
+        self.flush_lock = threading.RLock()
+        self.thread = None
+
+    def add(self, item, size=0):
+        """Buffer an item of `size` bytes. Returns False if it was rejected."""
+        with self.condition:
+            if self.closed:
+                return False
+            if self.max_buffer_bytes is not None and self.buffered_bytes + size > self.max_buffer_bytes:
+                return False
+            if not self.items:
+                self.started = time.monotonic()
+            self.items.append(item)
+            self.buffered_bytes += size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self.thread.start()
+            elif len(self.items) == 1 or self.is_full():
+                self.condition.notify()
+        return True
+
+    def is_full(self):
+        """Whether the buffered items should be handed over without waiting. Requires the condition."""
+        if self.max_count is not None and len(self.items) >= self.max_count:
+            return True
+        return self.max_bytes is not None and self.buffered_bytes >= self.max_bytes
+
+    def run(self):
+        """Hand over the buffered items whenever a batch is full or old enough"""
+        condition = self.condition
+        while True:
+            with condition:
+                while not self.closed:
+                    if not self.items:
+                        condition.wait()
+                        continue
+                    if self.is_full():
+                        break
+                    if self.max_age is None:
+                        condition.wait()
+                        continue
+                    remaining = self.started + self.max_age - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    condition.wait(remaining)
+                if self.closed:
+                    return
+            self.flush_safely()
+
+    def flush(self):
+        """Hand over the buffered items now, propagating the exceptions raised by `callback`"""
+        with self.flush_lock:
+            with self.condition:
+                items, self.items, self.buffered_bytes = self.items, [], 0
+            if not items:
+                return
+            batch_size = self.max_count or len(items)
+            for start in range(0, len(items), batch_size):
+                self.callback(items[start:start + batch_size])
+
+    def flush_safely(self):
+        """Hand over the buffered items now, logging the exceptions raised by `callback`"""
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.exception('Failed to hand over a batch of items from %s', self.name)
+
+    def close(self):
+        """Stop the thread and hand over the remaining items. Items added afterwards are rejected."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            thread = self.thread
+        BATCHERS.discard(self)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush_safely()
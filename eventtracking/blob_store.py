@@ -0,0 +1,61 @@
+"""
+Stores for large event payloads that should not travel through the Celery broker.
+
+An `AsyncRoutingBackend` configured with a `blob_store` saves the payload of events larger than its
+`claim_check_threshold` to the store and only enqueues a reference to it, following the claim check pattern. The
+`send_event` task loads the payload back from the store and removes it once the event has been delivered.
+
+All blob stores must implement `put`, `get` and `delete` methods. Since the payload is read by a Celery worker,
+possibly on a different host, the store must be reachable from the workers as well as from the web processes.
+"""
+
+import os
+import tempfile
+from uuid import uuid4
+
+
+class FileSystemBlobStore:
+    """
+    Store blobs as files in a local (or network mounted) directory.
+
+    `path` is the directory where blobs are saved, it is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _blob_path(self, key):
+        """Return the path of the file holding the blob identified by `key`"""
+        if os.path.basename(key) != key:
+            raise ValueError(f'Invalid blob key {key!r}')
+        return os.path.join(self.path, key)
+
+    def put(self, data):
+        """Save `data` (bytes) and return the key to use to get it back"""
+        key = uuid4().hex
+        # Write to a temporary file first so that a reader never sees a partially written blob.
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as blob_file:
+                blob_file.write(data)
+            os.replace(temporary_path, self._blob_path(key))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+        return key
+
+    def get(self, key):
+        """Return the data saved with `key`. Raises a `KeyError` if there is no such blob."""
+        try:
+            with open(self._blob_path(key), 'rb') as blob_file:
+                return blob_file.read()
+        except FileNotFoundError as error:
+            raise KeyError(key) from error
+
+    def delete(self, key):
+        """Remove the blob saved with `key`, if it exists"""
+        try:
+            os.unlink(self._blob_path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,116 @@
+"""
+Local storage for events that could not be delivered asynchronously.
+
+When the `send_event` Celery task exhausts its retries the event would otherwise be lost. An `AsyncRoutingBackend`
+configured with a `dead_letter_store` hands such events to the store instead, along with the name of the target
+backend and the error that was raised. The events can later be replayed with the `replay_dead_letters` management
+command once the failing sink has recovered.
+
+All dead letter stores must implement `add`, `fetch`, `delete` and `count` methods.
+"""
+
+from collections import namedtuple
+from contextlib import closing, contextmanager
+from datetime import datetime
+import sqlite3
+
+from kombu.utils.json import dumps, loads
+from pytz import UTC
+
+
+DeadLetter = namedtuple('DeadLetter', ['id', 'backend_name', 'event', 'error', 'created'])
+
+
+class SQLiteDeadLetterStore:
+    """
+    Store dead letters in a local SQLite database.
+
+    A new connection is opened for every operation, so a single store can safely be shared between threads and
+    between the processes of a Celery worker pool. Events are encoded with the JSON codec of kombu, like the Celery
+    tasks, so their datetimes are fetched as datetimes.
+
+    `path` is the location of the database file, it is created if it does not exist.
+    `timeout` is the number of seconds to wait for a concurrent writer to release the database lock.
+    """
+
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS dead_letters ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' backend_name TEXT NOT NULL,'
+                ' event TEXT NOT NULL,'
+                ' error TEXT,'
+                ' created TEXT NOT NULL'
+                ')'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS dead_letters_backend_name ON dead_letters (backend_name, id)'
+            )
+
+    def _connect(self):
+        """Open a new connection to the database"""
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    @contextmanager
+    def _transaction(self):
+        """Open a new connection and commit the changes made with it, or roll them back on error."""
+        with closing(self._connect()) as connection:
+            with connection:
+                yield connection
+
+    def add(self, backend_name, event, error=None):
+        """Save an event that could not be delivered to the backend named `backend_name`."""
+        with self._transaction() as connection:
+            connection.execute(
+                'INSERT INTO dead_letters (backend_name, event, error, created) VALUES (?, ?, ?, ?)',
+                (
+                    backend_name,
+                    dumps(event),
+                    repr(error) if error is not None else None,
+                    datetime.now(UTC).isoformat(),
+                )
+            )
+
+    def fetch(self, backend_name=None, limit=100, after_id=0):
+        """
+        Return up to `limit` dead letters, oldest first, with an id greater than `after_id`.
+
+        Only dead letters destined to `backend_name` are returned if it is provided.
+        """
+        query = 'SELECT id, backend_name, event, error, created FROM dead_letters WHERE id > ?'
+        parameters = [after_id]
+        if backend_name is not None:
+            query += ' AND backend_name = ?'
+            parameters.append(backend_name)
+        query += ' ORDER BY id LIMIT ?'
+        parameters.append(limit)
+
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+
+        return [
+            DeadLetter(row_id, name, loads(event), error, created)
+            for row_id, name, event, error, created in rows
+        ]
+
+    def delete(self, ids):
+        """Remove the dead letters with the given ids, typically once they have been replayed."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._transaction() as connection:
+            connection.executemany('DELETE FROM dead_letters WHERE id = ?', [(row_id,) for row_id in ids])
+
+    def count(self, backend_name=None):
+        """Return the number of stored dead letters, optionally only those destined to `backend_name`."""
+        query = 'SELECT COUNT(*) FROM dead_letters'
+        parameters = []
+        if backend_name is not None:
+            query += ' WHERE backend_name = ?'
+            parameters.append(backend_name)
+
+        with closing(self._connect()) as connection:
+            return connection.execute(query, parameters).fetchone()[0]
@@ -1,6 +1,8 @@
 """
 New AppConfig for Django 1.8
 """
+import sys
+
 from django.apps import AppConfig
 
 
@@ -23,3 +25,8 @@ class EventTrackingConfig(AppConfig):
         override_default_tracker()
 
         from eventtracking import handlers  # pylint: disable=import-outside-toplevel, unused-import
+
+        # Register the `send_event` task in Celery workers, whose backends may never be constructed when they are
+        # lazy (see `DjangoTracker`). Processes that did not import Celery do not pay for importing it.
+        if 'celery' in sys.modules:
+            from eventtracking import tasks  # pylint: disable=import-outside-toplevel, unused-import
@@ -2,34 +2,97 @@
 A django specific tracker.
 """
 from importlib import import_module
+import logging
+import threading
 
 from django.conf import settings
 
 from eventtracking import tracker
+from eventtracking.backends.event_bus import allowed_event_names
+from eventtracking.backends.routing import RoutingBackend
 from eventtracking.tracker import Tracker
 from eventtracking.locator import ThreadLocalContextLocator
 
+log = logging.getLogger(__name__)
 
 DJANGO_BACKEND_SETTING_NAME = 'EVENT_TRACKING_BACKENDS'
 DJANGO_PROCESSOR_SETTING_NAME = 'EVENT_TRACKING_PROCESSORS'
 DJANGO_ENABLED_SETTING_NAME = 'EVENT_TRACKING_ENABLED'
+DJANGO_LAZY_SETTING_NAME = 'EVENT_TRACKING_LAZY_ENGINES'
+
+# The attributes of a `LazyEngine` that are never forwarded to its engine
+LAZY_ENGINE_ATTRIBUTES = frozenset(('_tracker', '_name', '_options', '_engine_class', '_instance', '_lock'))
 
 
 class DjangoTracker(Tracker):
     """
     A `eventtracking.tracker.Tracker` that constructs its backends from
     Django settings.
+
+    When `lazy` is true, or when it is None and the `EVENT_TRACKING_LAZY_ENGINES` setting is true, every
+    engine of the settings is a `LazyEngine`, which imports and constructs it when it is first used.
+
+    The backends and processors can be constructed again from the settings with `reload`.
     """
 
     def __init__(
             self,
             backends_settings_name=DJANGO_BACKEND_SETTING_NAME,
-            processors_settings_name=DJANGO_PROCESSOR_SETTING_NAME
+            processors_settings_name=DJANGO_PROCESSOR_SETTING_NAME,
+            lazy=None
     ):
+        if lazy is None:
+            lazy = getattr(settings, DJANGO_LAZY_SETTING_NAME, False)
+        self.lazy = lazy
+        self.backends_settings_name = backends_settings_name
+        self.processors_settings_name = processors_settings_name
         backends = self.create_backends_from_settings(backends_settings_name)
         processors = self.create_processors_from_settings(processors_settings_name)
         super().__init__(backends, ThreadLocalContextLocator(), processors)
 
+    def reload(self, backends=None, processors=None):
+        """
+        Construct the backends and processors again and swap them in, without restarting the process.
+
+        `backends` and `processors` are configurations in the format of the settings, the settings are read again
+        when they are None. The new routing backend replaces the current one with a single assignment, so
+        concurrently emitted events are sent either to the old or to the new backends, without locking. The old
+        backends are then closed (see `RoutingBackend.close`), which sends the events they buffer, and the old
+        routing backend is returned. Events sent to the old backends while they are closed may be dropped.
+
+        The names of the events sent to the event bus are read again from the `EVENT_BUS_TRACKING_LOGS` setting.
+
+        If the new configuration cannot be constructed, the error is raised and the current backends are kept.
+        """
+        if backends is None:
+            backends = getattr(settings, self.backends_settings_name, {})
+        if processors is None:
+            processors = getattr(settings, self.processors_settings_name, [])
+        routing_backend = RoutingBackend(
+            backends=self._instantiate_objects(backends),
+            processors=self._instantiate_objects(processors),
+        )
+
+        allowed_event_names.cache_clear()
+        previous, self.routing_backend = self.routing_backend, routing_backend
+        previous.close()
+        return previous
+
+    def reload_in_background(self, backends=None, processors=None):
+        """Call `reload` from a new thread, logging its errors, and return the thread"""
+        thread = threading.Thread(
+            target=self._reload_safely, args=(backends, processors), name='eventtracking-reload', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _reload_safely(self, backends, processors):
+        """Call `reload`, logging its errors"""
+        try:
+            self.reload(backends, processors)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.exception('Unable to reload the configuration of the tracker, the current one is kept')
+
     def create_backends_from_settings(self, settings_name):
         """
         Expects the Django setting with `settings_name` (default: "EVENT_TRACKING_BACKENDS")
@@ -123,11 +186,19 @@ class DjangoTracker(Tracker):
         which contains the full module path to the class, and an "OPTIONS"
         key which contains a dictionary that will be passed in to the
         constructor as keyword args.
+
+        Returns a `LazyEngine` constructing the object when it is first used if the tracker is lazy.
         """
 
         name = values['ENGINE']
         options = values.get('OPTIONS', {})
 
+        if self.lazy:
+            return LazyEngine(self, name, options)
+        return self._construct(name, options)
+
+    def _load_class(self, name):
+        """Import the class with the full module path `name`"""
         # Parse the name
         parts = name.split('.')
         module_name = '.'.join(parts[:-1])
@@ -136,10 +207,13 @@ class DjangoTracker(Tracker):
         # Get the class
         try:
             module = import_module(module_name)
-            cls = getattr(module, class_name)
+            return getattr(module, class_name)
         except (ValueError, AttributeError, TypeError, ImportError) as error:
             raise ValueError('Cannot find class %s' % name) from error
 
+    def _construct(self, name, options):
+        """Construct an object of the class `name` with the `options`, instantiating the objects they describe"""
+        cls = self._load_class(name)
         options = self._instantiate_objects(options)
         return cls(**options)
 
@@ -169,6 +243,86 @@ class DjangoTracker(Tracker):
         return processors
 
 
+class LazyEngine:
+    """
+    Proxy of a backend or processor of the Django settings, imported and constructed when it is first used.
+
+    Importing and constructing the engines can be slow, for example when they connect to a database or import
+    large packages. A `DjangoTracker` whose engines are lazy is constructed quickly, and the engines that are
+    never used, for example by a management command that does not emit events, are never constructed.
+
+    Sending an event to the proxy, calling it or getting an attribute it does not define constructs the engine,
+    once, and forwards to it. `isinstance` checks import the class of the engine without constructing it. Errors
+    raised while importing or constructing the engine are raised when it is first used rather than when the tracker
+    is constructed, and again every time it is used.
+    """
+
+    def __init__(self, django_tracker, name, options):
+        self._tracker = django_tracker
+        self._name = name
+        self._options = options
+        self._engine_class = None
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine_class(self):
+        """The class of the engine, imported when it is first needed"""
+        if self._engine_class is None:
+            self._engine_class = self._tracker._load_class(self._name)  # pylint: disable=protected-access
+        return self._engine_class
+
+    @property
+    def __class__(self):
+        """Make `isinstance` checks against the class of the engine succeed"""
+        try:
+            return self.engine_class
+        except ValueError:
+            # The error is raised when the engine is used
+            return LazyEngine
+
+    @property
+    def instance(self):
+        """The engine, constructed when it is first needed"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._tracker._construct(  # pylint: disable=protected-access
+                        self._name, self._options
+                    )
+                instance = self._instance
+        return instance
+
+    @property
+    def constructed(self):
+        """Whether the engine was constructed"""
+        return self._instance is not None
+
+    def close(self):
+        """Close the engine if it was constructed and has a `close` method, without constructing it"""
+        close = getattr(self._instance, 'close', None)
+        if close is not None:
+            close()
+
+    def send(self, event):
+        """Send the event to the engine"""
+        return self.instance.send(event)
+
+    def __call__(self, *args, **kwargs):
+        return self.instance(*args, **kwargs)  # pylint: disable=not-callable
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in LAZY_ENGINE_ATTRIBUTES:
+            # Looked up before __init__ ran, by copy or pickle for example
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+    def __repr__(self):
+        state = 'constructed' if self.constructed else 'not constructed'
+        return f'<LazyEngine {self._name} ({state})>'
+
+
 def override_default_tracker():
     """Sets the default tracker to a DjangoTracker"""
     if getattr(settings, DJANGO_ENABLED_SETTING_NAME, False):
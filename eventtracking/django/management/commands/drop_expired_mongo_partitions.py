@@ -0,0 +1,45 @@
+"""
+Drop the expired partitions of the configured MongoDB backends.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+
+from eventtracking.backends.mongodb import MongoBackend
+from eventtracking.django.management.commands.ensure_mongo_indexes import find_backends
+from eventtracking.tracker import get_tracker
+
+
+class Command(BaseCommand):
+    """
+    Drop the collections of the partitions of the `MongoBackend` instances of the default tracker that are older
+    than their `retention`.
+
+    Backends drop their expired partitions by themselves whenever they start writing to a new partition, the
+    command is meant to be run periodically when events are not sent regularly.
+
+    Example::
+
+        ./manage.py drop_expired_mongo_partitions
+    """
+
+    help = 'Drop the partitions of the configured MongoDB backends that are older than their retention.'
+
+    def handle(self, *args, **options):
+        failed = []
+        for name, backend in find_backends(get_tracker().backends, MongoBackend):
+            if backend.retention is None:
+                continue
+            try:
+                dropped = backend.drop_expired_partitions()
+            except PyMongoError as exc:
+                self.stderr.write(f'{name}: failed to drop the expired partitions, {exc!r}')
+                failed.append(name)
+                continue
+
+            if dropped:
+                self.stdout.write(f'{name}: dropped {", ".join(dropped)}')
+            else:
+                self.stdout.write(f'{name}: no expired partitions')
+
+        if failed:
+            raise CommandError('Failed to drop the expired partitions of: {}'.format(', '.join(failed)))
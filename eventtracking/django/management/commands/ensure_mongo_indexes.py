@@ -0,0 +1,54 @@
+"""
+Create the missing indexes of the collections of the configured MongoDB backends.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+
+from eventtracking.backends.mongodb import MongoBackend
+from eventtracking.tracker import get_tracker
+
+
+def find_backends(backends, backend_class, prefix=''):
+    """
+    Yield the dotted names and the instances of `backend_class` found in `backends` and in their nested backends.
+    """
+    for name, backend in backends.items():
+        path = prefix + name
+        if isinstance(backend, backend_class):
+            yield path, backend
+        nested = getattr(backend, 'backends', None)
+        if isinstance(nested, dict):
+            yield from find_backends(nested, backend_class, path + '.')
+
+
+class Command(BaseCommand):
+    """
+    Create the indexes of the collections of the `MongoBackend` instances of the default tracker.
+
+    Indexes that already exist are left untouched, so the command can safely be run at every deployment. It is
+    meant to be used with backends configured with `"create_indexes": None`.
+
+    Example::
+
+        ./manage.py ensure_mongo_indexes
+    """
+
+    help = 'Create the missing indexes of the collections of the configured MongoDB backends.'
+
+    def handle(self, *args, **options):
+        failed = []
+        for name, backend in find_backends(get_tracker().backends, MongoBackend):
+            try:
+                created = backend.ensure_indexes()
+            except PyMongoError as exc:
+                self.stderr.write(f'{name}: failed to create the indexes, {exc!r}')
+                failed.append(name)
+                continue
+
+            if created:
+                self.stdout.write(f'{name}: created {", ".join(created)}')
+            else:
+                self.stdout.write(f'{name}: indexes up to date')
+
+        if failed:
+            raise CommandError('Failed to create the indexes of: {}'.format(', '.join(failed)))
@@ -0,0 +1,130 @@
+"""
+Replay the events saved in the dead letter stores of the configured backends.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eventtracking.tracker import get_tracker
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Allow at most `rate` calls to `wait` per second, across all threads.
+
+    A `rate` of zero disables the limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller is allowed to proceed."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Command(BaseCommand):
+    """
+    Replay dead letters once the sinks that were failing have recovered.
+
+    Every backend of the default tracker that has a `dead_letter_store` is inspected. Events are delivered in
+    batches directly to the nested backends of the backend they were destined to. Events that are delivered
+    successfully are removed from the store, the others are kept for a later attempt.
+
+    Example::
+
+        ./manage.py replay_dead_letters --backend caliper --workers 8 --rate 200
+    """
+
+    help = 'Replay the events saved in the dead letter stores of the configured backends.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend', action='append', dest='backends', default=None,
+            help='Only replay the events of this top-level backend. Can be repeated.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of events read from the store at a time.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of events delivered in parallel.',
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Maximum number of events delivered per second, 0 means unlimited.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the number of stored events.',
+        )
+
+    def handle(self, *args, **options):
+        backends = {
+            name: backend
+            for name, backend in get_tracker().backends.items()
+            if getattr(backend, 'dead_letter_store', None) is not None
+        }
+        if options['backends']:
+            unknown = set(options['backends']) - set(backends)
+            if unknown:
+                raise CommandError('No dead letter store is configured for: {}'.format(', '.join(sorted(unknown))))
+            backends = {name: backends[name] for name in options['backends']}
+
+        for name, backend in backends.items():
+            pending = backend.dead_letter_store.count(name)
+            if options['dry_run']:
+                self.stdout.write(f'{name}: {pending} dead letters')
+                continue
+
+            replayed, failed = self.replay(name, backend, options)
+            self.stdout.write(f'{name}: replayed {replayed} of {pending} dead letters, {failed} failed')
+
+    def replay(self, name, backend, options):
+        """
+        Deliver all the dead letters of the backend named `name`.
+
+        Returns the number of events replayed and the number of events that failed again.
+        """
+        store = backend.dead_letter_store
+        limiter = RateLimiter(options['rate'])
+
+        def deliver(dead_letter):
+            limiter.wait()
+            try:
+                backend.send_to_backends(dead_letter.event, raise_errors=True)
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception('Failed to replay dead letter %s to backend %s', dead_letter.id, name)
+                return False
+            return True
+
+        replayed = failed = 0
+        after_id = 0
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            while True:
+                batch = store.fetch(name, limit=options['batch_size'], after_id=after_id)
+                if not batch:
+                    break
+                after_id = batch[-1].id
+
+                results = list(executor.map(deliver, batch))
+                store.delete(dead_letter.id for dead_letter, success in zip(batch, results) if success)
+                replayed += sum(results)
+                failed += len(results) - sum(results)
+
+        return replayed, failed
@@ -0,0 +1,89 @@
+"""
+Django middleware that sends the events emitted while handling a request as a single batch.
+"""
+import threading
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.dispatch import receiver
+
+from eventtracking.batching import Batcher
+from eventtracking.tracker import get_tracker
+
+DJANGO_BUFFER_FLUSH_SETTING_NAME = 'EVENT_TRACKING_BUFFER_FLUSH'
+# Send the buffered events from the thread of the request, once the response is sent
+FLUSH_AFTER_RESPONSE = 'after_response'
+# Send the buffered events from a background thread
+FLUSH_IN_BACKGROUND = 'background'
+
+# The events buffered during the last request of each thread, until its response is sent
+pending = threading.local()
+# The batcher created by `background_batcher`, when it was first needed
+batchers = {}
+batchers_lock = threading.Lock()
+
+
+class BufferedEventsMiddleware:
+    """
+    Buffer the events emitted by the default tracker while a request is handled, and send them as a single batch.
+
+    Each event is processed by the processors of the tracker when the batch is sent, and the backends with a
+    `send_batch` method, like `RoutingBackend` and `MongoBackend`, receive the whole batch at once.
+
+    The `EVENT_TRACKING_BUFFER_FLUSH` setting selects when the batch is sent:
+
+    * `after_response` - Once the response is sent, when Django sends the `request_finished` signal, the default.
+    * `background` - From a background thread, which sends the batches of the requests as soon as it can. The
+      batches waiting to be sent are sent when the process exits.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.flush = getattr(settings, DJANGO_BUFFER_FLUSH_SETTING_NAME, FLUSH_AFTER_RESPONSE)
+        if self.flush not in (FLUSH_AFTER_RESPONSE, FLUSH_IN_BACKGROUND):
+            raise ValueError(f'Unknown value for {DJANGO_BUFFER_FLUSH_SETTING_NAME} "{self.flush}"')
+
+    def __call__(self, request):
+        tracker = get_tracker()
+        # Left by a previous request whose response was not closed
+        send_pending_events()
+        if not tracker.start_buffering():
+            return self.get_response(request)
+        try:
+            return self.get_response(request)
+        finally:
+            events = tracker.stop_buffering()
+            if events:
+                if self.flush == FLUSH_IN_BACKGROUND:
+                    if not background_batcher().add((tracker, events)):
+                        tracker.send_batch(events)
+                else:
+                    pending.batch = (tracker, events)
+
+
+@receiver(request_finished)
+def send_pending_events(**kwargs):
+    """Send the events buffered during the last request of the thread, once its response is sent"""
+    batch = getattr(pending, 'batch', None)
+    if batch is None:
+        return
+    pending.batch = None
+    tracker, events = batch
+    tracker.send_batch(events)
+
+
+def background_batcher():
+    """Return the `Batcher` sending the batches of events of the requests from a background thread"""
+    with batchers_lock:
+        if 'batcher' not in batchers:
+            batchers['batcher'] = Batcher(send_batches, max_age=0, name='eventtracking-request-events')
+        return batchers['batcher']
+
+
+def send_batches(batches):
+    """Send the (tracker, events) batches of several requests, merging the batches of the same tracker"""
+    merged = {}
+    for tracker, events in batches:
+        merged.setdefault(id(tracker), (tracker, []))[1].extend(events)
+    for tracker, events in merged.values():
+        tracker.send_batch(events)
@@ -0,0 +1,200 @@
+"""Tests for the management commands of the django app"""
+
+from io import StringIO
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from pymongo.errors import PyMongoError
+
+from eventtracking.backends.async_routing import AsyncRoutingBackend
+from eventtracking.backends.mongodb import MongoBackend
+from eventtracking.backends.routing import RoutingBackend
+from eventtracking.dead_letter import SQLiteDeadLetterStore
+from eventtracking.django.management.commands.drop_expired_mongo_partitions import (
+    Command as DropExpiredMongoPartitionsCommand
+)
+from eventtracking.django.management.commands.ensure_mongo_indexes import Command as EnsureMongoIndexesCommand
+from eventtracking.django.management.commands.replay_dead_letters import Command, RateLimiter
+
+
+class TestReplayDeadLetters(TestCase):
+    """Tests for the `replay_dead_letters` command"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = SQLiteDeadLetterStore(os.path.join(directory, 'dead_letters.db'))
+        self.sink = MagicMock()
+        self.backend = AsyncRoutingBackend(
+            backend_name='async', backends={'sink': self.sink}, dead_letter_store=self.store
+        )
+        patcher = patch('eventtracking.django.management.commands.replay_dead_letters.get_tracker')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value.backends = {'async': self.backend, 'other': MagicMock(dead_letter_store=None)}
+
+    def call_command(self, *args):
+        """Run the command and return its output"""
+        out = StringIO()
+        call_command(Command(), *args, stdout=out)
+        return out.getvalue()
+
+    def test_replay(self):
+        for i in range(5):
+            self.store.add('async', {'name': 'event', 'sequence': i})
+
+        output = self.call_command('--batch-size', '2', '--workers', '3')
+
+        self.assertIn('async: replayed 5 of 5 dead letters, 0 failed', output)
+        self.assertEqual(sorted(c.args[0]['sequence'] for c in self.sink.send.call_args_list), [0, 1, 2, 3, 4])
+        self.assertEqual(self.store.count(), 0)
+
+    def test_failed_replay_is_kept(self):
+        self.store.add('async', {'name': 'event'})
+        self.sink.send.side_effect = ConnectionError
+
+        with self.assertLogs('eventtracking', level='ERROR'):
+            output = self.call_command('--backend', 'async')
+
+        self.assertIn('async: replayed 0 of 1 dead letters, 1 failed', output)
+        self.assertEqual(self.store.count(), 1)
+
+    def test_failure_of_a_nested_routing_backend_is_kept(self):
+        self.store.add('async', {'name': 'event'})
+        sink = MagicMock()
+        sink.send.side_effect = ConnectionError
+        self.backend.register_backend('nested', RoutingBackend(backends={'sink': sink}))
+
+        with self.assertLogs('eventtracking', level='ERROR'):
+            output = self.call_command('--backend', 'async')
+
+        self.assertIn('async: replayed 0 of 1 dead letters, 1 failed', output)
+        self.assertEqual(self.store.count(), 1)
+        self.sink.send.assert_called_once()
+
+    def test_dry_run(self):
+        self.store.add('async', {'name': 'event'})
+
+        output = self.call_command('--dry-run')
+
+        self.assertIn('async: 1 dead letters', output)
+        self.sink.send.assert_not_called()
+
+    def test_unknown_backend(self):
+        with self.assertRaises(CommandError):
+            self.call_command('--backend', 'other')
+
+
+class TestRateLimiter(TestCase):
+    """Tests for the `RateLimiter` used when replaying dead letters"""
+
+    @patch('eventtracking.django.management.commands.replay_dead_letters.time')
+    def test_wait(self, mock_time):
+        mock_time.monotonic.return_value = 100.0
+        limiter = RateLimiter(4)
+
+        limiter.wait()
+        mock_time.sleep.assert_not_called()
+        limiter.wait()
+        mock_time.sleep.assert_called_once_with(0.25)
+
+    @patch('eventtracking.django.management.commands.replay_dead_letters.time')
+    def test_unlimited(self, mock_time):
+        RateLimiter(0).wait()
+        mock_time.sleep.assert_not_called()
+
+
+class TestEnsureMongoIndexes(TestCase):
+    """Tests for the `ensure_mongo_indexes` command"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch('eventtracking.backends.mongodb.MongoClient', side_effect=lambda **kwargs: MagicMock())
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.mongo = MongoBackend(create_indexes=None, share_client=False)
+        self.nested_mongo = MongoBackend(create_indexes=None, share_client=False)
+        for backend in (self.mongo, self.nested_mongo):
+            backend.collection.index_information.return_value = {'_id_': {'key': [('_id', 1)]}}
+            backend.collection.create_index.side_effect = lambda keys: f'{keys[0][0]}_{keys[0][1]}'
+
+        patcher = patch('eventtracking.django.management.commands.ensure_mongo_indexes.get_tracker')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value.backends = {
+            'mongo': self.mongo,
+            'routing': RoutingBackend(backends={'mongo': self.nested_mongo, 'other': MagicMock()}),
+        }
+
+    def call_command(self):
+        """Run the command and return its output"""
+        out = StringIO()
+        err = StringIO()
+        call_command(EnsureMongoIndexesCommand(), stdout=out, stderr=err)
+        return out.getvalue() + err.getvalue()
+
+    def test_create_indexes(self):
+        output = self.call_command()
+        self.assertIn('mongo: created time_-1, name_1', output)
+        self.assertIn('routing.mongo: created time_-1, name_1', output)
+
+    def test_indexes_up_to_date(self):
+        self.mongo.collection.index_information.return_value = {
+            '_id_': {'key': [('_id', 1)]},
+            'time_-1': {'key': [('time', -1)]},
+            'name_1': {'key': [('name', 1)]},
+        }
+        output = self.call_command()
+        self.assertIn('mongo: indexes up to date', output)
+        self.mongo.collection.create_index.assert_not_called()
+
+    def test_failure(self):
+        self.mongo.collection.index_information.side_effect = PyMongoError('unreachable')
+        with self.assertRaisesRegex(CommandError, 'Failed to create the indexes of: mongo'):
+            self.call_command()
+        self.nested_mongo.collection.create_index.assert_called()
+
+
+class TestDropExpiredMongoPartitions(TestCase):
+    """Tests for the `drop_expired_mongo_partitions` command"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch('eventtracking.backends.mongodb.MongoClient', side_effect=lambda **kwargs: MagicMock())
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        self.mongo = MongoBackend(partition='day', retention=86400, share_client=False)
+        self.mongo.database.list_collection_names.return_value = ['events_20000101', 'events_20000102']
+        self.unpartitioned = MongoBackend(share_client=False)
+
+        patcher = patch('eventtracking.django.management.commands.drop_expired_mongo_partitions.get_tracker')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value.backends = {
+            'mongo': self.mongo,
+            'routing': RoutingBackend(backends={'unpartitioned': self.unpartitioned}),
+        }
+
+    def call_command(self):
+        """Run the command and return its output"""
+        out = StringIO()
+        err = StringIO()
+        call_command(DropExpiredMongoPartitionsCommand(), stdout=out, stderr=err)
+        return out.getvalue() + err.getvalue()
+
+    def test_drop_expired_partitions(self):
+        output = self.call_command()
+        self.assertEqual(output, 'mongo: dropped events_20000101, events_20000102\n')
+        self.unpartitioned.database.list_collection_names.assert_not_called()
+
+    def test_no_expired_partitions(self):
+        self.mongo.database.list_collection_names.return_value = []
+        self.assertIn('mongo: no expired partitions', self.call_command())
+
+    def test_failure(self):
+        self.mongo.database.drop_collection.side_effect = PyMongoError('unreachable')
+        with self.assertRaisesRegex(CommandError, 'Failed to drop the expired partitions of: mongo'):
+            self.call_command()
@@ -4,10 +4,13 @@
 from unittest import TestCase
 
 from unittest.mock import sentinel
+from django.conf import settings
 from django.test.utils import override_settings
 
 from eventtracking import tracker
-from eventtracking.django.django_tracker import DjangoTracker, override_default_tracker
+from eventtracking.backends.event_bus import allowed_event_names
+from eventtracking.backends.routing import RoutingBackend
+from eventtracking.django.django_tracker import DjangoTracker, LazyEngine, override_default_tracker
 
 
 TEST_TRACKER_NAME = 'django.test.tracker'
@@ -232,6 +235,169 @@ class TestConfiguration(TestCase):
         self.assertTrue(isinstance(self.tracker.processors[1], NopProcessor))
 
 
+LAZY_BACKENDS = {
+    'outer_backend': {
+        'ENGINE': 'eventtracking.backends.routing.RoutingBackend',
+        'OPTIONS': {
+            'backends': {
+                'inner_backend': {
+                    'ENGINE': 'eventtracking.django.tests.test_configuration.CountingBackend',
+                    'OPTIONS': {
+                        'option': sentinel.option_value
+                    }
+                },
+            },
+        }
+    },
+    'invalid_class': {
+        'ENGINE': 'eventtracking.django.tests.test_configuration.BarBackend'
+    },
+}
+
+
+class TestLazyConfiguration(TestCase):
+    """Tests the lazy construction of the engines of the django tracker"""
+
+    def setUp(self):
+        super().setUp()
+        lazy_settings = override_settings(EVENT_TRACKING_LAZY_ENGINES=True, EVENT_TRACKING_BACKENDS=LAZY_BACKENDS)
+        lazy_settings.enable()
+        self.addCleanup(lazy_settings.disable)
+        CountingBackend.instances = 0
+        self.tracker = DjangoTracker()
+
+    def test_engines_are_not_constructed(self):
+        outer_backend = self.tracker.get_backend('outer_backend')
+        self.assertIs(type(outer_backend), LazyEngine)
+        self.assertFalse(outer_backend.constructed)
+        self.assertEqual(CountingBackend.instances, 0)
+        self.assertIn('not constructed', repr(outer_backend))
+
+    def test_engines_are_constructed_once_when_used(self):
+        self.tracker.emit('foo')
+        self.tracker.emit('bar')
+
+        outer_backend = self.tracker.get_backend('outer_backend')
+        self.assertTrue(outer_backend.constructed)
+        inner_backend = outer_backend.backends['inner_backend']
+        self.assertEqual(CountingBackend.instances, 1)
+        self.assertEqual(inner_backend.option, sentinel.option_value)
+        self.assertEqual([event['name'] for event in inner_backend.events], ['foo', 'bar'])
+
+    def test_isinstance_does_not_construct(self):
+        self.assertIsInstance(self.tracker.get_backend('outer_backend'), RoutingBackend)
+        self.assertEqual([name for name, _ in self.tracker.backends_of_type(RoutingBackend)], ['outer_backend'])
+        self.assertFalse(self.tracker.get_backend('outer_backend').constructed)
+
+    def test_errors_are_raised_when_used(self):
+        self.assertNotIsInstance(self.tracker.get_backend('invalid_class'), RoutingBackend)
+        with self.assertRaises(ValueError):
+            self.tracker.get_backend('invalid_class').send({'name': 'foo'})
+
+    def test_missing_attribute(self):
+        with self.assertRaises(AttributeError):
+            _ = self.tracker.get_backend('outer_backend').missing
+
+    @override_settings(EVENT_TRACKING_PROCESSORS=[
+        {
+            'ENGINE': 'eventtracking.django.tests.test_configuration.ProcessorWithOptions',
+            'OPTIONS': {
+                'option': sentinel.option_value
+            }
+        }
+    ])
+    def test_processors(self):
+        self.tracker = DjangoTracker()
+        processor = self.tracker.processors[0]
+        self.assertIs(type(processor), LazyEngine)
+        self.assertEqual(processor({'name': 'foo'}), None)
+        self.assertEqual(processor.option, sentinel.option_value)
+
+    @override_settings(EVENT_TRACKING_BACKENDS={'outer_backend': LAZY_BACKENDS['outer_backend']})
+    def test_lazy_argument(self):
+        self.assertIsInstance(DjangoTracker(lazy=False).get_backend('outer_backend'), RoutingBackend)
+        with override_settings(EVENT_TRACKING_LAZY_ENGINES=False):
+            self.assertIs(type(DjangoTracker(lazy=True).get_backend('outer_backend')), LazyEngine)
+
+
+class TestReload(TestCase):
+    """Tests reloading the configuration of the django tracker"""
+
+    def setUp(self):
+        super().setUp()
+        reload_settings = override_settings(
+            EVENT_TRACKING_BACKENDS={'outer_backend': LAZY_BACKENDS['outer_backend']},
+            EVENT_TRACKING_PROCESSORS=[],
+        )
+        reload_settings.enable()
+        self.addCleanup(reload_settings.disable)
+        self.tracker = DjangoTracker(lazy=False)
+
+    def inner_backend(self):
+        """The backend the events are sent to"""
+        return self.tracker.get_backend('outer_backend').backends['inner_backend']
+
+    def test_reload(self):
+        previous_backend = self.inner_backend()
+        previous_routing_backend = self.tracker.routing_backend
+
+        with override_settings(EVENT_TRACKING_PROCESSORS=[
+            {'ENGINE': 'eventtracking.django.tests.test_configuration.NopProcessor'}
+        ]):
+            self.assertIs(self.tracker.reload(), previous_routing_backend)
+        self.tracker.emit('foo')
+
+        self.assertIsNot(self.inner_backend(), previous_backend)
+        self.assertTrue(previous_backend.closed)
+        self.assertFalse(self.inner_backend().closed)
+        self.assertEqual(previous_backend.events, [])
+        self.assertEqual([event['name'] for event in self.inner_backend().events], ['foo'])
+        self.assertIsInstance(self.tracker.processors[0], NopProcessor)
+
+    def test_reload_event_bus_names(self):
+        with override_settings(EVENT_BUS_TRACKING_LOGS=['foo']):
+            self.assertIn('foo', allowed_event_names())
+            # Changed without the signal sent by the tests, like in a running process
+            settings.EVENT_BUS_TRACKING_LOGS = ['bar']
+            self.assertNotIn('bar', allowed_event_names())
+
+            self.tracker.reload()
+            self.assertIn('bar', allowed_event_names())
+            self.assertNotIn('foo', allowed_event_names())
+
+    def test_reload_configuration(self):
+        self.tracker.reload(backends={
+            'trivial': {'ENGINE': 'eventtracking.django.tests.test_configuration.TrivialFakeBackend'}
+        })
+        self.assertEqual(list(self.tracker.backends), ['trivial'])
+
+    def test_invalid_configuration_is_not_swapped_in(self):
+        previous_backend = self.inner_backend()
+        with self.assertRaises(ValueError):
+            self.tracker.reload(backends=LAZY_BACKENDS)
+        self.assertIs(self.inner_backend(), previous_backend)
+        self.assertFalse(previous_backend.closed)
+
+    def test_reload_in_background(self):
+        previous_backend = self.inner_backend()
+        self.tracker.reload_in_background().join()
+        self.assertIsNot(self.inner_backend(), previous_backend)
+
+        with self.assertLogs('eventtracking.django.django_tracker', level='ERROR'):
+            self.tracker.reload_in_background(backends=LAZY_BACKENDS).join()
+
+    def test_lazy_engines_are_not_constructed_to_be_closed(self):
+        CountingBackend.instances = 0
+        self.tracker = DjangoTracker(lazy=True)
+        self.tracker.reload()
+        self.assertEqual(CountingBackend.instances, 0)
+
+        self.tracker.emit('foo')
+        backend = self.inner_backend()
+        self.tracker.reload()
+        self.assertTrue(backend.closed)
+
+
 class TrivialFakeBackend:
     """A trivial fake backend without any options"""
 
@@ -274,3 +440,23 @@ class NestedBackend(TrivialFakeBackend):
     def __init__(self, backends=None, processors=None, **_kwargs):
         self.backends = backends or {}
         self.processors = processors or []
+
+
+class CountingBackend(FakeBackendWithOptions):
+    """A fake backend counting its instances and recording the events it receives"""
+
+    instances = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        CountingBackend.instances += 1
+        self.events = []
+        self.closed = False
+
+    def send(self, event):
+        """Record the event"""
+        self.events.append(event)
+
+    def close(self):
+        """Record that the backend was closed"""
+        self.closed = True
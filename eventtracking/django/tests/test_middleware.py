@@ -0,0 +1,98 @@
+"""Tests the middleware sending the events of a request as a single batch"""
+
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from django.http import HttpResponse
+from django.test.utils import override_settings
+
+from eventtracking import tracker
+from eventtracking.django.middleware import BufferedEventsMiddleware, background_batcher, batchers, pending
+
+
+class TestBufferedEventsMiddleware(TestCase):
+    """Tests the middleware sending the events of a request as a single batch"""
+
+    def setUp(self):
+        super().setUp()
+        self.backend = MagicMock()
+        self.tracker = tracker.Tracker({'backend': self.backend})
+        tracker.register_tracker(self.tracker)
+        self.addCleanup(setattr, pending, 'batch', None)
+
+    def view(self, request):
+        """Emit two events"""
+        self.tracker.emit('foo')
+        self.tracker.emit('bar')
+        return HttpResponse()
+
+    def sent_batches(self):
+        """Return the names of the events of each batch sent to the backend"""
+        return [[event['name'] for event in call.args[0]] for call in self.backend.send_batch.call_args_list]
+
+    def test_events_are_sent_after_the_response(self):
+        response = BufferedEventsMiddleware(self.view)(MagicMock())
+        self.backend.send_batch.assert_not_called()
+
+        response.close()
+        self.assertEqual(self.sent_batches(), [['foo', 'bar']])
+        self.backend.send.assert_not_called()
+
+        # Events emitted outside of a request are sent at once
+        self.tracker.emit('baz')
+        self.assertEqual(self.backend.send.call_args.args[0]['name'], 'baz')
+
+    def test_events_of_unclosed_responses_are_sent_with_the_next_request(self):
+        middleware = BufferedEventsMiddleware(self.view)
+        middleware(MagicMock())
+        middleware(MagicMock()).close()
+        self.assertEqual(self.sent_batches(), [['foo', 'bar'], ['foo', 'bar']])
+
+    def test_events_are_sent_when_the_view_fails(self):
+        def failing_view(request):
+            self.tracker.emit('foo')
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            BufferedEventsMiddleware(failing_view)(MagicMock())
+        HttpResponse().close()
+        self.assertEqual(self.sent_batches(), [['foo']])
+
+    def test_nested_buffering(self):
+        with self.tracker.buffered():
+            BufferedEventsMiddleware(self.view)(MagicMock()).close()
+            self.backend.send_batch.assert_not_called()
+        self.assertEqual(self.sent_batches(), [['foo', 'bar']])
+
+    @override_settings(EVENT_TRACKING_BUFFER_FLUSH='background')
+    def test_events_are_sent_in_background(self):
+        self.addCleanup(batchers.clear)
+        middleware = BufferedEventsMiddleware(self.view)
+        middleware(MagicMock())
+        deadline = time.time() + 5
+        while not self.backend.send_batch.called and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.sent_batches(), [['foo', 'bar']])
+
+        background_batcher().close()
+        middleware(MagicMock())
+        self.assertEqual(self.sent_batches(), [['foo', 'bar'], ['foo', 'bar']])
+
+    def test_batches_of_the_same_tracker_are_merged(self):
+        self.addCleanup(batchers.clear)
+        batcher = background_batcher()
+        other_backend = MagicMock()
+        other_tracker = tracker.Tracker({'backend': other_backend})
+        with patch.object(batcher, 'thread'):
+            batcher.add((self.tracker, [{'name': 'foo'}]))
+            batcher.add((other_tracker, [{'name': 'bar'}]))
+            batcher.add((self.tracker, [{'name': 'baz'}]))
+            batcher.close()
+        self.assertEqual(self.sent_batches(), [['foo', 'baz']])
+        self.assertEqual(other_backend.send_batch.call_args.args[0], [{'name': 'bar'}])
+
+    @override_settings(EVENT_TRACKING_BUFFER_FLUSH='later')
+    def test_unknown_flush(self):
+        with self.assertRaises(ValueError):
+            BufferedEventsMiddleware(self.view)
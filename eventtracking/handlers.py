@@ -1,19 +1,68 @@
 """
 This module contains the handlers for signals emitted by the analytics app.
 """
-import json
 import logging
+import threading
+from copy import deepcopy
 
+from django.conf import settings
+from django.core.signals import setting_changed
 from django.dispatch import receiver
 from openedx_events.analytics.signals import TRACKING_EVENT_EMITTED
 from openedx_events.tooling import SIGNAL_PROCESSED_FROM_EVENT_BUS
 
 from eventtracking.backends.event_bus import EventBusRoutingBackend
+from eventtracking.backends.logger import decode_json
+from eventtracking.batching import Batcher
 from eventtracking.processors.exceptions import EventEmissionExit
 from eventtracking.tracker import get_tracker
 
 logger = logging.getLogger(__name__)
 
+BATCH_INTERVAL = 1.0
+BATCH_SETTINGS = ("EVENT_BUS_TRACKING_LOGS_BATCH_SIZE", "EVENT_BUS_TRACKING_LOGS_BATCH_INTERVAL")
+
+# The batcher created by `tracking_log_batcher` from the settings, when it was first needed
+batchers = {}
+batchers_lock = threading.Lock()
+
+
+def tracking_log_batcher():
+    """
+    Return the `Batcher` of the events received from the event bus, or None if they are not batched.
+
+    Events are batched when the `EVENT_BUS_TRACKING_LOGS_BATCH_SIZE` setting is larger than 1. A batch is processed
+    once it holds that many events, or once its oldest event was received `EVENT_BUS_TRACKING_LOGS_BATCH_INTERVAL`
+    seconds ago, 1 second by default.
+
+    Batching makes the delivery of these events at most once, instead of at least once: the event bus consumer
+    considers an event consumed once it is buffered, so the buffered events are lost if the process is killed or if
+    processing their batch fails. The buffered events are still processed when the process exits normally.
+    """
+    with batchers_lock:
+        if "batcher" not in batchers:
+            batch_size = getattr(settings, "EVENT_BUS_TRACKING_LOGS_BATCH_SIZE", None)
+            if not batch_size or batch_size <= 1:
+                batchers["batcher"] = None
+            else:
+                batchers["batcher"] = Batcher(
+                    send_events_to_engines,
+                    max_count=batch_size,
+                    max_age=getattr(settings, "EVENT_BUS_TRACKING_LOGS_BATCH_INTERVAL", BATCH_INTERVAL),
+                    name="eventtracking-event-bus-consumer",
+                )
+        return batchers["batcher"]
+
+
+@receiver(setting_changed)
+def reset_tracking_log_batcher(setting, **kwargs):
+    """Process the batched events and configure the batching again when its settings change"""
+    if setting in BATCH_SETTINGS:
+        with batchers_lock:
+            batcher = batchers.pop("batcher", None)
+        if batcher is not None:
+            batcher.close()
+
 
 @receiver(TRACKING_EVENT_EMITTED)
 def send_tracking_log_to_backends(
@@ -24,38 +73,73 @@ def send_tracking_log_to_backends(
 
     The process is the following:
 
-    1. Unserialize the tracking log from the signal.
-    2. Get the tracker instance to get the enabled backends (mongo, event_bus, logger, etc).
-    3. Get the event bus backends that are the interested in the signals (multiple can be configured).
+    1. Get the tracker instance to get the enabled backends (mongo, event_bus, logger, etc).
+    2. Get the event bus backends that are the interested in the signals (multiple can be configured).
+    3. Unserialize the tracking log from the signal, unless no backend is interested in it.
     4. Transform the event with the configured processors.
     5. Send the transformed event to the different event bus backends.
 
     This allows us to only send the tracking log to the event bus once and the event bus will send
     the transformed event to the different configured backends.
+
+    Processors may mutate the event in place, so each backend with processors transforms its own copy of
+    the event, unless no other backend uses the event.
+
+    When events are batched (see `tracking_log_batcher`), steps 4 and 5 run from a background thread for a whole
+    batch of events, so that backends with a `send_batch` method receive the batch at once.
     """
     if not kwargs.get(SIGNAL_PROCESSED_FROM_EVENT_BUS, False):
         logger.debug("Event received from a non-event bus backend, skipping...")
         return
+    tracker = get_tracker()
+
+    engines = tracker.backends_of_type(EventBusRoutingBackend)
+    if not engines:
+        return
+
     tracking_log = kwargs.get("tracking_log")
 
     event = {
         "name": tracking_log.name,
         "timestamp": tracking_log.timestamp,
-        "data": json.loads(tracking_log.data),
-        "context": json.loads(tracking_log.context),
+        "data": decode_json(tracking_log.data),
+        "context": decode_json(tracking_log.context),
     }
+    batcher = tracking_log_batcher()
+    if batcher is not None and batcher.add(event):
+        return
 
-    tracker = get_tracker()
-
-    engines = {
-        name: engine
-        for name, engine in tracker.backends.items()
-        if isinstance(engine, EventBusRoutingBackend)
-    }
-    for name, engine in engines.items():
+    for engine, engine_event in isolated_per_engine(engines, event):
         try:
-            processed_event = engine.process_event(event)
+            processed_event = engine.process_event(engine_event)
             logger.info('Successfully processed event "{}"'.format(event["name"]))
             engine.send_to_backends(processed_event.copy())
         except EventEmissionExit:
             logger.info("[EventEmissionExit] skipping event {}".format(event["name"]))
+
+
+def send_events_to_engines(events):
+    """Transform a batch of events received from the event bus and send it to the event bus backends"""
+    engines = get_tracker().backends_of_type(EventBusRoutingBackend)
+    for engine, engine_events in isolated_per_engine(engines, events):
+        processed_events = engine.process_batch(engine_events)
+        logger.info("Successfully processed %d of %d events", len(processed_events), len(events))
+        engine.send_batch_to_backends([event.copy() for event in processed_events])
+
+
+def isolated_per_engine(engines, value):
+    """
+    Yield each engine with the event, or batch of events, it transforms.
+
+    Engines with processors get a deep copy of `value`, unless no other engine uses it.
+    """
+    last = len(engines) - 1
+    shared = False
+    for index, (_, engine) in enumerate(engines):
+        if not engine.processors:
+            shared = True
+            yield engine, value
+        elif index < last or shared:
+            yield engine, deepcopy(value)
+        else:
+            yield engine, value
@@ -0,0 +1,67 @@
+"""
+Call a method of the live instances of a class in forked child processes and when the process exits.
+
+Backends that own threads, buffers or connections need to reset them in a forked child process, and to flush them
+when the process exits. Hooks registered with `os.register_at_fork` and `atexit` for every instance can never be
+removed and keep the instance alive, so backends that are replaced when the configuration is reloaded would leak.
+Each class instead registers one hook for all its instances in a `LiveInstances` registry, which only holds weak
+references to them.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import weakref
+
+log = logging.getLogger(__name__)
+
+
+class LiveInstances:
+    """
+    A set of instances whose `after_fork` method is called in forked child processes, and whose `at_exit` method is
+    called when the process exits, if they are provided.
+
+    Instances are only weakly referenced, instances that are closed should be removed with `discard`. Exceptions
+    raised by the methods are logged, so that the other instances are still called.
+    """
+
+    def __init__(self, after_fork=None, at_exit=None):
+        self.after_fork = after_fork
+        self.at_exit = at_exit
+        self.instances = weakref.WeakSet()
+        self.lock = threading.Lock()
+        if after_fork is not None:
+            os.register_at_fork(after_in_child=self._after_fork)
+        if at_exit is not None:
+            atexit.register(self._at_exit)
+
+    def add(self, instance):
+        """Call the methods of `instance` from the hooks"""
+        with self.lock:
+            self.instances.add(instance)
+
+    def discard(self, instance):
+        """Stop calling the methods of `instance` from the hooks"""
+        with self.lock:
+            self.instances.discard(instance)
+
+    def _after_fork(self):
+        """Call `after_fork` on every instance, in a forked child process"""
+        # The lock may have been held by another thread of the parent process at the time of the fork
+        self.lock = threading.Lock()
+        self.call(self.after_fork)
+
+    def _at_exit(self):
+        """Call `at_exit` on every instance, when the process exits"""
+        self.call(self.at_exit)
+
+    def call(self, name):
+        """Call the method `name` of every instance, logging its exceptions"""
+        with self.lock:
+            instances = list(self.instances)
+        for instance in instances:
+            try:
+                getattr(instance, name)()
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception('Failed to call %s of %r', name, instance)
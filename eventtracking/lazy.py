@@ -0,0 +1,78 @@
+"""
+Context values computed when an event that is sent to a backend needs them.
+
+Values of a context entered with `Tracker.enter_context` that are callable are wrapped in a `LazyValue`. Events hold
+the wrapper until they reach a backend: the routing backends replace the wrappers by their value before sending an
+event to a backend that is not a routing backend, once the processors have run, so that events filtered out never
+compute them. The function is called once per context entry, however many events and backends need its value.
+"""
+
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+UNRESOLVED = object()
+
+
+class LazyValue:
+    """
+    A context value computed by calling `function`, without arguments, when it is first needed.
+
+    Copies of the events share the wrapper (see `__deepcopy__`), so the function is called at most once. If it raises
+    an exception, the error is logged and the value is None.
+    """
+
+    __slots__ = ('function', 'value', 'lock')
+
+    def __init__(self, function):
+        self.function = function
+        self.value = UNRESOLVED
+        self.lock = threading.Lock()
+
+    def resolve(self):
+        """Return the value, calling the function if it was not called yet"""
+        value = self.value
+        if value is UNRESOLVED:
+            with self.lock:
+                if self.value is UNRESOLVED:
+                    try:
+                        self.value = self.function()
+                    except Exception:  # pylint: disable=broad-exception-caught
+                        log.exception('Failed to compute the context value of %r', self.function)
+                        self.value = None
+                value = self.value
+        return value
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __copy__(self):
+        return self
+
+    def __repr__(self):
+        if self.value is UNRESOLVED:
+            return f'<LazyValue {self.function!r} (unresolved)>'
+        return f'<LazyValue {self.value!r}>'
+
+
+def wrap_lazy_values(context):
+    """Return the context with its callable values wrapped in a `LazyValue`, or the context if it has none"""
+    if not any(callable(value) for value in context.values()):
+        return context
+    return {key: LazyValue(value) if callable(value) else value for key, value in context.items()}
+
+
+def resolve_lazy_values(event):
+    """
+    Replace the `LazyValue` of the context of the event by their value, in place.
+
+    Returns True if the event held lazy values.
+    """
+    context = event.get('context')
+    if not isinstance(context, dict):
+        return False
+    lazy_keys = [key for key, value in context.items() if isinstance(value, LazyValue)]
+    for key in lazy_keys:
+        context[key] = context[key].resolve()
+    return bool(lazy_keys)
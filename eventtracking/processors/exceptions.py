@@ -21,3 +21,15 @@ class NoBackendEnabled(Exception):
     Raise this exception when there is no backend enabled
     for an event.
     """
+
+
+class BackendDeliveryError(Exception):
+    """
+    Raised by `RoutingBackend.send_to_backends` when it is asked to report the backends that failed to send an event.
+
+    `backends` holds the names of these backends.
+    """
+
+    def __init__(self, backends):
+        super().__init__('Unable to send the event to backends: {}'.format(', '.join(backends)))
+        self.backends = backends
@@ -0,0 +1,190 @@
+"""
+Local append-only spool for records that cannot be handed over to their destination right away.
+
+The `AsyncRoutingBackend` spools the Celery tasks it fails to enqueue, for example while the broker is unreachable,
+and re-enqueues them once the broker is back.
+
+All spools must implement `append` and `drain` methods.
+"""
+
+import glob
+import logging
+import os
+import threading
+import time
+from uuid import uuid4
+
+log = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.spool'
+DRAINING_SUFFIX = '.draining'
+
+
+class FileSpool:
+    """
+    Spool records as JSON lines in files of a local directory.
+
+    Records are encoded with the JSON codec of kombu, like the Celery tasks, so their datetimes are drained as
+    datetimes.
+
+    Every process appends to its own file, so that several processes (like the workers of a preforking server) can
+    share the same directory. A drain claims a file by atomically renaming it, hence a file is only ever drained once.
+    Spool files are prefixed with the pid of the process that owns them. The files left behind by other processes,
+    including the files claimed by a drain that did not complete, are drained once they have not been written to
+    or claimed for `stale_after` seconds.
+
+    `path` is the spool directory, it is created if it does not exist.
+    """
+
+    def __init__(self, path, stale_after=300.0):
+        self.path = path
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _own_file(self):
+        """The file the current process appends to"""
+        return os.path.join(self.path, f'{os.getpid()}{SPOOL_SUFFIX}')
+
+    def _new_file(self, suffix):
+        """A new unique file name owned by the current process"""
+        return os.path.join(self.path, f'{os.getpid()}.{uuid4().hex}{suffix}')
+
+    def append(self, record):
+        """Append a JSON serializable `record` to the spool"""
+        # Importing kombu is slow, this module is imported along with the async routing backend
+        from kombu.utils.json import dumps  # pylint: disable=import-outside-toplevel
+        line = dumps(record) + '\n'
+        with self.lock:
+            with open(self._own_file(), 'a', encoding='utf-8') as spool_file:
+                spool_file.write(line)
+
+    def __len__(self):
+        """The number of spooled records waiting to be drained"""
+        count = 0
+        for file_name in glob.glob(os.path.join(self.path, '*' + SPOOL_SUFFIX)):
+            with open(file_name, encoding='utf-8') as spool_file:
+                count += sum(1 for _ in spool_file)
+        return count
+
+    def _claim(self, file_name):
+        """Rename `file_name` so that no other drain or writer uses it. Returns the new name or None."""
+        claimed = self._new_file(DRAINING_SUFFIX)
+        try:
+            os.rename(file_name, claimed)
+        except FileNotFoundError:
+            # Claimed by a concurrent drain
+            return None
+        # The rename keeps the modification time, the claimed file would look stale to the other drains right away
+        os.utime(claimed)
+        return claimed
+
+    def _claimable_files(self):
+        """
+        Yield the names of the spool files that can be drained by the current process.
+
+        These are its own spool files and the stale spool files of other processes, and the stale files left behind
+        by the drains of processes that died. The files being drained by the current process are never yielded.
+        """
+        pid = str(os.getpid())
+        stale_before = time.time() - self.stale_after
+        for pattern in (SPOOL_SUFFIX, DRAINING_SUFFIX):
+            for file_name in sorted(glob.glob(os.path.join(self.path, '*' + pattern))):
+                owned = os.path.basename(file_name).split('.')[0] == pid
+                if owned and pattern == DRAINING_SUFFIX:
+                    continue
+                try:
+                    if owned or os.path.getmtime(file_name) < stale_before:
+                        yield file_name
+                except FileNotFoundError:
+                    continue
+
+    def drain(self, callback, batch_size=100):
+        """
+        Call `callback` with batches of at most `batch_size` spooled records, oldest first.
+
+        Records are removed from the spool once `callback` returns. If it raises an exception the records of the
+        failed batch and all those that follow are kept in the spool for a later drain, and the exception is
+        propagated.
+
+        Returns the number of records drained.
+        """
+        from kombu.utils.json import loads  # pylint: disable=import-outside-toplevel
+        drained = 0
+        for file_name in self._claimable_files():
+            with self.lock:
+                claimed = self._claim(file_name)
+            if claimed is None:
+                continue
+
+            with open(claimed, encoding='utf-8') as spool_file:
+                lines = [line for line in spool_file if line.strip()]
+
+            for start in range(0, len(lines), batch_size):
+                try:
+                    callback([loads(line) for line in lines[start:start + batch_size]])
+                except BaseException:
+                    self._restore(claimed, lines[start:])
+                    raise
+                drained += len(lines[start:start + batch_size])
+
+            try:
+                os.unlink(claimed)
+            except FileNotFoundError:
+                # Considered stale and claimed by another drain in the meantime
+                pass
+
+        return drained
+
+    def _restore(self, claimed, lines):
+        """Put the `lines` of the claimed file back in the spool"""
+        with open(claimed, 'w', encoding='utf-8') as spool_file:
+            spool_file.writelines(lines)
+        os.replace(claimed, self._new_file(SPOOL_SUFFIX))
+
+
+class SpoolDrainer:
+    """
+    Drain a spool from a background thread.
+
+    The thread is only started when `notify` is called after records were appended to the spool. Every
+    `interval` seconds it drains the spool by calling `callback` with batches of `batch_size` records. It stops
+    once a drain completes without any new record having been appended in the meantime. A failed drain is retried
+    after `interval` seconds.
+    """
+
+    def __init__(self, spool, callback, interval=5.0, batch_size=100):
+        self.spool = spool
+        self.callback = callback
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.thread = None
+        self.notified = False
+
+    def notify(self):
+        """Signal that records were appended to the spool, starting the drain thread if needed"""
+        with self.lock:
+            self.notified = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='eventtracking-spool-drainer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """Drain the spool until it stays empty"""
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                self.notified = False
+            try:
+                drained = self.spool.drain(self.callback, self.batch_size)
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.warning('Failed to drain spool %s, retrying in %s seconds', self.spool.path, self.interval)
+                continue
+
+            if drained:
+                log.info('Drained %d records from spool %s', drained, self.spool.path)
+            with self.lock:
+                if not self.notified:
+                    self.thread = None
+                    return
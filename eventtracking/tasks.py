@@ -1,10 +1,9 @@
 """
 Celery tasks
 """
-
 from celery.utils.log import get_task_logger
 from celery import shared_task
-from edx_django_utils.monitoring import set_code_owner_attribute_from_module
+from kombu.utils.json import loads
 from eventtracking.tracker import get_tracker
 from eventtracking.processors.exceptions import (
     NoBackendEnabled,
@@ -14,12 +13,12 @@ from eventtracking.processors.exceptions import (
 logger = get_task_logger(__name__)
 # Maximum number of retries before giving up on rounting event
 MAX_RETRIES = 3
-# Number of seconds after task is retried
+# Number of seconds after task is retried, doubled on every subsequent retry
 COUNTDOWN = 30
 
 
 @shared_task(bind=True)
-def send_event(self, backend_name, processed_event):
+def send_event(self, backend_name, processed_event, claim_check=None):
     """
     Send event to configured top-level backend asynchronously.
 
@@ -30,16 +29,29 @@ def send_event(self, backend_name, processed_event):
     - That the top-level processors have already been run on the event
     - That the named backend is a RoutingBackend (or descendent)
 
+    Once all retries are exhausted the event is handed to the dead letter
+    store of the backend, if one is configured.
+
     Arguments:
         self (dict): task
         backend_name (str):  name of the backend to use
-        processed_event (dict): Processed event dict
+        processed_event (dict): Processed event dict, or a stub containing
+            only the event name when `claim_check` is provided
+        claim_check (str): key of the processed event payload in the blob
+            store of the backend
     """
+    # Only imported in the workers, importing the monitoring utilities is slow
+    from edx_django_utils.monitoring import (  # pylint: disable=import-outside-toplevel
+        set_code_owner_attribute_from_module,
+    )
     set_code_owner_attribute_from_module(self.__module__)
     try:
         tracker = get_tracker()
         backend = tracker.backends[backend_name]
-        backend.send_to_backends(processed_event.copy())
+        if claim_check is not None:
+            processed_event = loads(backend.blob_store.get(claim_check))
+        # Raises when a nested backend fails, so that the event is retried
+        backend.send_to_backends(processed_event.copy(), raise_errors=True)
 
     except (NoTransformerImplemented, NoBackendEnabled) as exc:
         logger.info(
@@ -52,4 +64,52 @@ def send_event(self, backend_name, processed_event):
             '[send_event] Failed to send event [%s] with backend [%s], [%s]',
             processed_event['name'], backend_name, repr(exc)
         )
-        raise self.retry(exc=exc, countdown=COUNTDOWN, max_retries=MAX_RETRIES)
+        if self.request.retries >= MAX_RETRIES:
+            saved = dead_letter(backend_name, processed_event, exc)
+            # The task fails for good when the event is not saved, its payload would never be removed
+            release_claim_check(backend_name, claim_check)
+            if saved:
+                return
+        raise self.retry(exc=exc, countdown=COUNTDOWN * 2 ** self.request.retries, max_retries=MAX_RETRIES)
+
+    release_claim_check(backend_name, claim_check)
+
+
+def release_claim_check(backend_name, claim_check):
+    """
+    Remove the payload saved with `claim_check` from the blob store of the backend named `backend_name`.
+    """
+    if claim_check is None:
+        return
+    try:
+        get_tracker().backends[backend_name].blob_store.delete(claim_check)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception(
+            '[send_event] Failed to remove claim check [%s] from the blob store of backend [%s]',
+            claim_check, backend_name
+        )
+
+
+def dead_letter(backend_name, processed_event, exc):
+    """
+    Save an event that could not be delivered in the dead letter store of the backend named `backend_name`.
+
+    Returns True if the event was saved.
+    """
+    try:
+        store = getattr(get_tracker().backends.get(backend_name), 'dead_letter_store', None)
+        if store is None:
+            return False
+        store.add(backend_name, processed_event, exc)
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception(
+            '[send_event] Failed to save event [%s] to the dead letter store of backend [%s]',
+            processed_event['name'], backend_name
+        )
+        return False
+
+    logger.warning(
+        '[send_event] Saved event [%s] to the dead letter store of backend [%s]',
+        processed_event['name'], backend_name
+    )
+    return True
@@ -0,0 +1,124 @@
+"""Tests for the batching of items from a background thread"""
+
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from eventtracking.batching import Batcher
+
+
+class TestBatcher(TestCase):
+    """Tests for the batching of items from a background thread"""
+
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+        self.handed_over = threading.Event()
+
+    def callback(self, items):
+        """Record a batch of items"""
+        self.batches.append(items)
+        self.handed_over.set()
+
+    def create_batcher(self, **kwargs):
+        """Create a batcher, closed at the end of the test"""
+        batcher = Batcher(self.callback, **kwargs)
+        self.addCleanup(batcher.close)
+        return batcher
+
+    def test_thread_is_started_lazily(self):
+        batcher = self.create_batcher(max_age=None)
+        self.assertIsNone(batcher.thread)
+        batcher.add('foo')
+        self.assertTrue(batcher.thread.daemon)
+        self.assertEqual(batcher.thread.name, 'eventtracking-batcher')
+
+    def test_max_count(self):
+        batcher = self.create_batcher(max_count=2, max_age=None)
+        batcher.add('foo')
+        batcher.add('bar')
+        self.assertTrue(self.handed_over.wait(5))
+        self.assertEqual(self.batches, [['foo', 'bar']])
+
+    def test_max_bytes(self):
+        batcher = self.create_batcher(max_bytes=10, max_age=None)
+        batcher.add('foo', 5)
+        time.sleep(0.05)
+        self.assertEqual(self.batches, [])
+        batcher.add('bar', 5)
+        self.assertTrue(self.handed_over.wait(5))
+        self.assertEqual(self.batches, [['foo', 'bar']])
+
+    def test_max_age(self):
+        batcher = self.create_batcher(max_age=0.05)
+        start = time.monotonic()
+        batcher.add('foo')
+        self.assertTrue(self.handed_over.wait(5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(self.batches, [['foo']])
+
+        self.handed_over.clear()
+        batcher.add('bar')
+        self.assertTrue(self.handed_over.wait(5))
+        self.assertEqual(self.batches, [['foo'], ['bar']])
+
+    def test_max_buffer_bytes(self):
+        batcher = self.create_batcher(max_age=None, max_buffer_bytes=10)
+        self.assertTrue(batcher.add('foo', 6))
+        self.assertFalse(batcher.add('bar', 6))
+        self.assertTrue(batcher.add('baz', 4))
+        batcher.flush()
+        self.assertEqual(self.batches, [['foo', 'baz']])
+
+    def test_flush_splits_batches(self):
+        batcher = self.create_batcher(max_count=2)
+        with patch.object(batcher, 'thread'):
+            for item in range(5):
+                batcher.add(item)
+        batcher.flush()
+        self.assertEqual(self.batches, [[0, 1], [2, 3], [4]])
+
+    def test_flush_empty(self):
+        self.create_batcher().flush()
+        self.assertEqual(self.batches, [])
+
+    def test_close(self):
+        batcher = self.create_batcher(max_age=None)
+        batcher.add('foo')
+        batcher.close()
+        self.assertFalse(batcher.thread.is_alive())
+        self.assertEqual(self.batches, [['foo']])
+
+        self.assertFalse(batcher.add('bar'))
+        batcher.close()
+        self.assertEqual(self.batches, [['foo']])
+
+    def test_close_from_callback(self):
+        batcher = self.create_batcher(max_count=1)
+
+        def close(items):
+            self.callback(items)
+            batcher.close()
+
+        batcher.callback = close
+        batcher.add('foo')
+        self.assertTrue(self.handed_over.wait(5))
+        batcher.thread.join(5)
+        self.assertFalse(batcher.thread.is_alive())
+
+    def test_callback_failure(self):
+        batcher = self.create_batcher(max_count=1)
+        batcher.callback = lambda items: 1 / 0
+        with self.assertLogs('eventtracking.batching', level='ERROR'):
+            batcher.add('foo')
+            batcher.close()
+
+    def test_reset(self):
+        batcher = self.create_batcher(max_age=None)
+        batcher.add('foo')
+        batcher._reset()  # pylint: disable=protected-access
+        self.assertIsNone(batcher.thread)
+        batcher.add('bar')
+        batcher.close()
+        self.assertEqual(self.batches, [['bar']])
@@ -0,0 +1,43 @@
+"""
+Tests for the blob stores.
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from eventtracking.blob_store import FileSystemBlobStore
+
+
+class TestFileSystemBlobStore(TestCase):
+    """
+    Test `FileSystemBlobStore`.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'blobs')
+        self.store = FileSystemBlobStore(self.path)
+
+    def test_put_get_delete(self):
+        key = self.store.put(b'{"name": "foo"}')
+        self.assertEqual(self.store.get(key), b'{"name": "foo"}')
+
+        self.store.delete(key)
+        with self.assertRaises(KeyError):
+            self.store.get(key)
+        self.store.delete(key)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_invalid_key(self):
+        with self.assertRaises(ValueError):
+            self.store.get('../foo')
+
+    @patch('eventtracking.blob_store.os.replace', side_effect=OSError)
+    def test_failed_put_leaves_no_file(self, _mock_replace):
+        with self.assertRaises(OSError):
+            self.store.put(b'data')
+        self.assertEqual(os.listdir(self.path), [])
@@ -0,0 +1,56 @@
+"""
+Tests for the dead letter stores.
+"""
+from datetime import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pytz import UTC
+
+from eventtracking.dead_letter import SQLiteDeadLetterStore
+
+
+class TestSQLiteDeadLetterStore(TestCase):
+    """
+    Test `SQLiteDeadLetterStore`.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = SQLiteDeadLetterStore(os.path.join(directory, 'dead_letters.db'))
+
+    def test_add_and_fetch(self):
+        self.store.add('backend_1', {'name': 'first', 'timestamp': datetime(2020, 1, 1, tzinfo=UTC)}, ValueError('x'))
+        self.store.add('backend_2', {'name': 'second'})
+
+        dead_letters = self.store.fetch()
+        self.assertEqual(len(dead_letters), 2)
+        self.assertEqual(dead_letters[0].backend_name, 'backend_1')
+        self.assertEqual(dead_letters[0].event, {'name': 'first', 'timestamp': datetime(2020, 1, 1, tzinfo=UTC)})
+        self.assertEqual(dead_letters[0].error, "ValueError('x')")
+        self.assertIsNone(dead_letters[1].error)
+
+    def test_fetch_filters(self):
+        for i in range(5):
+            self.store.add('backend_1', {'name': 'event', 'sequence': i})
+        self.store.add('backend_2', {'name': 'other'})
+
+        first = self.store.fetch('backend_1', limit=2)
+        self.assertEqual([d.event['sequence'] for d in first], [0, 1])
+        rest = self.store.fetch('backend_1', limit=10, after_id=first[-1].id)
+        self.assertEqual([d.event['sequence'] for d in rest], [2, 3, 4])
+        self.assertEqual(self.store.count('backend_1'), 5)
+        self.assertEqual(self.store.count(), 6)
+
+    def test_delete(self):
+        self.store.add('backend_1', {'name': 'first'})
+        self.store.add('backend_1', {'name': 'second'})
+
+        self.store.delete([self.store.fetch()[0].id])
+        self.store.delete([])
+
+        self.assertEqual([d.event['name'] for d in self.store.fetch()], ['second'])
@@ -2,15 +2,24 @@
 Test handlers for signals emitted by the analytics app
 """
 
+import threading
+import time
+from copy import deepcopy
+from types import SimpleNamespace
 from unittest.mock import Mock, patch
 
+from django.conf import settings
 from django.test import TestCase
 from django.test.utils import override_settings
 from openedx_events.analytics.data import TrackingLogData
 from openedx_events.tooling import SIGNAL_PROCESSED_FROM_EVENT_BUS
 
+from eventtracking.backends.event_bus import EventBusRoutingBackend
+from eventtracking.backends.tests import PerformanceTestCase
 from eventtracking.django.django_tracker import DjangoTracker
-from eventtracking.handlers import send_tracking_log_to_backends
+from eventtracking.handlers import reset_tracking_log_batcher, send_tracking_log_to_backends, tracking_log_batcher
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.tracker import Tracker
 
 
 class TestHandlers(TestCase):
@@ -137,3 +146,235 @@ class TestHandlers(TestCase):
         mock_logger.debug.assert_called_once_with(
             "Event received from a non-event bus backend, skipping..."
         )
+
+    @patch("eventtracking.handlers.decode_json")
+    @patch("eventtracking.handlers.get_tracker")
+    def test_tracking_log_is_not_decoded_without_engines(self, mock_get_tracker, mock_decode_json):
+        """
+        Test that the tracking log is not decoded when no event bus backend is configured
+        """
+        mock_get_tracker.return_value = Tracker({"logger": Mock()})
+
+        send_tracking_log_to_backends(
+            sender=None,
+            signal=None,
+            tracking_log=TrackingLogData(
+                name="test_name",
+                timestamp="test_timestamp",
+                data="{}",
+                context="{}",
+            ),
+            **{SIGNAL_PROCESSED_FROM_EVENT_BUS: True}
+        )
+
+        mock_decode_json.assert_not_called()
+
+    @patch("eventtracking.handlers.get_tracker")
+    def test_engines_are_isolated(self, mock_get_tracker):
+        """
+        Test that the processors of an engine do not change the event seen by the other engines
+        """
+        def mutate(event):
+            event["data"]["mutated"] = True
+            event["context"].clear()
+
+        received = {}
+        engines = {
+            "a_mutating": EventBusRoutingBackend(processors=[mutate]),
+            "b_plain": EventBusRoutingBackend(),
+            "c_mutating": EventBusRoutingBackend(processors=[mutate]),
+        }
+        for name, engine in engines.items():
+            engine.send_to_backends = lambda event, name=name: received.setdefault(name, event)
+        mock_get_tracker.return_value = Tracker(engines)
+
+        with patch("eventtracking.handlers.deepcopy", wraps=deepcopy) as mock_deepcopy:
+            send_tracking_log_to_backends(
+                sender=None,
+                signal=None,
+                tracking_log=TrackingLogData(
+                    name="test_name",
+                    timestamp="test_timestamp",
+                    data='{"foo": "bar"}',
+                    context='{"user_id": 1}',
+                ),
+                **{SIGNAL_PROCESSED_FROM_EVENT_BUS: True}
+            )
+
+        self.assertEqual(received["a_mutating"]["data"], {"foo": "bar", "mutated": True})
+        self.assertEqual(received["b_plain"]["data"], {"foo": "bar"})
+        self.assertEqual(received["b_plain"]["context"], {"user_id": 1})
+        self.assertEqual(received["c_mutating"]["context"], {})
+        # The last engine copies the event since the plain engine shares it
+        self.assertEqual(mock_deepcopy.call_count, 2)
+
+    @patch("eventtracking.handlers.deepcopy")
+    @patch("eventtracking.handlers.get_tracker")
+    def test_single_engine_is_not_copied(self, mock_get_tracker, mock_deepcopy):
+        """
+        Test that the event is not copied when a single engine uses it
+        """
+        engine = EventBusRoutingBackend(processors=[lambda event: event])
+        engine.send_to_backends = Mock()
+        mock_get_tracker.return_value = Tracker({"event_bus": engine})
+
+        send_tracking_log_to_backends(
+            sender=None,
+            signal=None,
+            tracking_log=TrackingLogData(name="test_name", timestamp="test_timestamp", data="{}", context="{}"),
+            **{SIGNAL_PROCESSED_FROM_EVENT_BUS: True}
+        )
+
+        mock_deepcopy.assert_not_called()
+        engine.send_to_backends.assert_called_once()
+
+
+@override_settings(EVENT_BUS_TRACKING_LOGS_BATCH_SIZE=3, EVENT_BUS_TRACKING_LOGS_BATCH_INTERVAL=None)
+class TestBatchedHandlers(TestCase):
+    """
+    Tests the batching of the events received from the event bus
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.batch_backend = Mock()
+        self.single_backend = Mock(spec=["send"])
+        self.engine = EventBusRoutingBackend(
+            backends={"batch": self.batch_backend, "single": self.single_backend},
+            processors=[self.abort_bar],
+        )
+        patcher = patch("eventtracking.handlers.get_tracker", return_value=Tracker({"event_bus": self.engine}))
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        # Start every test with a new batcher
+        self.addCleanup(reset_tracking_log_batcher, "EVENT_BUS_TRACKING_LOGS_BATCH_SIZE")
+
+    @staticmethod
+    def abort_bar(event):
+        """Filter out the events named bar"""
+        if event["name"] == "bar":
+            raise EventEmissionExit
+
+    def receive(self, *names):
+        """Receive a tracking log from the event bus for each name"""
+        for name in names:
+            send_tracking_log_to_backends(
+                sender=None,
+                signal=None,
+                tracking_log=TrackingLogData(name=name, timestamp="test_timestamp", data="{}", context="{}"),
+                **{SIGNAL_PROCESSED_FROM_EVENT_BUS: True}
+            )
+
+    def sent_batches(self):
+        """Return the names of the events of each batch sent to the batch backend"""
+        return [[event["name"] for event in call.args[0]] for call in self.batch_backend.send_batch.call_args_list]
+
+    def test_events_are_sent_in_batches(self):
+        batcher = tracking_log_batcher()
+        with patch.object(batcher, "thread"):
+            self.receive("foo", "bar", "baz", "qux")
+        self.batch_backend.send_batch.assert_not_called()
+
+        batcher.flush()
+        self.assertEqual(self.sent_batches(), [["foo", "baz"], ["qux"]])
+        self.batch_backend.send.assert_not_called()
+        self.assertEqual([call.args[0]["name"] for call in self.single_backend.send.call_args_list],
+                         ["foo", "baz", "qux"])
+
+    def test_full_batch_is_sent_from_the_background_thread(self):
+        self.receive("foo", "bar", "baz")
+        deadline = time.time() + 5
+        while not self.batch_backend.send_batch.called and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.sent_batches(), [["foo", "baz"]])
+
+    def test_batch_is_sent_when_the_settings_change(self):
+        with patch.object(tracking_log_batcher(), "thread"):
+            self.receive("foo")
+        with override_settings(EVENT_BUS_TRACKING_LOGS_BATCH_SIZE=None):
+            self.assertEqual(self.sent_batches(), [["foo"]])
+            self.assertIsNone(tracking_log_batcher())
+            self.receive("baz")
+            self.assertEqual(self.batch_backend.send.call_args.args[0]["name"], "baz")
+
+    def test_closed_batcher(self):
+        tracking_log_batcher().close()
+        self.receive("foo")
+        self.batch_backend.send_batch.assert_not_called()
+        self.assertEqual(self.batch_backend.send.call_args.args[0]["name"], "foo")
+
+    @patch("eventtracking.handlers.deepcopy", wraps=deepcopy)
+    def test_engines_are_isolated(self, mock_deepcopy):
+        plain_engine = EventBusRoutingBackend(backends={"batch": self.batch_backend})
+        tracker = Tracker({"a_event_bus": self.engine, "b_plain": plain_engine})
+        with patch("eventtracking.handlers.get_tracker", return_value=tracker):
+            with patch.object(tracking_log_batcher(), "thread"):
+                self.receive("foo", "bar")
+            tracking_log_batcher().flush()
+        self.assertEqual(self.sent_batches(), [["foo"], ["foo", "bar"]])
+        mock_deepcopy.assert_called_once()
+
+    def test_batcher_is_created_once(self):
+        def slow_batcher(*args, **kwargs):
+            time.sleep(0.01)
+            return Mock()
+
+        with patch("eventtracking.handlers.Batcher", side_effect=slow_batcher) as mock_batcher:
+            threads = [threading.Thread(target=tracking_log_batcher) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        mock_batcher.assert_called_once()
+
+    def test_batching_is_disabled_by_default(self):
+        with override_settings(EVENT_BUS_TRACKING_LOGS_BATCH_SIZE=None):
+            del settings.EVENT_BUS_TRACKING_LOGS_BATCH_SIZE
+            self.assertIsNone(tracking_log_batcher())
+
+
+class TestEventBusRoundTripPerformance(PerformanceTestCase):
+    """
+    Measure the time it takes to encode events to tracking logs and to decode them in the signal handler
+    """
+
+    def round_trip(self, serializer):
+        """Send `num_events` events through the event bus backend and the signal handler"""
+        producer = EventBusRoutingBackend(serializer=serializer)
+        consumer = EventBusRoutingBackend()
+        received = []
+        consumer.send_to_backends = received.append
+        tracking_logs = []
+        event = {
+            "name": "perf.event",
+            "timestamp": "2024-05-01T12:30:00.000000+00:00",
+            "data": {"payload": self.random_payload, "sequence": 1},
+            "context": {"user_id": 10, "course_id": "course-v1:edX+DemoX+Demo_Course", "path": "/event"},
+        }
+
+        tracker = SimpleNamespace(backends={"event_bus": consumer})
+
+        def send_event(tracking_log):
+            tracking_logs.append(tracking_log)
+
+        # Plain functions rather than mocks, whose calls would dominate the measure
+        with override_settings(SEND_TRACKING_EVENT_EMITTED_SIGNAL=True, EVENT_BUS_TRACKING_LOGS=["perf.*"]), \
+                patch("eventtracking.handlers.get_tracker", new=lambda: tracker), \
+                patch("eventtracking.backends.event_bus.TRACKING_EVENT_EMITTED.send_event", new=send_event):
+            with self.assert_execution_time_less_than_threshold():
+                for _ in range(self.num_events):
+                    producer.send(event)
+                for tracking_log in tracking_logs:
+                    send_tracking_log_to_backends(
+                        sender=None,
+                        signal=None,
+                        tracking_log=tracking_log,
+                        **{SIGNAL_PROCESSED_FROM_EVENT_BUS: True}
+                    )
+        self.assertEqual(len(received), self.num_events)
+
+    def test_json_round_trip(self):
+        self.round_trip("json")
+
+    def test_fast_round_trip(self):
+        self.round_trip("fast")
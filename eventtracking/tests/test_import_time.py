@@ -0,0 +1,116 @@
+"""
+Test that the slow dependencies of eventtracking are only imported when they are used
+"""
+
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+import ddt
+
+from eventtracking.backends.tests import PerformanceTestCase
+
+# Modules imported by Django itself, which are not part of the startup cost of eventtracking
+DJANGO_MODULES = "django.conf, django.dispatch, django.core.signals"
+MODULES = (
+    "eventtracking.tracker",
+    "eventtracking.django.django_tracker",
+    "eventtracking.backends.event_bus",
+    "eventtracking.backends.async_routing",
+    "eventtracking.handlers",
+)
+DEFERRED_PACKAGES = ("openedx_events", "celery", "edx_django_utils", "edx_toggles", "pymongo", "bson")
+
+
+def run_python(code, *options):
+    """Run `code` in a new Python interpreter and return its standard error"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="eventtracking.django.tests.settings")
+    result = subprocess.run(
+        [sys.executable, *options, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout, result.stderr
+
+
+def import_times(module):
+    """
+    Import `module` in a new Python interpreter with `-X importtime`.
+
+    Returns a dictionary mapping the name of every imported module to its cumulative import time in seconds.
+    """
+    _, stderr = run_python(f"import {DJANGO_MODULES}; import {module}", "-X", "importtime")
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@ddt.ddt
+class TestDeferredImports(TestCase):
+    """
+    Test that importing eventtracking does not import its slow dependencies
+    """
+
+    @ddt.data(*MODULES[:-1])
+    def test_dependencies_are_not_imported(self, module):
+        stdout, _ = run_python(
+            f"import sys, {module}; print(' '.join(name for name in {DEFERRED_PACKAGES} if name in sys.modules))"
+        )
+        self.assertEqual(stdout.strip(), "")
+
+    def test_handlers(self):
+        # The handlers connect to a signal of openedx_events, they can only defer the other dependencies
+        stdout, _ = run_python(
+            f"import sys, eventtracking.handlers; print(' '.join(name for name in {DEFERRED_PACKAGES} "
+            "if name in sys.modules))"
+        )
+        self.assertIn("openedx_events", stdout.split())
+        self.assertNotIn("celery", stdout.split())
+        self.assertNotIn("pymongo", stdout.split())
+
+    @ddt.data(("import celery; ", "True"), ("", "False"))
+    @ddt.unpack
+    def test_task_is_registered_when_celery_is_imported(self, prefix, registered):
+        # Celery workers import Celery before setting Django up, lazy backends may never import the task
+        stdout, _ = run_python(
+            f"{prefix}import sys, django; from django.conf import settings; "
+            "settings.EVENT_TRACKING_LAZY_ENGINES = True; django.setup(); "
+            "print('eventtracking.tasks' in sys.modules)"
+        )
+        self.assertEqual(stdout.strip(), registered)
+
+    def test_lazy_names_can_be_imported(self):
+        # pylint: disable=import-outside-toplevel
+        from eventtracking.backends import async_routing, event_bus
+        from eventtracking.tasks import send_event
+
+        self.assertIs(async_routing.send_event, send_event)
+        self.assertEqual(event_bus.TRACKING_EVENT_EMITTED.event_type, "org.openedx.analytics.tracking.event.emitted.v1")
+        with self.assertRaises(AttributeError):
+            _ = event_bus.missing
+        with self.assertRaises(AttributeError):
+            _ = async_routing.missing
+
+
+@ddt.ddt
+class TestImportTimePerformance(PerformanceTestCase):
+    """
+    Measure the time it takes to import the modules of eventtracking, once Django is imported.
+
+    Fails when importing a module takes longer than EVENT_TRACKING_PERF_IMPORT_THRESHOLD_SECONDS, 0.1 by default.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.import_threshold = float(os.getenv("EVENT_TRACKING_PERF_IMPORT_THRESHOLD_SECONDS", "0.1"))
+
+    @ddt.data(*MODULES)
+    def test_import_time(self, module):
+        # The best of a few runs, the first ones also measure reading the files from disk
+        elapsed_time = min(import_times(module)[module] for _ in range(3))
+        print(f"\nImporting {module} took {elapsed_time} seconds")
+        self.assertLessEqual(elapsed_time, self.import_threshold)
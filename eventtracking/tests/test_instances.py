@@ -0,0 +1,91 @@
+"""Tests for the hooks called on the live instances of a class"""
+
+import gc
+from unittest import TestCase
+from unittest.mock import patch
+
+from eventtracking.batching import BATCHERS, Batcher
+from eventtracking.instances import LiveInstances
+
+
+class Resource:
+    """Record the calls of the hooks"""
+
+    def __init__(self):
+        self.calls = []
+
+    def reset(self):
+        """Called in forked child processes"""
+        self.calls.append('reset')
+
+    def close(self):
+        """Called when the process exits"""
+        self.calls.append('close')
+
+
+class FailingResource(Resource):
+    """A resource that cannot be closed"""
+
+    def close(self):
+        raise OSError
+
+
+class TestLiveInstances(TestCase):
+    """Tests for the `LiveInstances` registry"""
+
+    def setUp(self):
+        super().setUp()
+        with patch('eventtracking.instances.os.register_at_fork') as mock_register_at_fork:
+            with patch('eventtracking.instances.atexit.register') as mock_atexit_register:
+                self.instances = LiveInstances(after_fork='reset', at_exit='close')
+        self.after_fork = mock_register_at_fork.call_args.kwargs['after_in_child']
+        self.at_exit = mock_atexit_register.call_args.args[0]
+
+    def test_hooks_are_called(self):
+        resource = Resource()
+        self.instances.add(resource)
+
+        self.after_fork()
+        self.at_exit()
+        self.assertEqual(resource.calls, ['reset', 'close'])
+
+    def test_discarded_instances_are_not_called(self):
+        resource = Resource()
+        self.instances.add(resource)
+        self.instances.discard(resource)
+
+        self.at_exit()
+        self.assertEqual(resource.calls, [])
+
+    def test_instances_are_not_kept_alive(self):
+        self.instances.add(Resource())
+        gc.collect()
+        self.assertEqual(len(self.instances.instances), 0)
+
+    def test_errors_are_logged(self):
+        failing, resource = FailingResource(), Resource()
+        self.instances.add(failing)
+        self.instances.add(resource)
+
+        with self.assertLogs('eventtracking.instances', level='ERROR'):
+            self.at_exit()
+        self.assertEqual(resource.calls, ['close'])
+
+    def test_lock_is_reset_after_fork(self):
+        # Held by another thread of the parent process at the time of the fork
+        self.instances.lock.acquire()  # pylint: disable=consider-using-with
+        self.after_fork()
+        self.assertFalse(self.instances.lock.locked())
+
+    def test_no_hooks(self):
+        with patch('eventtracking.instances.os.register_at_fork') as mock_register_at_fork:
+            with patch('eventtracking.instances.atexit.register') as mock_atexit_register:
+                LiveInstances()
+        mock_register_at_fork.assert_not_called()
+        mock_atexit_register.assert_not_called()
+
+    def test_closed_batchers_are_released(self):
+        batcher = Batcher(lambda items: None)
+        self.assertIn(batcher, BATCHERS.instances)
+        batcher.close()
+        self.assertNotIn(batcher, BATCHERS.instances)
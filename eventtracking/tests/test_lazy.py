@@ -0,0 +1,181 @@
+"""
+Test the lazily computed context values
+"""
+
+from copy import copy, deepcopy
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from eventtracking.backends.async_routing import AsyncRoutingBackend
+from eventtracking.backends.event_bus import EventBusRoutingBackend
+from eventtracking.backends.logger import EncodedEvent
+from eventtracking.backends.routing import RoutingBackend
+from eventtracking.lazy import LazyValue, resolve_lazy_values, wrap_lazy_values
+from eventtracking.processors.exceptions import EventEmissionExit
+from eventtracking.tracker import Tracker
+
+
+class TestLazyValue(TestCase):
+    """Test the `LazyValue` wrapper and its helpers"""
+
+    def test_resolved_once(self):
+        function = MagicMock(return_value='value')
+        value = LazyValue(function)
+
+        self.assertEqual(value.resolve(), 'value')
+        self.assertEqual(value.resolve(), 'value')
+        function.assert_called_once_with()
+
+    def test_copies_share_the_value(self):
+        function = MagicMock(return_value='value')
+        value = LazyValue(function)
+        event = {'context': {'user': value}}
+
+        self.assertIs(deepcopy(event)['context']['user'], value)
+        self.assertIs(copy(value), value)
+
+    def test_error(self):
+        value = LazyValue(MagicMock(side_effect=ValueError))
+
+        with self.assertLogs('eventtracking.lazy', level='ERROR'):
+            self.assertIsNone(value.resolve())
+
+    def test_repr(self):
+        value = LazyValue(lambda: 'value')
+        self.assertIn('unresolved', repr(value))
+        value.resolve()
+        self.assertEqual(repr(value), "<LazyValue 'value'>")
+
+    def test_wrap_without_callables(self):
+        context = {'user_id': 1}
+        self.assertIs(wrap_lazy_values(context), context)
+
+    def test_wrap(self):
+        context = {'user_id': 1, 'profile': MagicMock()}
+
+        wrapped = wrap_lazy_values(context)
+        self.assertEqual(wrapped['user_id'], 1)
+        self.assertIsInstance(wrapped['profile'], LazyValue)
+        self.assertNotIsInstance(context['profile'], LazyValue)
+
+    def test_resolve(self):
+        event = {'name': 'foo', 'context': {'user_id': 1, 'profile': LazyValue(lambda: 'profile')}}
+        self.assertTrue(resolve_lazy_values(event))
+        self.assertEqual(event['context'], {'user_id': 1, 'profile': 'profile'})
+
+        self.assertFalse(resolve_lazy_values(event))
+        self.assertFalse(resolve_lazy_values({'name': 'foo'}))
+
+
+class TestLazyContext(TestCase):
+    """Test that the callable context values are computed when an event reaches a backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.function = MagicMock(return_value='profile')
+        self.backend = MagicMock()
+
+    def test_resolved_once_for_all_backends(self):
+        other_backend = MagicMock()
+        tracker = Tracker({'first': self.backend, 'second': other_backend})
+        tracker.enter_context('user', {'user_id': 1, 'profile': self.function})
+
+        tracker.emit('foo')
+        tracker.emit('bar')
+
+        self.function.assert_called_once_with()
+        for backend in (self.backend, other_backend):
+            for (event,), _ in backend.send.call_args_list:
+                self.assertEqual(event['context'], {'user_id': 1, 'profile': 'profile'})
+
+    def test_resolved_again_for_a_new_context_entry(self):
+        tracker = Tracker({'backend': self.backend})
+        tracker.enter_context('user', {'profile': self.function})
+        tracker.emit('foo')
+        tracker.enter_context('user', {'profile': self.function})
+        tracker.emit('foo')
+
+        self.assertEqual(self.function.call_count, 2)
+
+    def test_not_resolved_when_filtered(self):
+        processor = MagicMock(side_effect=EventEmissionExit)
+        tracker = Tracker({'backend': self.backend}, processors=[processor])
+        tracker.enter_context('user', {'profile': self.function})
+
+        tracker.emit('foo')
+
+        self.function.assert_not_called()
+        self.backend.send.assert_not_called()
+
+    def test_processors_see_the_wrapper(self):
+        seen = []
+
+        def processor(event):
+            seen.append(event['context']['profile'])
+            return event
+
+        tracker = Tracker({'backend': self.backend}, processors=[processor])
+        tracker.enter_context('user', {'profile': self.function})
+
+        tracker.emit('foo')
+
+        self.assertIsInstance(seen[0], LazyValue)
+        self.assertEqual(self.backend.send.call_args[0][0]['context']['profile'], 'profile')
+
+    def test_nested_routing_backend_filters(self):
+        processor = MagicMock(side_effect=EventEmissionExit)
+        nested = RoutingBackend(backends={'backend': self.backend}, processors=[processor])
+        tracker = Tracker({'nested': nested})
+        tracker.enter_context('user', {'profile': self.function})
+
+        tracker.emit('foo')
+
+        self.function.assert_not_called()
+
+    def test_nested_routing_backend(self):
+        nested = RoutingBackend(backends={'backend': self.backend})
+        tracker = Tracker({'nested': nested, 'other': MagicMock()})
+        tracker.enter_context('user', {'profile': self.function})
+
+        tracker.emit('foo')
+
+        self.function.assert_called_once_with()
+        self.assertEqual(self.backend.send.call_args[0][0]['context']['profile'], 'profile')
+
+    def test_encoded_event_is_invalidated(self):
+        router = RoutingBackend(backends={'backend': self.backend})
+        event = EncodedEvent({'name': 'foo', 'context': {'profile': LazyValue(self.function)}})
+        with patch.object(EncodedEvent, 'invalidate') as mock_invalidate:
+            router.send(event)
+        mock_invalidate.assert_called_once_with()
+
+    def test_batch(self):
+        tracker = Tracker({'backend': self.backend})
+        tracker.enter_context('user', {'profile': self.function})
+
+        with tracker.buffered():
+            tracker.emit('foo')
+            tracker.emit('bar')
+
+        self.function.assert_called_once_with()
+        (events,), _ = self.backend.send_batch.call_args
+        self.assertEqual([event['context']['profile'] for event in events], ['profile', 'profile'])
+
+    @patch('eventtracking.backends.async_routing.AsyncRoutingBackend.enqueue')
+    def test_async_routing_backend(self, mock_enqueue):
+        tracker = Tracker({'async': AsyncRoutingBackend(backend_name='async', backends={'backend': self.backend})})
+        tracker.enter_context('user', {'profile': self.function})
+
+        tracker.emit('foo')
+
+        (_, event), _ = mock_enqueue.call_args[0]
+        self.assertEqual(event['context']['profile'], 'profile')
+
+    @patch('eventtracking.backends.event_bus.allowed_event_names', return_value=[])
+    def test_event_bus_filtered(self, _):
+        tracker = Tracker({'event_bus': EventBusRoutingBackend(backends={'backend': self.backend})})
+        tracker.enter_context('user', {'profile': self.function})
+
+        tracker.emit('foo')
+
+        self.function.assert_not_called()
@@ -0,0 +1,129 @@
+"""
+Tests for the spools.
+"""
+from datetime import datetime
+from itertools import chain, repeat
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pytz import UTC
+
+from eventtracking.spool import FileSpool, SpoolDrainer
+
+
+class TestFileSpool(TestCase):
+    """
+    Test `FileSpool`.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'spool')
+        self.spool = FileSpool(self.path)
+        self.drained = []
+
+    def drain(self, batch_size=100):
+        """Drain the spool into `self.drained`"""
+        return self.spool.drain(self.drained.append, batch_size)
+
+    def test_append_and_drain(self):
+        for i in range(5):
+            self.spool.append({'sequence': i, 'time': datetime(2020, 1, 1, tzinfo=UTC)})
+        self.assertEqual(len(self.spool), 5)
+
+        self.assertEqual(self.drain(batch_size=2), 5)
+
+        self.assertEqual([[r['sequence'] for r in batch] for batch in self.drained], [[0, 1], [2, 3], [4]])
+        self.assertEqual(self.drained[0][0]['time'], datetime(2020, 1, 1, tzinfo=UTC))
+        self.assertEqual(len(self.spool), 0)
+        self.assertEqual(self.drain(), 0)
+
+    def test_failed_drain_keeps_records(self):
+        for i in range(5):
+            self.spool.append({'sequence': i})
+        callback = MagicMock(side_effect=[None, ValueError])
+
+        with self.assertRaises(ValueError):
+            self.spool.drain(callback, batch_size=2)
+
+        self.assertEqual(len(self.spool), 3)
+        self.drain()
+        self.assertEqual([r['sequence'] for r in self.drained[0]], [2, 3, 4])
+
+    def test_files_of_other_processes(self):
+        other_file = os.path.join(self.path, '1.spool')
+        with open(other_file, 'w', encoding='utf-8') as spool_file:
+            spool_file.write('{"sequence": 0}\n')
+
+        self.assertEqual(self.drain(), 0)
+
+        os.utime(other_file, (0, 0))
+        self.assertEqual(self.drain(), 1)
+
+    def test_claimed_files(self):
+        other_file = os.path.join(self.path, '1.spool')
+        with open(other_file, 'w', encoding='utf-8') as spool_file:
+            spool_file.write('{"sequence": 0}\n')
+        os.utime(other_file, (0, 0))
+        drained_by_other_process = []
+
+        def callback(records):
+            """Drain the spool from another process while the claimed file is being drained"""
+            with patch('eventtracking.spool.os.getpid', return_value=2):
+                drained_by_other_process.append(self.spool.drain(MagicMock()))
+            self.drained.append(records)
+
+        self.assertEqual(self.spool.drain(callback), 1)
+        self.assertEqual(drained_by_other_process, [0])
+
+    def test_files_of_drains_that_did_not_complete(self):
+        for pid in (1, os.getpid()):
+            with open(os.path.join(self.path, f'{pid}.claimed.draining'), 'w', encoding='utf-8') as spool_file:
+                spool_file.write(f'{{"pid": {pid}}}\n')
+            os.utime(os.path.join(self.path, f'{pid}.claimed.draining'), (0, 0))
+
+        self.assertEqual(self.drain(), 1)
+        self.assertEqual(self.drained, [[{'pid': 1}]])
+
+    @patch('eventtracking.spool.os.rename', side_effect=FileNotFoundError)
+    def test_concurrently_claimed_file(self, _mock_rename):
+        self.spool.append({'sequence': 0})
+        self.assertEqual(self.drain(), 0)
+
+    def test_concurrently_reclaimed_file(self):
+        def reclaim(path):
+            """Simulate another drain claiming the file while it was being drained"""
+            os.remove(path)
+            raise FileNotFoundError
+
+        self.spool.append({'sequence': 0})
+        with patch('eventtracking.spool.os.unlink', side_effect=reclaim):
+            self.assertEqual(self.drain(), 1)
+
+
+class TestSpoolDrainer(TestCase):
+    """
+    Test `SpoolDrainer`.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.spool = MagicMock()
+        # An error, then one drained task, then an empty spool however many times a drain is started
+        self.spool.drain.side_effect = chain([ValueError, 1], repeat(0))
+        self.drainer = SpoolDrainer(self.spool, MagicMock(), interval=0)
+
+    def test_drains_until_empty(self):
+        self.drainer.notify()
+        thread = self.drainer.thread
+        self.drainer.notify()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.drainer.thread)
+        self.assertGreaterEqual(self.spool.drain.call_count, 2)
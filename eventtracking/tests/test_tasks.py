@@ -1,12 +1,20 @@
 """
 Tests for celery tasks.
 """
-from unittest.mock import sentinel
+from datetime import datetime
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch, sentinel
 
+from celery.exceptions import Retry
 from django.test import TestCase
 from django.test.utils import override_settings
+from pytz import UTC
 
-from eventtracking.tasks import send_event
+from eventtracking.backends.async_routing import AsyncRoutingBackend
+from eventtracking.blob_store import FileSystemBlobStore
+from eventtracking.processors.exceptions import BackendDeliveryError
+from eventtracking.tasks import COUNTDOWN, MAX_RETRIES, send_event
 from eventtracking.tracker import get_tracker
 from eventtracking.django.django_tracker import override_default_tracker
 
@@ -58,3 +66,143 @@ class TestAsyncSend(TestCase):
         send_event.apply(['backend_1', processed_event])
 
         tracker.backends['backend_1'].backends['nested_backend_1'].send.assert_called_once_with(self.event)
+
+
+class TestAsyncSendRetries(TestCase):
+    """
+    Test the retries and dead lettering of `send_event` task.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.event = {'name': str(sentinel.name)}
+        self.store = MagicMock()
+        self.backend = AsyncRoutingBackend(backend_name='async', dead_letter_store=self.store)
+        self.backend.send_to_backends = MagicMock(side_effect=ValueError)
+        self.backends = {'async': self.backend}
+        patcher = patch('eventtracking.tasks.get_tracker')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value.backends = self.backends
+
+    def test_exhausted_retries_are_dead_lettered(self):
+        result = send_event.apply(['async', self.event], retries=MAX_RETRIES)
+
+        self.assertTrue(result.successful())
+        self.store.add.assert_called_once()
+        backend_name, event, exc = self.store.add.call_args.args
+        self.assertEqual((backend_name, event), ('async', self.event))
+        self.assertIsInstance(exc, ValueError)
+
+    def test_failing_nested_backend_is_dead_lettered(self):
+        sink = MagicMock()
+        sink.send.side_effect = ConnectionError
+        backend = AsyncRoutingBackend(backend_name='async', backends={'sink': sink}, dead_letter_store=self.store)
+        self.backends['async'] = backend
+
+        with self.assertLogs('eventtracking', level='ERROR'):
+            result = send_event.apply(['async', self.event], retries=MAX_RETRIES)
+
+        self.assertTrue(result.successful())
+        sink.send.assert_called_once()
+        self.assertIsInstance(self.store.add.call_args.args[2], BackendDeliveryError)
+        self.assertEqual(self.store.add.call_args.args[2].backends, ['sink'])
+
+    @patch('eventtracking.tasks.send_event.retry', side_effect=Retry)
+    def test_failing_nested_backend_is_retried(self, mock_retry):
+        sink = MagicMock()
+        sink.send.side_effect = ConnectionError
+        self.backends['async'] = AsyncRoutingBackend(backend_name='async', backends={'sink': sink})
+
+        with self.assertLogs('eventtracking', level='ERROR'):
+            send_event.apply(['async', self.event])
+
+        mock_retry.assert_called_once()
+
+    @patch('eventtracking.tasks.send_event.retry', side_effect=Retry)
+    def test_retry_with_backoff(self, mock_retry):
+        send_event.apply(['async', self.event], retries=2)
+
+        self.store.add.assert_not_called()
+        self.assertEqual(mock_retry.call_args.kwargs['countdown'], COUNTDOWN * 4)
+
+    def test_no_dead_letter_store(self):
+        self.backend.dead_letter_store = None
+
+        result = send_event.apply(['async', self.event], retries=MAX_RETRIES)
+
+        self.assertTrue(result.failed())
+
+    def test_dead_letter_store_failure(self):
+        self.store.add.side_effect = OSError
+
+        result = send_event.apply(['async', self.event], retries=MAX_RETRIES)
+
+        self.assertTrue(result.failed())
+
+    def test_claim_check_is_loaded_and_released(self):
+        self.backend.send_to_backends = MagicMock()
+        self.backend.blob_store = MagicMock()
+        self.backend.blob_store.get.return_value = b'{"name": "big", "data": {"foo": "bar"}}'
+
+        send_event.apply(['async', {'name': 'big'}], {'claim_check': 'key'})
+
+        self.backend.blob_store.get.assert_called_once_with('key')
+        self.backend.send_to_backends.assert_called_once_with(
+            {'name': 'big', 'data': {'foo': 'bar'}}, raise_errors=True
+        )
+        self.backend.blob_store.delete.assert_called_once_with('key')
+
+    def test_claim_check_is_released_when_dead_lettered(self):
+        self.backend.blob_store = MagicMock()
+        self.backend.blob_store.get.return_value = b'{"name": "big"}'
+
+        send_event.apply(['async', {'name': 'big'}], {'claim_check': 'key'}, retries=MAX_RETRIES)
+
+        self.store.add.assert_called_once()
+        self.assertEqual(self.store.add.call_args.args[1], {'name': 'big'})
+        self.backend.blob_store.delete.assert_called_once_with('key')
+
+    def test_claim_check_is_released_when_dead_lettering_fails(self):
+        self.store.add.side_effect = OSError
+        self.backend.blob_store = MagicMock()
+        self.backend.blob_store.get.return_value = b'{"name": "big"}'
+
+        result = send_event.apply(['async', {'name': 'big'}], {'claim_check': 'key'}, retries=MAX_RETRIES)
+
+        self.assertTrue(result.failed())
+        self.backend.blob_store.delete.assert_called_once_with('key')
+
+    @patch('eventtracking.tasks.send_event.retry', side_effect=Retry)
+    def test_claim_check_is_kept_for_retries(self, _mock_retry):
+        self.backend.blob_store = MagicMock()
+        self.backend.blob_store.get.return_value = b'{"name": "big"}'
+
+        send_event.apply(['async', {'name': 'big'}], {'claim_check': 'key'})
+
+        self.backend.blob_store.delete.assert_not_called()
+
+    def test_claim_checked_event_keeps_its_datetimes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sink = MagicMock()
+        backend = self.backends['async'] = AsyncRoutingBackend(
+            backend_name='async', backends={'sink': sink}, blob_store=FileSystemBlobStore(directory),
+            claim_check_threshold=0,
+        )
+        event = {'name': 'big', 'time': datetime(2020, 1, 1, tzinfo=UTC)}
+
+        with patch('eventtracking.backends.async_routing.send_event') as mock_send_event:
+            backend.send(event)
+        send_event.apply(*mock_send_event.delay.call_args)
+
+        self.assertEqual(sink.send.call_args.args[0], event)
+
+    def test_claim_check_release_failure(self):
+        self.backend.send_to_backends = MagicMock()
+        self.backend.blob_store = MagicMock()
+        self.backend.blob_store.get.return_value = b'{"name": "big"}'
+        self.backend.blob_store.delete.side_effect = OSError
+
+        result = send_event.apply(['async', {'name': 'big'}], {'claim_check': 'key'})
+
+        self.assertTrue(result.successful())
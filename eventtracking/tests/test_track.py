@@ -4,10 +4,12 @@ Test the event tracking module
 
 
 from datetime import datetime
+import threading
 from unittest import TestCase
 
 
 from eventtracking import tracker
+from eventtracking.processors.exceptions import EventEmissionExit
 from unittest.mock import MagicMock, call, patch, sentinel  # pylint: disable=wrong-import-order
 from pytz import UTC  # pylint: disable=wrong-import-order
 
@@ -165,3 +167,48 @@ class TestTrack(TestCase):
         self.tracker.emit(sentinel.name)
 
         self.assert_backend_called_with(sentinel.name)
+
+    def test_buffered_events_are_sent_as_a_batch(self):
+        data = {'foo': 'bar'}
+        with self.tracker.context('request', {'user_id': 10}):
+            with self.tracker.buffered():
+                self.tracker.emit('first', data)
+                data['foo'] = 'changed'
+                self.tracker.emit('second')
+                self._mock_backend.send.assert_not_called()
+                self._mock_backend.send_batch.assert_not_called()
+
+        batch = self._mock_backend.send_batch.call_args.args[0]
+        self.assertEqual([event['name'] for event in batch], ['first', 'second'])
+        self.assertEqual(batch[0]['data'], {'foo': 'bar'})
+        self.assertEqual(batch[1]['context'], {'user_id': 10})
+
+    def test_buffered_events_are_processed(self):
+        def abort_first(event):
+            if event['name'] == 'first':
+                raise EventEmissionExit
+        self.tracker.routing_backend.register_processor(abort_first)
+
+        with self.tracker.buffered():
+            self.tracker.emit('first')
+            self.tracker.emit('second')
+
+        batch = self._mock_backend.send_batch.call_args.args[0]
+        self.assertEqual([event['name'] for event in batch], ['second'])
+
+    def test_buffering_is_per_thread(self):
+        self.assertTrue(self.tracker.start_buffering())
+        self.assertFalse(self.tracker.start_buffering())
+        thread = threading.Thread(target=self.tracker.emit, args=('other_thread',))
+        thread.start()
+        thread.join()
+        self.tracker.emit('buffered')
+
+        self.assertEqual(self._mock_backend.send.call_args.args[0]['name'], 'other_thread')
+        self.assertEqual([event['name'] for event in self.tracker.stop_buffering()], ['buffered'])
+        self.assertEqual(self.tracker.stop_buffering(), [])
+
+    def test_empty_batch_is_not_sent(self):
+        with self.tracker.buffered():
+            pass
+        self._mock_backend.send_batch.assert_not_called()
@@ -17,13 +17,16 @@ Best Practices:
 
 
 from contextlib import contextmanager
+from copy import deepcopy
 from datetime import datetime
 import logging
+import threading
 
 from pytz import UTC
 
 from eventtracking.locator import DefaultContextLocator
 from eventtracking.backends.routing import RoutingBackend
+from eventtracking.lazy import wrap_lazy_values
 
 UNKNOWN_EVENT_TYPE = 'unknown'
 DEFAULT_TRACKER_NAME = 'default'
@@ -35,10 +38,16 @@ class Tracker:
     """
     Track application events.  Holds references to a set of backends that will
     be used to persist any events that are emitted.
+
+    The events emitted from a thread can be buffered and sent as a single batch,
+    see `buffered`.
     """
     def __init__(self, backends=None, context_locator=None, processors=None):
         self.routing_backend = RoutingBackend(backends=backends, processors=processors)
         self.context_locator = context_locator or DefaultContextLocator()
+        # Created when buffering is first started, like the context of `ThreadLocalContextLocator`
+        self.buffers = None
+        self.buffers_lock = threading.Lock()
 
     @property
     def located_context(self):
@@ -61,6 +70,10 @@ class Tracker:
         """The dictionary of registered backends"""
         return self.routing_backend.backends
 
+    def backends_of_type(self, backend_class):
+        """The (name, backend) pairs of the registered backends that are instances of `backend_class`"""
+        return self.routing_backend.backends_of_type(backend_class)
+
     def emit(self, name=None, data=None):
         """
         Emit an event annotated with the UTC time when this function was called.
@@ -78,8 +91,63 @@ class Tracker:
             'context': self.resolve_context()
         }
 
+        buffers = self.buffers
+        if buffers is not None:
+            events = getattr(buffers, 'events', None)
+            if events is not None:
+                # The caller may modify the data after the event is emitted
+                events.append(deepcopy(event))
+                return
+
         self.routing_backend.send(event)
 
+    def start_buffering(self):
+        """
+        Buffer the events emitted from the current thread instead of sending them, until `stop_buffering` is called.
+
+        Returns False if the events of the thread were already buffered.
+        """
+        if self.buffers is None:
+            with self.buffers_lock:
+                if self.buffers is None:
+                    self.buffers = threading.local()
+        if getattr(self.buffers, 'events', None) is not None:
+            return False
+        self.buffers.events = []
+        return True
+
+    def stop_buffering(self):
+        """Stop buffering the events emitted from the current thread and return the buffered events"""
+        events = getattr(self.buffers, 'events', None)
+        if events is None:
+            return []
+        self.buffers.events = None
+        return events
+
+    def send_batch(self, events):
+        """
+        Process and send a batch of events returned by `stop_buffering`.
+
+        The backends with a `send_batch` method receive the whole batch at once, see `RoutingBackend.send_batch`.
+        """
+        if not events:
+            return
+        routing_backend = self.routing_backend
+        routing_backend.send_batch_to_backends(routing_backend.process_batch(events))
+
+    @contextmanager
+    def buffered(self):
+        """
+        Execute the block buffering the events emitted from the current thread, and send them as a batch once
+        the block exits. Nested blocks send their events with the outermost block.
+        """
+        started = self.start_buffering()
+        try:
+            yield
+        finally:
+            if started:
+                self.send_batch(self.stop_buffering())
+
     def resolve_context(self):
         """
         Create a new dictionary that corresponds to the union of all of the
@@ -95,8 +163,12 @@ class Tracker:
         Enter a named context.  Any events emitted after calling this
         method will contain all of the key-value pairs included in `ctx`
         unless overridden by a context that is entered after this call.
+
+        Values of `ctx` that are callable are computed lazily: they are
+        called without arguments, at most once, when an event that passed the
+        processors is sent to a backend (see `eventtracking.lazy`).
         """
-        self.located_context[name] = ctx
+        self.located_context[name] = wrap_lazy_values(ctx)
 
     def exit_context(self, name):
         """